@@ -0,0 +1,64 @@
+"""Run the async scraper against the local stand-in server.
+
+    python -m benchmarks.async_scraper --queries 40 --latency 0.2 --failure-rate 0.1
+
+Fans a batch of queries out through AsyncKaraokeNerdsScraper.search_many,
+checks every answer against the synchronous scraper, and reports wall time,
+peak server-side concurrency and the request rate the limiter allowed.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from karaoke_triage.async_scraper import AsyncKaraokeNerdsScraper
+from karaoke_triage.karaokenerds import KaraokeNerdsScraper
+
+from .stub_server import StubKaraokeNerds
+from .synth import make_queries
+
+
+async def run(stub: StubKaraokeNerds, queries, args) -> list:
+    async with AsyncKaraokeNerdsScraper(
+        search_url=stub.search_url,
+        use_cache=False,
+        use_catalog=False,
+        max_connections=args.connections,
+        rate=args.rate,
+        burst=args.burst,
+        backoff_base=0.05,
+    ) as scraper:
+        return await scraper.search_many(queries)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=20.0)
+    parser.add_argument("--burst", type=int, default=4)
+    args = parser.parse_args(argv[1:])
+
+    queries = ["small", "medium", "nothing"] + make_queries(5000, args.queries)
+    with StubKaraokeNerds(latency=args.latency, failure_rate=args.failure_rate) as stub:
+        start = time.perf_counter()
+        results = asyncio.run(run(stub, queries, args))
+        elapsed = time.perf_counter() - start
+        requests_made = len(stub.requests)
+        peak = stub.max_active
+
+        stub.failure_rate = 0.0
+        stub.latency = 0.0
+        sync_scraper = KaraokeNerdsScraper(search_url=stub.search_url, use_cache=False, use_catalog=False)
+        mismatches = sum(1 for query, versions in zip(queries, results)
+                         if sync_scraper.search(query) != versions)
+
+    print(f"queries={len(queries)} requests={requests_made} wall={elapsed:.2f}s "
+          f"rate={requests_made / elapsed:.1f}/s peak_concurrency={peak} mismatches={mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
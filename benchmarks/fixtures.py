@@ -0,0 +1,146 @@
+"""Recorded-style karaokenerds search pages for parser checks and benchmarks.
+
+The saved pages in benchmarks/fixtures/ follow the markup of the live search
+page: site chrome around a results table of <tr class="group"> /
+<tr class="details d-none"> row pairs. Regenerate them with
+
+    python -m benchmarks.fixtures
+"""
+import random
+import sys
+from html import escape
+from pathlib import Path
+from typing import Dict, List
+
+from .synth import SOURCES, iter_songs
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+# name -> number of songs on the page
+FIXTURE_SIZES = {"empty": 0, "small": 3, "medium": 40}
+
+PAGE_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Search results - Karaoke Nerds</title>
+<link rel="stylesheet" href="/lib/bootstrap/dist/css/bootstrap.min.css">
+<link rel="stylesheet" href="/css/site.css">
+<style>
+  .group td { cursor: pointer; }
+  .details ul { margin: 0; }
+  .badge { font-weight: 400; }
+</style>
+<script src="/lib/jquery/dist/jquery.min.js"></script>
+<script>
+  window.dataLayer = window.dataLayer || [];
+  function gtag(){dataLayer.push(arguments);}
+  gtag('js', new Date()); gtag('config', 'UA-0000000-1');
+</script>
+</head>
+<body>
+<nav class="navbar navbar-expand-sm navbar-dark bg-dark">
+  <a class="navbar-brand" href="/">Karaoke Nerds</a>
+  <ul class="navbar-nav">
+    <li class="nav-item"><a class="nav-link" href="/Community">Community</a></li>
+    <li class="nav-item"><a class="nav-link" href="/Brands">Brands</a></li>
+    <li class="nav-item"><a class="nav-link" href="/Recent">Recent</a></li>
+    <li class="nav-item"><a class="nav-link" href="/Account/Login">Log in</a></li>
+  </ul>
+  <form class="form-inline" action="/Search"><input class="form-control" name="query" value="{query}"></form>
+</nav>
+<main role="main" class="container-fluid">
+<h2>Search results for &quot;{query}&quot;</h2>
+<p class="text-muted">{count} songs found</p>
+<table class="table table-sm table-hover">
+<thead><tr><th>Title</th><th>Artist</th><th>Versions</th></tr></thead>
+<tbody>
+"""
+
+PAGE_TAIL = """</tbody>
+</table>
+</main>
+<footer class="footer text-muted"><div class="container">&copy; Karaoke Nerds - <a href="/Privacy">Privacy</a></div></footer>
+<script src="/lib/bootstrap/dist/js/bootstrap.bundle.min.js"></script>
+<script src="/js/site.js"></script>
+</body>
+</html>
+"""
+
+EXTRA_PROVIDERS = ["Karaoke Version", "Party Tyme", "Sound Choice", "Pioneer"]
+
+
+def video_id(rng: random.Random) -> str:
+    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+    return "".join(rng.choice(alphabet) for _ in range(11))
+
+
+def render_track(rng: random.Random, provider: str) -> str:
+    """One <li class="track">, with or without a watchable YouTube link."""
+    roll = rng.random()
+    if roll < 0.6:
+        url = (f"https://www.youtube.com/watch?v={video_id(rng)}" if rng.random() < 0.8
+               else f"https://youtu.be/{video_id(rng)}")
+        watch = (f'<a href="{escape(url)}" target="_blank" rel="nofollow">'
+                 f'<span title="You can watch this version online"><i class="fab fa-youtube"></i></span></a>')
+    elif roll < 0.75:
+        watch = ('<a href="https://www.karaoke-version.com/custombackingtrack/" target="_blank">'
+                 '<span title="You can watch this version online"><i class="fas fa-film"></i></span></a>')
+    else:
+        watch = ""
+    return (
+        f'<li class="track list-group-item d-flex justify-content-between">\n'
+        f'  <span><a href="/Brand/{rng.randint(1, 500)}">{escape(provider)}</a> '
+        f'<span class="badge badge-secondary">{escape(provider)}</span></span>\n'
+        f'  <span class="track-links">{watch}</span>\n'
+        f'</li>\n'
+    )
+
+
+def render_song(rng: random.Random, title: str, artist: str) -> str:
+    providers = rng.sample(SOURCES + EXTRA_PROVIDERS, rng.randint(1, 6))
+    tracks = "".join(render_track(rng, provider) for provider in providers)
+    return (
+        f'<tr class="group" data-id="{rng.randint(1, 10 ** 6)}">\n'
+        f'  <td class="title">\n    {escape(title)}\n  </td>\n'
+        f'  <td class="artist"><a href="/Artist/{rng.randint(1, 10 ** 5)}">{escape(artist)}</a></td>\n'
+        f'  <td class="versions"><span class="badge badge-pill">{len(providers)}</span></td>\n'
+        f'</tr>\n'
+        f'<tr class="details d-none">\n'
+        f'  <td colspan="3"><ul class="list-group">\n{tracks}  </ul></td>\n'
+        f'</tr>\n'
+    )
+
+
+def render_search_page(count: int, seed: int = 0, query: str = "love") -> str:
+    """A results page for `count` songs drawn from the synthetic library."""
+    rng = random.Random(seed)
+    rows = []
+    for title, artist, _, _, _ in iter_songs(count, seed):
+        if rng.random() < 0.1:
+            artist = f"{artist} & {rng.choice(['Friends', 'The Band', 'Orchestra'])}"
+        rows.append(render_song(rng, title, artist))
+    head = PAGE_HEAD.replace("{query}", escape(query)).replace("{count}", str(count))
+    return head + "".join(rows) + PAGE_TAIL
+
+
+def load_fixtures() -> Dict[str, str]:
+    """All saved fixture pages by name (file stem)."""
+    return {path.stem: path.read_text() for path in sorted(FIXTURES_DIR.glob("*.html"))}
+
+
+def write_fixtures() -> List[Path]:
+    FIXTURES_DIR.mkdir(exist_ok=True)
+    paths = []
+    for name, count in FIXTURE_SIZES.items():
+        path = FIXTURES_DIR / f"{name}.html"
+        path.write_text(render_search_page(count, seed=count))
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    for path in write_fixtures():
+        print(path)
+    sys.exit(0)
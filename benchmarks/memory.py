@@ -0,0 +1,136 @@
+"""Compare the memory taken by the in-memory library and by cached results.
+
+    python -m benchmarks.memory --sizes 10000 100000 1000000
+
+For each size a synthetic library is loaded from CSV twice: into the index
+SongDatabase kept before SongColumns (row ids, a tuple per row and the
+lowercased search keys) and into a SongDatabase as it is now, which keeps
+the same ids and keys next to its columns. The trigram index is the same
+for both and is left out. tracemalloc measures what each keeps alive; the
+time to build it (timed in a separate, untraced build, since tracing slows
+every allocation several times over) and to turn 10,000 rows back into
+Song objects is shown alongside. The last line compares a page of cached
+KaraokeNerds results decoded from the old JSON list and from the packed
+form.
+"""
+import argparse
+import json
+import random
+from array import array
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import astuple, make_dataclass
+from datetime import datetime
+from pathlib import Path
+
+import karaoke_triage.database
+from karaoke_triage.cache import pack_versions, unpack_versions
+from karaoke_triage.database import SongDatabase
+from karaoke_triage.models import KaraokeVersion, Song
+from karaoke_triage.storage import CsvSongStore
+
+from .synth import SOURCES, make_artists, write_library
+
+MATERIALIZE = 10000
+
+# KaraokeVersion as it was before it had __slots__.
+DictVersion = make_dataclass('DictVersion', ['title', 'artist', 'provider', 'youtube_link'])
+
+
+def measure(build):
+    """(result, bytes kept alive, seconds) of calling build()."""
+    start = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        result = build()
+        kept, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, kept, elapsed
+
+
+def load_tuples(store):
+    """The index SongDatabase built before SongColumns: (ids, rows, keys)."""
+    ids = array('q')
+    rows = []
+    keys = []
+    for row_id, row in store.iter_rows():
+        ids.append(row_id)
+        rows.append(row)
+        keys.append(f"{row[0]} {row[1]}".lower())
+    return ids, rows, keys
+
+
+def load_database(path):
+    database = SongDatabase(path, backend="csv")
+    database.load()
+    return database
+
+
+def song_from_row(row) -> Song:
+    title, artist, file_path, date_downloaded, source = row
+    return Song(title, artist, file_path,
+                datetime.fromisoformat(date_downloaded) if date_downloaded else None, source)
+
+
+def time_materialize(get, size: int) -> float:
+    """Microseconds per Song built by get(position)."""
+    positions = random.Random(0).sample(range(size), min(size, MATERIALIZE))
+    start = time.perf_counter()
+    for position in positions:
+        get(position)
+    return (time.perf_counter() - start) / len(positions) * 1e6
+
+
+def bench_results(count: int = 500):
+    rng = random.Random(0)
+    artists = make_artists(rng, 20)
+    versions = [
+        KaraokeVersion(f"Song {i}", rng.choice(artists), rng.choice(SOURCES), f"https://youtube.com/watch?v={i:011d}")
+        for i in range(count)
+    ]
+    old_text = json.dumps([astuple(v) for v in versions])
+    new_text = pack_versions(versions)
+    _, old_bytes, _ = measure(lambda: [DictVersion(*fields) for fields in json.loads(old_text)])
+    _, new_bytes, _ = measure(lambda: unpack_versions(new_text))
+    return count, len(old_text), len(new_text), old_bytes, new_bytes
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    args = parser.parse_args(argv[1:])
+
+    # The trigram index is the same either way; keep it out of the numbers.
+    karaoke_triage.database.NGRAM_INDEX_MIN_ROWS = float('inf')
+    print(f"{'rows':>9} {'layout':>8} {'MB':>8} {'B/row':>7} {'load s':>7} {'song µs':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            path = write_library(Path(tmp) / f"songs-{size}.csv", size)
+            store = CsvSongStore(path)
+            tuples, tuples_bytes, tuples_s = measure(lambda: load_tuples(store))
+            rows = tuples[1]
+            tuples_us = time_materialize(lambda i: song_from_row(rows[i]), size)
+            del tuples, rows
+            database, columns_bytes, columns_s = measure(lambda: load_database(path))
+            columns_us = time_materialize(database._make_song, size)
+            del database
+            for layout, kept, load_s, song_us in (
+                ("tuples", tuples_bytes, tuples_s, tuples_us),
+                ("columns", columns_bytes, columns_s, columns_us),
+            ):
+                print(f"{size:>9} {layout:>8} {kept / 1e6:>8.1f} {kept / size:>7.0f} {load_s:>7.2f} {song_us:>8.2f}")
+            print(f"{size:>9} the database takes {columns_bytes / tuples_bytes:.0%} of the memory it did")
+
+    count, old_json, new_json, old_bytes, new_bytes = bench_results()
+    print(f"{count} cached results: JSON {old_json:,} -> {new_json:,} bytes, "
+          f"decoded {old_bytes:,} -> {new_bytes:,} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
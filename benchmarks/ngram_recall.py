@@ -0,0 +1,43 @@
+"""Check trigram candidate pruning against brute-force scoring.
+
+    python -m benchmarks.ngram_recall --size 500000 --queries 500
+"""
+import argparse
+import sys
+import time
+
+from karaoke_triage.config import FUZZY_MATCH_THRESHOLD, NGRAM_MAX_CANDIDATES, NGRAM_MAX_POSTINGS
+from karaoke_triage.ngram import TrigramIndex, measure_recall
+
+from .synth import iter_songs, make_queries
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--limit", type=int, default=NGRAM_MAX_CANDIDATES)
+    parser.add_argument("--max-postings", type=int, default=NGRAM_MAX_POSTINGS)
+    parser.add_argument("--threshold", type=float, default=FUZZY_MATCH_THRESHOLD)
+    parser.add_argument("--min-recall", type=float, default=0.95,
+                        help="exit non-zero if recall falls below this")
+    args = parser.parse_args(argv[1:])
+
+    keys = [f"{title} {artist}".lower() for title, artist, _, _, _ in iter_songs(args.size)]
+    queries = make_queries(args.size, args.queries)
+
+    start = time.perf_counter()
+    index = TrigramIndex.build(keys)
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    recall = measure_recall(index, keys, queries, args.limit, args.max_postings, args.threshold)
+    check_s = time.perf_counter() - start
+
+    print(f"rows={args.size} queries={len(queries)} limit={args.limit} max_postings={args.max_postings}")
+    print(f"build={build_s:.2f}s check={check_s:.2f}s recall={recall:.4f}")
+    return 0 if recall >= args.min_recall else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,57 @@
+"""Check every results parser against the saved fixtures and time them.
+
+    python -m benchmarks.parsers --sizes 100 400 --repeat 20
+
+Each engine must produce exactly the versions the reference `soup` parser
+produces for every page; the command exits non-zero otherwise. Pages listed
+in --sizes are generated on the fly in addition to the saved fixtures.
+"""
+import argparse
+import sys
+import time
+
+from karaoke_triage.parsers import PARSERS, SoupParser, available_parsers
+
+from .fixtures import load_fixtures, render_search_page
+
+
+def time_parse(parser, html: str, repeat: int) -> float:
+    """Best-of-`repeat` parse time in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parser.parse(html)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="*", default=[100, 400])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args(argv[1:])
+
+    pages = load_fixtures()
+    for size in args.sizes:
+        pages[f"generated-{size}"] = render_search_page(size, seed=size)
+
+    engines = {name: PARSERS[name]() for name in available_parsers()}
+    reference = SoupParser()
+    failures = 0
+
+    print(f"{'page':>16} {'KB':>7} {'versions':>8} " + " ".join(f"{name + ' ms':>12}" for name in engines))
+    for page, html in pages.items():
+        expected = reference.parse(html)
+        timings = []
+        for name, engine in engines.items():
+            if engine.parse(html) != expected:
+                print(f"MISMATCH: {name} on {page}")
+                failures += 1
+            timings.append(time_parse(engine, html, args.repeat))
+        print(f"{page:>16} {len(html) / 1024:>7.1f} {len(expected):>8} "
+              + " ".join(f"{ms:>12.2f}" for ms in timings))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,136 @@
+"""Measure how long the TUI takes to start.
+
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --size 100000 --output startup.json
+
+Each run starts a fresh interpreter that imports the TUI and runs it
+headless until the first frame has been drawn, then waits for the
+background warm-up (index load, parser, httpx, yt-dlp) to finish. The
+medians of these are reported:
+
+  import_s       importing karaoke_triage.tui
+  first_frame_s  from app start to the first frame
+  ready_s        from app start to the end of the warm-up
+  modules        modules loaded at the first frame
+
+With --profile-imports the slowest imports of one extra run (from
+python -X importtime) are listed on stderr.
+"""
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+from .synth import write_library
+
+REPO_DIR = Path(__file__).parent.parent
+
+STARTUP_SCRIPT = """
+import asyncio, json, sys, time
+from pathlib import Path
+library, scratch = Path(sys.argv[1]), Path(sys.argv[2])
+start = time.perf_counter()
+# Point every file the app opens at the scratch directory before the
+# modules that read these settings are imported.
+import karaoke_triage.config as config
+for name, value in list(vars(config).items()):
+    if name.endswith(("_PATH", "_DIR")) and isinstance(value, Path) and config.DATA_DIR in value.parents:
+        setattr(config, name, scratch / value.relative_to(config.DATA_DIR))
+config.DATA_DIR = scratch
+config.DATABASE_PATH = library
+config.DATABASE_BACKEND = "csv"
+import karaoke_triage.tui as tui
+import karaoke_triage.service as service
+imported = time.perf_counter()
+
+warmed = []
+warm_up = service.warm_up
+def timed_warm_up(*args):
+    elapsed = warm_up(*args)
+    warmed.append(time.perf_counter())
+    return elapsed
+service.warm_up = timed_warm_up
+
+async def main():
+    app = tui.KaraokeTriageApp()
+    async with app.run_test() as pilot:
+        first_frame = time.perf_counter()
+        modules = len(sys.modules)
+        while not warmed:
+            await asyncio.sleep(0.005)
+    print(json.dumps({
+        "import_s": imported - start,
+        "first_frame_s": first_frame - imported,
+        "ready_s": warmed[0] - imported,
+        "modules": modules,
+    }))
+
+asyncio.run(main())
+"""
+
+IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def run_once(library: Path, data_dir: Path, extra_args: List[str] = ()) -> subprocess.CompletedProcess:
+    # Everything the app writes goes to data_dir, never to the real
+    # library, log or download queue.
+    return subprocess.run(
+        [sys.executable, *extra_args, "-c", STARTUP_SCRIPT, str(library), str(data_dir)],
+        cwd=REPO_DIR, capture_output=True, text=True, check=True,
+    )
+
+
+def bench_startup(library: Path, data_dir: Path, runs: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(runs):
+        output = run_once(library, data_dir).stdout
+        samples.append(json.loads(output.splitlines()[-1]))
+    return {
+        f"startup.{key}": statistics.median(sample[key] for sample in samples)
+        for key in samples[0]
+    }
+
+
+def slowest_imports(library: Path, data_dir: Path, limit: int) -> List[str]:
+    """Top-level imports by cumulative time, from python -X importtime."""
+    stderr = run_once(library, data_dir, ["-X", "importtime"]).stderr
+    totals = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match and len(match.group(3)) <= 1:
+            totals.append((int(match.group(2)), match.group(4)))
+    totals.sort(reverse=True)
+    return [f"{micros / 1000:8.1f} ms  {name}" for micros, name in totals[:limit]]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup", description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=10000, help="songs in the synthetic library")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--profile-imports", type=int, metavar="N", default=0, help="list the N slowest imports")
+    parser.add_argument("--output", type=Path, help="write results JSON here (default: stdout)")
+    args = parser.parse_args(argv[1:])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        library = write_library(tmp / f"songs-{args.size}.csv", args.size)
+        results = bench_startup(library, tmp, args.runs)
+        if args.profile_imports:
+            for line in slowest_imports(library, tmp, args.profile_imports):
+                print(line, file=sys.stderr)
+
+    text = json.dumps({name: round(value, 6) for name, value in results.items()}, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,81 @@
+"""Compare the CSV and SQLite song library backends.
+
+    python -m benchmarks.storage --sizes 10000 100000 1000000
+
+For each size a synthetic library is written as songs.csv and migrated into
+songs.db, then both backends are timed on a cold load, a batch of noisy
+searches and a run of add_song calls.
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from karaoke_triage.database import SongDatabase
+from karaoke_triage.models import Song
+from karaoke_triage.storage import migrate_csv_to_sqlite
+
+from .synth import make_queries, write_library
+
+
+def bench_backend(backend: str, path: Path, queries, adds: int) -> dict:
+    start = time.perf_counter()
+    database = SongDatabase(path, backend=backend)
+    database._ensure_loaded()
+    load_s = time.perf_counter() - start
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        database.search(query)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(adds):
+        database.add_song(Song(
+            title=f"Benchmark Song {i}",
+            artist="Benchmark Artist",
+            file_path=f"/tmp/bench-{i}.mp4",
+            date_downloaded=datetime.now(),
+            source="bench",
+        ))
+    add_s = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "load_s": load_s,
+        "search_p50_ms": statistics.median(latencies) * 1000,
+        "search_p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "add_ms": add_s / adds * 1000 if adds else 0.0,
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--adds", type=int, default=50)
+    args = parser.parse_args(argv[1:])
+
+    print(f"{'rows':>9} {'backend':>8} {'load s':>8} {'p50 ms':>8} {'p95 ms':>8} {'add ms':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            csv_path = write_library(Path(tmp) / f"songs-{size}.csv", size)
+            db_path = Path(tmp) / f"songs-{size}.db"
+            start = time.perf_counter()
+            migrate_csv_to_sqlite(csv_path, db_path)
+            migrate_s = time.perf_counter() - start
+            queries = make_queries(size, args.queries)
+            for backend, path in (("csv", csv_path), ("sqlite", db_path)):
+                result = bench_backend(backend, path, queries, args.adds)
+                print(f"{size:>9} {backend:>8} {result['load_s']:>8.2f} {result['search_p50_ms']:>8.2f} "
+                      f"{result['search_p95_ms']:>8.2f} {result['add_ms']:>8.2f}")
+            print(f"{size:>9} migration took {migrate_s:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,138 @@
+"""Local stand-in for karaokenerds.com that serves fixture pages.
+
+    python -m benchmarks.stub_server --port 8765 --latency 0.2
+
+GET /Search?query=<name> serves benchmarks/fixtures/<name>.html when such a
+fixture exists, an empty results page for "nothing", and otherwise a
+generated page whose size and content are derived from the query. Every page
+carries an ETag, and If-None-Match gets a 304. Latency and a failure rate can
+be injected to exercise timeouts and retries.
+"""
+import argparse
+import hashlib
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+from .fixtures import load_fixtures, render_search_page
+
+
+class StubKaraokeNerds:
+    """Threaded HTTP server on localhost; use as a context manager."""
+
+    def __init__(self, port: int = 0, latency: float = 0.0, failure_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.fixtures = load_fixtures()
+        self.requests: List[str] = []
+        self.active = 0
+        self.max_active = 0
+        self._generated: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    @property
+    def search_url(self) -> str:
+        return f"{self.url}/Search"
+
+    def page_for(self, query: str) -> str:
+        key = " ".join(query.lower().split())
+        if key in self.fixtures:
+            return self.fixtures[key]
+        if key == "nothing":
+            return self.fixtures["empty"]
+        with self._lock:
+            if key not in self._generated:
+                digest = int(hashlib.sha1(key.encode()).hexdigest(), 16)
+                self._generated[key] = render_search_page(digest % 60, seed=digest % 10 ** 6, query=query)
+            return self._generated[key]
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests.append(self.path)
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                    fail = stub._rng.random() < stub.failure_rate
+                try:
+                    if stub.latency:
+                        time.sleep(stub.latency)
+                    url = urlsplit(self.path)
+                    if url.path != "/Search":
+                        self.send_error(404)
+                        return
+                    if fail:
+                        self.send_error(503)
+                        return
+                    query = parse_qs(url.query).get("query", [""])[0]
+                    body = stub.page_for(query).encode()
+                    etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+                    if self.headers.get("If-None-Match") == etag:
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.end_headers()
+                        return
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client cancelled the request
+                finally:
+                    with stub._lock:
+                        stub.active -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "StubKaraokeNerds":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubKaraokeNerds":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args(argv[1:])
+    stub = StubKaraokeNerds(args.port, args.latency, args.failure_rate)
+    print(f"Serving fixture pages at {stub.search_url}?query=... (Ctrl+C to stop)")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
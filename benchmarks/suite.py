@@ -0,0 +1,203 @@
+"""Run the core benchmarks and write machine-readable results.
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --compare baseline.json --tolerance 0.25
+
+Needs no network. Measures, on synthetic libraries and the saved fixture
+pages:
+
+  search      cold load time and search / search_many latency percentiles
+  parse       best-of-N parse time per fixture page and parser engine
+  log         activity log rows written per second, and the time a
+              log_activity call takes
+  cold_start  import time of the TUI and time to the first local answer,
+              each in a fresh interpreter
+  startup     time to the TUI's first frame and to the end of its
+              background warm-up (see benchmarks.startup)
+
+Results are a flat map of metric name to number, plus enough metadata (git
+revision, Python, platform) to tell runs apart. With --compare, metrics that
+got worse than the baseline by more than --tolerance are listed and the
+command exits non-zero. Metrics ending in _per_s are higher-is-better, all
+others are durations.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+from karaoke_triage.database import SongDatabase
+from karaoke_triage.logger import ActivityLogger
+from karaoke_triage.models import Song, SongStatus
+from karaoke_triage.parsers import PARSERS, available_parsers
+
+from .fixtures import load_fixtures
+from .parsers import time_parse
+from .startup import bench_startup
+from .synth import make_queries, write_library
+
+RESULTS_FORMAT_VERSION = 1
+REPO_DIR = Path(__file__).parent.parent
+
+COLD_START_SCRIPT = """
+import json, sys, time
+from pathlib import Path
+start = time.perf_counter()
+import karaoke_triage.tui
+imported = time.perf_counter()
+from karaoke_triage.database import SongDatabase
+SongDatabase(Path(sys.argv[1])).search(sys.argv[2])
+answered = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "first_search_s": answered - imported}))
+"""
+
+
+def percentiles(samples: List[float], prefix: str) -> Dict[str, float]:
+    """p50/p95/p99 of `samples` (seconds) as milliseconds."""
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        f"{prefix}.p50_ms": cuts[49] * 1000,
+        f"{prefix}.p95_ms": cuts[94] * 1000,
+        f"{prefix}.p99_ms": cuts[98] * 1000,
+    }
+
+
+def bench_search(path: Path, size: int, queries: List[str]) -> Dict[str, float]:
+    start = time.perf_counter()
+    database = SongDatabase(path)
+    database._ensure_loaded()
+    results = {f"search.{size}.load_s": time.perf_counter() - start}
+
+    for name, run in (("search", database.search), ("search_many", database.search_many)):
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            run(query)
+            latencies.append(time.perf_counter() - start)
+        results.update(percentiles(latencies, f"{name}.{size}"))
+    return results
+
+
+def bench_parse(repeat: int) -> Dict[str, float]:
+    results = {}
+    pages = load_fixtures()
+    for name in available_parsers():
+        engine = PARSERS[name]()
+        for page, html in pages.items():
+            results[f"parse.{page}.{name}_ms"] = time_parse(engine, html, repeat)
+    return results
+
+
+def bench_log(path: Path, events: int) -> Dict[str, float]:
+    logger = ActivityLogger(path)
+    song = Song(title="Benchmark Song", artist="Benchmark Artist")
+    start = time.perf_counter()
+    for _ in range(events):
+        logger.log_activity(song, SongStatus.UNAVAILABLE, "bench")
+    # Time spent in log_activity itself, i.e. what a request waits for.
+    call_s = time.perf_counter() - start
+    logger.close()
+    elapsed = time.perf_counter() - start
+    return {
+        "log.append_per_s": events / elapsed,
+        "log.call_us": call_s / events * 1e6,
+    }
+
+
+def bench_cold_start(path: Path, query: str, runs: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", COLD_START_SCRIPT, str(path), query],
+            cwd=REPO_DIR, capture_output=True, text=True, check=True,
+        ).stdout
+        samples.append(json.loads(output.splitlines()[-1]))
+    return {
+        f"cold_start.{key}": statistics.median(sample[key] for sample in samples)
+        for key in samples[0]
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=REPO_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(metrics: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    """Descriptions of the metrics that regressed by more than `tolerance`."""
+    regressions = []
+    for name, value in sorted(metrics.items()):
+        old = baseline.get(name)
+        if not old:
+            continue
+        change = value / old - 1
+        worse = -change if name.endswith("_per_s") else change
+        if worse > tolerance:
+            regressions.append(f"{name}: {old:.4g} -> {value:.4g} ({change:+.0%})")
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=10, help="parse runs per page; the best is kept")
+    parser.add_argument("--log-events", type=int, default=5000)
+    parser.add_argument("--cold-runs", type=int, default=3)
+    parser.add_argument("--output", type=Path, help="write results JSON here (default: stdout)")
+    parser.add_argument("--compare", type=Path, help="results JSON of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown")
+    args = parser.parse_args(argv[1:])
+
+    metrics: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for size in args.sizes:
+            path = write_library(tmp / f"songs-{size}.csv", size)
+            queries = make_queries(size, args.queries)
+            metrics.update(bench_search(path, size, queries))
+            print(f"search {size} done", file=sys.stderr)
+        metrics.update(bench_parse(args.repeat))
+        metrics.update(bench_log(tmp / "activity.log", args.log_events))
+        largest = max(args.sizes)
+        metrics.update(bench_cold_start(tmp / f"songs-{largest}.csv", make_queries(largest, 1)[0], args.cold_runs))
+        metrics.update(bench_startup(tmp / f"songs-{largest}.csv", tmp, args.cold_runs))
+
+    results = {
+        "version": RESULTS_FORMAT_VERSION,
+        "revision": git_revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "metrics": {name: round(value, 6) for name, value in metrics.items()},
+    }
+    text = json.dumps(results, indent=2, sort_keys=False)
+    if args.output:
+        args.output.write_text(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        regressions = compare(results["metrics"], baseline.get("metrics", {}), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
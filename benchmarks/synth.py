@@ -0,0 +1,170 @@
+"""Synthetic song libraries and request queries for benchmarks.
+
+Artists are drawn with a Zipf-like popularity curve (a few artists own many
+tracks, most own one or two). Titles mix a small set of very common lyric words
+with a long tail of generated words, so search keys share trigrams the way a
+real catalog does.
+
+    python -m benchmarks.synth songs.csv --size 100000 --seed 0
+"""
+import argparse
+import csv
+import random
+import sys
+from itertools import accumulate
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+TITLE_WORDS = [
+    "love", "heart", "night", "baby", "time", "girl", "dance", "home", "fire", "dream",
+    "rain", "blue", "world", "light", "sweet", "crazy", "forever", "tonight", "summer", "money",
+    "wild", "river", "road", "star", "angel", "kiss", "soul", "rock", "roll", "paradise",
+    "lonely", "city", "gold", "midnight", "shadow", "eyes", "fever", "golden", "rhythm", "thunder",
+    "down", "up", "away", "back", "again", "never", "always", "young", "free", "alone",
+]
+TITLE_CONNECTORS = ["the", "my", "your", "in", "of", "on", "me", "you", "a", "to"]
+ARTIST_FIRST = [
+    "John", "Mary", "Elvis", "Taylor", "Billy", "Whitney", "Stevie", "Dolly", "Frank", "Aretha",
+    "Bruce", "Kelly", "Johnny", "Patsy", "Freddie", "Lady", "Bonnie", "Garth", "Shania", "Tina",
+]
+ARTIST_LAST = [
+    "Smith", "Jones", "Presley", "Swift", "Joel", "Houston", "Wonder", "Parton", "Sinatra", "Franklin",
+    "Springsteen", "Clarkson", "Cash", "Cline", "Mercury", "Gaga", "Tyler", "Brooks", "Twain", "Turner",
+]
+BAND_WORDS = [
+    "Stones", "Kings", "Wolves", "Brothers", "Sisters", "Band", "Experience", "Machine", "Project", "Crew",
+    "Black", "Red", "Electric", "Midnight", "Velvet", "Silver", "Arctic", "Neon", "Crystal", "Iron",
+]
+SYLLABLES = [
+    "ba", "ca", "da", "fe", "go", "ha", "ji", "ka", "lo", "ma", "ne", "no", "pa", "qui", "ra",
+    "se", "ta", "ve", "wo", "ya", "zo", "bri", "cla", "dre", "fla", "gra", "tri", "ster", "lin", "mon",
+]
+SOURCES = ["Sing King", "KaraFun", "Stingray Karaoke", "Zoom Karaoke", "Sunfly", "CC Karaoke"]
+
+
+def make_word(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def make_vocabulary(rng: random.Random, size: int) -> Tuple[List[str], List[float]]:
+    """Common lyric words first, then a long tail of generated words, with Zipf cumulative weights."""
+    words = list(TITLE_WORDS)
+    seen = set(words)
+    while len(words) < size:
+        word = make_word(rng)
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words, list(accumulate(1.0 / (rank + 1) for rank in range(len(words))))
+
+
+def make_artists(rng: random.Random, count: int) -> List[str]:
+    artists = set()
+    while len(artists) < count:
+        roll = rng.random()
+        if roll < 0.3:
+            name = f"{rng.choice(ARTIST_FIRST)} {rng.choice(ARTIST_LAST)}"
+        elif roll < 0.6:
+            name = f"{rng.choice(ARTIST_FIRST)} {make_word(rng).title()}"
+        else:
+            prefix = "The " if rng.random() < 0.4 else ""
+            words = [rng.choice(BAND_WORDS) if rng.random() < 0.5 else make_word(rng).title()
+                     for _ in range(rng.randint(1, 2))]
+            name = prefix + " ".join(words)
+        if name in artists:
+            # The name space is small; large libraries get numbered tribute acts.
+            name = f"{name} {rng.randint(2, 9999)}"
+        artists.add(name)
+    return sorted(artists)
+
+
+def make_title(rng: random.Random, vocabulary: List[str], cum_weights: List[float]) -> str:
+    words = []
+    for _ in range(rng.choices([1, 2, 3, 4, 5], weights=[10, 30, 30, 20, 10])[0]):
+        if words and rng.random() < 0.3:
+            words.append(rng.choice(TITLE_CONNECTORS))
+        words.append(rng.choices(vocabulary, cum_weights=cum_weights)[0])
+    return " ".join(words).title()
+
+
+def iter_songs(size: int, seed: int = 0) -> Iterator[Tuple[str, str, str, str, str]]:
+    """Yield `size` rows in songs.csv column order."""
+    rng = random.Random(seed)
+    vocabulary, word_weights = make_vocabulary(rng, max(len(TITLE_WORDS), min(size // 4, 20000)))
+    artists = make_artists(rng, max(10, size // 8))
+    rng.shuffle(artists)
+    cum_weights = list(accumulate(1.0 / (rank + 1) for rank in range(len(artists))))
+    start = datetime(2020, 1, 1)
+    for i in range(size):
+        artist = rng.choices(artists, cum_weights=cum_weights)[0]
+        title = make_title(rng, vocabulary, word_weights)
+        downloaded = start + timedelta(minutes=rng.randrange(60 * 24 * 365 * 4))
+        yield (
+            title,
+            artist,
+            f"/music/karaoke/{artist} - {title} [{i}].mp4",
+            downloaded.isoformat() if rng.random() < 0.9 else "",
+            rng.choice(SOURCES),
+        )
+
+
+def write_library(path: Path, size: int, seed: int = 0) -> Path:
+    """Write a synthetic songs.csv with `size` rows to `path`."""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["title", "artist", "file_path", "date_downloaded", "source"])
+        writer.writerows(iter_songs(size, seed))
+    return path
+
+
+def perturb(rng: random.Random, text: str) -> str:
+    """Mangle a query the way people type requests: typos, dropped words, reordering."""
+    words = text.split()
+    roll = rng.random()
+    if roll < 0.25 and len(words) > 1:
+        rng.shuffle(words)
+    elif roll < 0.45 and len(words) > 2:
+        words.pop(rng.randrange(len(words)))
+    text = " ".join(words)
+    chars = list(text)
+    for _ in range(rng.randint(0, 2)):
+        if not chars:
+            break
+        pos = rng.randrange(len(chars))
+        op = rng.random()
+        if op < 0.4:
+            chars[pos] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+        elif op < 0.7:
+            del chars[pos]
+        else:
+            chars.insert(pos, rng.choice("abcdefghijklmnopqrstuvwxyz"))
+    return "".join(chars)
+
+
+def make_queries(size: int, count: int, seed: int = 1, library_seed: int = 0) -> List[str]:
+    """Build `count` noisy request strings for rows of a library generated with `library_seed`."""
+    rng = random.Random(seed)
+    picks = set(rng.sample(range(size), min(count, size)))
+    queries = []
+    for i, (title, artist, _, _, _) in enumerate(iter_songs(size, library_seed)):
+        if i in picks:
+            base = f"{title} {artist}" if rng.random() < 0.7 else f"{artist} - {title}"
+            queries.append(perturb(rng, base))
+    rng.shuffle(queries)
+    return queries
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", type=Path, help="songs.csv to write")
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv[1:])
+    write_library(args.path, args.size, args.seed)
+    print(f"Wrote {args.size} songs to {args.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,174 @@
+"""Which YouTube videos have already been downloaded, and where to.
+
+karaokenerds links the same video in several forms (youtu.be/ID,
+watch?v=ID&t=1, /embed/ID ...), so downloads are keyed by the canonical
+11-character video ID instead of the URL. The index maps each ID to the
+file yt-dlp actually wrote, its size and optionally a SHA-256, and is kept
+as JSON in ARTIFACT_INDEX_PATH.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from .config import ARTIFACT_CHECKSUMS, ARTIFACT_INDEX_PATH
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+
+VIDEO_ID = re.compile(r'[A-Za-z0-9_-]{11}')
+YOUTUBE_HOSTS = {'youtube.com', 'm.youtube.com', 'music.youtube.com', 'youtube-nocookie.com'}
+# Path prefixes followed by the video ID, e.g. youtube.com/embed/ID
+ID_PATH_PREFIXES = ('embed', 'shorts', 'live', 'v', 'e')
+
+
+def video_id(url: Optional[str]) -> Optional[str]:
+    """The YouTube video ID in `url`, or None when it is not a video link."""
+    if not url:
+        return None
+    url = url.strip()
+    if VIDEO_ID.fullmatch(url):
+        return url
+    parts = urlsplit(url if '//' in url else '//' + url)
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    segments = [segment for segment in parts.path.split('/') if segment]
+    candidate = None
+    if host == 'youtu.be':
+        candidate = segments[0] if segments else None
+    elif host in YOUTUBE_HOSTS:
+        if segments[:1] == ['watch']:
+            candidate = parse_qs(parts.query).get('v', [None])[0]
+        elif len(segments) >= 2 and segments[0] in ID_PATH_PREFIXES:
+            candidate = segments[1]
+    if candidate and VIDEO_ID.fullmatch(candidate):
+        return candidate
+    return None
+
+
+def canonical_url(url: str) -> str:
+    """https://www.youtube.com/watch?v=ID for YouTube links; other URLs unchanged."""
+    vid = video_id(url)
+    return f"https://www.youtube.com/watch?v={vid}" if vid else url
+
+
+def file_checksum(path: Path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass
+class Artifact:
+    """One downloaded video."""
+    video_id: str
+    path: str
+    size: int
+    sha256: Optional[str] = None
+    downloaded_at: float = 0.0
+
+    def is_present(self) -> bool:
+        """The file is still where it was written and has not changed size."""
+        try:
+            return Path(self.path).stat().st_size == self.size
+        except OSError:
+            return False
+
+
+class ArtifactIndex:
+    """Video ID -> Artifact, shared by the download workers.
+
+    `get` checks that the file is still on disk with the recorded size and
+    forgets entries whose file was moved or deleted, so a missing file is
+    downloaded again instead of being reported as present.
+    """
+
+    def __init__(self, path: Optional[Path] = ARTIFACT_INDEX_PATH, checksums: bool = ARTIFACT_CHECKSUMS):
+        self.path = path
+        self.checksums = checksums
+        self._artifacts: Dict[str, Artifact] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable artifact index %s: %s", self.path, e)
+            return
+        if data.get('version') != INDEX_FORMAT_VERSION:
+            return
+        for item in data.get('artifacts', []):
+            artifact = Artifact(**item)
+            self._artifacts[artifact.video_id] = artifact
+
+    def _save(self) -> None:
+        """Write the index; call with the lock held."""
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'version': INDEX_FORMAT_VERSION,
+                'artifacts': [asdict(artifact) for artifact in self._artifacts.values()],
+            }, f, indent=1)
+        tmp_path.replace(self.path)
+
+    def __len__(self) -> int:
+        return len(self._artifacts)
+
+    def get(self, vid: Optional[str]) -> Optional[Artifact]:
+        """The artifact for video ID `vid` if its file is still present."""
+        if vid is None:
+            return None
+        with self._lock:
+            artifact = self._artifacts.get(vid)
+            if artifact is None:
+                return None
+            if not artifact.is_present():
+                logger.info("Forgetting %s: %s is gone or changed", vid, artifact.path)
+                del self._artifacts[vid]
+                self._save()
+                return None
+            return artifact
+
+    def lookup(self, url: str) -> Optional[Artifact]:
+        return self.get(video_id(url))
+
+    def record(self, vid: str, path: Path) -> Artifact:
+        """Add or replace the entry for a file that was just downloaded."""
+        path = Path(path)
+        # Hash outside the lock: files are large and the index is shared.
+        checksum = file_checksum(path) if self.checksums else None
+        artifact = Artifact(
+            video_id=vid,
+            path=str(path.resolve()),
+            size=path.stat().st_size,
+            sha256=checksum,
+            downloaded_at=time.time(),
+        )
+        with self._lock:
+            self._artifacts[vid] = artifact
+            self._save()
+        return artifact
+
+    def forget(self, vid: str) -> bool:
+        with self._lock:
+            if self._artifacts.pop(vid, None) is None:
+                return False
+            self._save()
+        return True
@@ -0,0 +1,275 @@
+import asyncio
+import logging
+import random
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+from .cache import ScrapeCache, normalize_query
+from .catalog import CatalogMirror, open_catalog
+from .config import (
+    HTTP_BACKOFF_BASE,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_RETRIES,
+    HTTP_MAX_RETRY_AFTER,
+    HTTP_TIMEOUT,
+    KARAOKENERDS_SEARCH_URL,
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_PER_SECOND,
+    CATALOG_ENABLED,
+    SCRAPE_CACHE_ENABLED,
+    USER_AGENT,
+)
+from .metrics import metrics
+from .models import KaraokeVersion
+from .parsers import ResultsParser, get_parser
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Async token bucket: `rate` requests per second with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float = RATE_LIMIT_PER_SECOND, capacity: int = RATE_LIMIT_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        # Waiters queue on the lock, so tokens are handed out in arrival order.
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+class AsyncKaraokeNerdsScraper:
+    """asyncio counterpart of KaraokeNerdsScraper for concurrent lookups.
+
+    Requests share a bounded httpx connection pool and a token bucket per
+    host. Timeouts, connection errors, 429s and 5xx responses are retried with
+    jittered exponential backoff (honouring a Retry-After of up to
+    `max_retry_after` seconds; a longer one fails the fetch, so a stale
+    cached answer is used instead of making a query wait). The results cache,
+    catalog mirror and parser are the same ones the synchronous scraper uses.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[ScrapeCache] = None,
+        parser: Optional[ResultsParser] = None,
+        search_url: str = KARAOKENERDS_SEARCH_URL,
+        use_cache: bool = SCRAPE_CACHE_ENABLED,
+        catalog: Optional[CatalogMirror] = None,
+        use_catalog: bool = CATALOG_ENABLED,
+        max_connections: int = HTTP_MAX_CONNECTIONS,
+        timeout: float = HTTP_TIMEOUT,
+        max_retries: int = HTTP_MAX_RETRIES,
+        backoff_base: float = HTTP_BACKOFF_BASE,
+        max_retry_after: float = HTTP_MAX_RETRY_AFTER,
+        rate: float = RATE_LIMIT_PER_SECOND,
+        burst: int = RATE_LIMIT_BURST,
+    ):
+        self._parser = parser
+        if cache is None and use_cache:
+            cache = ScrapeCache()
+        self.cache = cache
+        if catalog is None and use_catalog:
+            catalog = open_catalog()
+        self.catalog = catalog
+        self.search_url = search_url
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_retry_after = max_retry_after
+        self.rate = rate
+        self.burst = burst
+        self._client: Optional['httpx.AsyncClient'] = None
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    @property
+    def parser(self) -> ResultsParser:
+        # Created on first use: the lxml parser imports lxml.
+        if self._parser is None:
+            self._parser = get_parser()
+        return self._parser
+
+    @property
+    def client(self) -> 'httpx.AsyncClient':
+        if self._client is None:
+            import httpx  # deferred to keep it out of the app's startup
+            self._client = httpx.AsyncClient(
+                headers={'User-Agent': USER_AGENT},
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                follow_redirects=True,
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __aenter__(self) -> 'AsyncKaraokeNerdsScraper':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    def _bucket(self, url: str) -> TokenBucket:
+        host = urlsplit(url).netloc
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _backoff(self, attempt: int, response: Optional['httpx.Response'] = None) -> Optional[float]:
+        """Seconds to wait before retrying, or None if the server asks for longer than we wait."""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                delay = float(retry_after)
+                return delay if delay <= self.max_retry_after else None
+        # Full jitter: spread retries from many queries instead of syncing them up.
+        return random.uniform(0, self.backoff_base * 2 ** attempt)
+
+    async def _get(self, url: str, params: dict, headers: dict) -> 'httpx.Response':
+        """GET with rate limiting and retries; raises httpx.HTTPError once retries run out."""
+        import httpx
+        bucket = self._bucket(url)
+        attempt = 0
+        while True:
+            await bucket.acquire()
+            try:
+                response = await self.client.get(url, params=params, headers=headers)
+            except (httpx.TimeoutException, httpx.TransportError):
+                if attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                delay = self._backoff(attempt, response)
+                if delay is None:
+                    return response
+                await asyncio.sleep(delay)
+            attempt += 1
+
+    async def fetch(self, query: str, headers: Optional[dict] = None) -> 'httpx.Response':
+        """GET the search page for `query`, bypassing the cache and the catalog."""
+        return await self._get(self.search_url, {'query': query}, headers or {})
+
+    async def search(
+        self,
+        query: str,
+        on_version: Optional[Callable[[KaraokeVersion], None]] = None,
+    ) -> List[KaraokeVersion]:
+        """Search KaraokeNerds and return all available versions.
+
+        `on_version` is called on the event loop with each version as soon as
+        it has been parsed, so a caller can show results while the rest of
+        the page is still being parsed. Versions answered from the cache or
+        the catalog mirror are passed to it all at once.
+        """
+        import httpx
+        entry = None
+        headers = {}
+        # The cache is SQLite shared with other processes; a write lock held
+        # elsewhere must not stall the event loop.
+        if self.cache:
+            entry, fresh = await asyncio.to_thread(self.cache.lookup, query)
+            if fresh:
+                return self._replay(entry.versions, on_version)
+            if entry is not None:
+                headers = entry.conditional_headers()
+        if self.catalog is not None:
+            # Fuzzy scoring is CPU-bound; keep it off the event loop.
+            versions = await asyncio.to_thread(self.catalog.lookup, query)
+            if versions:
+                return self._replay(versions, on_version)
+
+        try:
+            with metrics.span('scrape_http'):
+                response = await self._get(self.search_url, {'query': query}, headers)
+            if response.status_code == 304 and entry is not None:
+                self.cache.stats.revalidated += 1
+                await asyncio.to_thread(self.cache.touch, query)
+                return self._replay(entry.versions, on_version)
+            response.raise_for_status()
+            # Parsing is CPU-bound; keep it off the event loop.
+            emit = None
+            if on_version is not None:
+                loop = asyncio.get_running_loop()
+                emit = lambda version: loop.call_soon_threadsafe(on_version, version)
+            versions = await asyncio.to_thread(self._parse, response.text, emit)
+            if self.cache:
+                await asyncio.to_thread(
+                    self.cache.put,
+                    query,
+                    versions,
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified'),
+                )
+            return versions
+
+        except httpx.HTTPError as e:
+            logger.warning("Error searching KaraokeNerds for %r: %s", query, e)
+            # A stale answer beats none when the site is unreachable.
+            return self._replay(entry.versions, on_version) if entry is not None else []
+
+    @staticmethod
+    def _replay(
+        versions: List[KaraokeVersion],
+        on_version: Optional[Callable[[KaraokeVersion], None]],
+    ) -> List[KaraokeVersion]:
+        if on_version is not None:
+            for version in versions:
+                on_version(version)
+        return versions
+
+    def _parse(
+        self,
+        html: str,
+        emit: Optional[Callable[[KaraokeVersion], None]] = None,
+    ) -> List[KaraokeVersion]:
+        with metrics.span('scrape_parse'):
+            if emit is None:
+                return self.parser.parse(html)
+            versions = []
+            for version in self.parser.iter_versions(html):
+                versions.append(version)
+                emit(version)
+            return versions
+
+    async def search_many(self, queries: Iterable[str]) -> List[List[KaraokeVersion]]:
+        """Search several queries concurrently; results are in the order given.
+
+        Queries that normalize to the same cache key are fetched once.
+        """
+        queries = list(queries)
+        tasks = {}
+        for query in queries:
+            key = normalize_query(query)
+            if key not in tasks:
+                tasks[key] = asyncio.ensure_future(self.search(query))
+        await asyncio.gather(*tasks.values())
+        return [tasks[normalize_query(query)].result() for query in queries]
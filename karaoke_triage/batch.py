@@ -0,0 +1,269 @@
+"""Triage a list of requests without the TUI.
+
+    python -m karaoke_triage.batch setlist.txt --format json --output report.json
+    cat setlist.txt | python -m karaoke_triage.batch --download
+
+Reads one query per line (blank lines and lines starting with # are
+skipped) from the given file or stdin, resolves them concurrently with the
+same QueryPipeline the TUI uses, and writes a CSV or JSON report with one
+row per query: local, downloadable, downloaded or unavailable, plus the
+timings of each stage. With --download the first version found for each
+downloadable query goes through the download queue, and the command waits
+for those downloads; interrupting it leaves them queued for the next run or
+the TUI. With --profile N the first N queries and downloads are profiled
+(see karaoke_triage/profiling.py).
+"""
+import argparse
+import asyncio
+import csv
+import json
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, TextIO
+
+from .async_scraper import AsyncKaraokeNerdsScraper
+from .config import (
+    BATCH_CONCURRENCY,
+    DATABASE_BACKEND,
+    KARAOKENERDS_SEARCH_URL,
+    PROFILE_MODE,
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_PER_SECOND,
+)
+from .database import SongDatabase
+from .download_queue import DownloadJob, DownloadManager, JobState
+from .logger import ActivityLogger
+from .metrics import metrics
+from .models import KaraokeVersion, Song, SongStatus
+from .pipeline import QueryOutcome, QueryPipeline
+from .profiling import MODES as PROFILE_MODES, profiler
+
+LOCAL = "local"
+DOWNLOADABLE = "downloadable"
+DOWNLOADED = "downloaded"
+UNAVAILABLE = "unavailable"
+
+
+@dataclass
+class ReportRow:
+    query: str
+    status: str
+    title: str = ""
+    artist: str = ""
+    provider: str = ""
+    youtube_link: str = ""
+    versions: int = 0
+    local_ms: Optional[float] = None
+    online_ms: Optional[float] = None
+    total_ms: float = 0.0
+    download: str = ""  # download job state, when --download queued one
+
+    def version(self) -> KaraokeVersion:
+        return KaraokeVersion(self.title, self.artist, self.provider, self.youtube_link)
+
+    @classmethod
+    def from_outcome(cls, outcome: QueryOutcome, total: float) -> 'ReportRow':
+        row = cls(query=outcome.query, status=UNAVAILABLE, total_ms=round(total * 1000, 1))
+        for stage, seconds in outcome.timings.items():
+            setattr(row, f"{stage}_ms", round(seconds * 1000, 1))
+        if outcome.local_match:
+            song = outcome.local_match
+            row.status = LOCAL
+            row.title, row.artist, row.provider = song.title, song.artist, song.source or ""
+        elif outcome.versions:
+            best = outcome.versions[0]
+            row.status = DOWNLOADABLE
+            row.title, row.artist, row.provider = best.title, best.artist, best.provider
+            row.youtube_link = best.youtube_link
+            row.versions = len(outcome.versions)
+        return row
+
+
+REPORT_FIELDS = list(ReportRow.__dataclass_fields__)
+
+
+def read_queries(lines: Iterable[str]) -> List[str]:
+    queries = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            queries.append(line)
+    return queries
+
+
+async def resolve_all(
+    pipeline: QueryPipeline,
+    queries: List[str],
+    concurrency: int = BATCH_CONCURRENCY,
+    online: bool = True,
+) -> List[ReportRow]:
+    """Resolve every query, at most `concurrency` at a time; rows are in input order."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def resolve(query: str) -> ReportRow:
+        async with semaphore:
+            start = time.perf_counter()
+            # Near misses are not enough here: nobody is around to pick one.
+            outcome = await pipeline.resolve(query, online=online, stop_on_near_miss=False)
+            return ReportRow.from_outcome(outcome, time.perf_counter() - start)
+
+    return list(await asyncio.gather(*(resolve(query) for query in queries)))
+
+
+def download_rows(
+    rows: List[ReportRow],
+    database: SongDatabase,
+    logger: ActivityLogger,
+    manager: DownloadManager,
+    requested_by: Optional[str] = None,
+) -> None:
+    """Queue the downloadable rows and block until their downloads settle.
+
+    Jobs left over from earlier sessions run too and are added to the
+    library when they finish, but the wait only covers this batch.
+    """
+    settled = (JobState.DONE.value, JobState.FAILED.value)
+    finished = threading.Event()
+    jobs: Dict[str, List[ReportRow]] = {}
+    lock = threading.Lock()
+
+    def on_update(job: DownloadJob) -> None:
+        if job.state not in (JobState.DONE, JobState.FAILED):
+            return
+        with lock:
+            settle(job)
+
+    def settle(job: DownloadJob) -> None:
+        """Record a finished job; call with the lock held."""
+        if job.state is JobState.DONE and not database.has_file(job.file_path):
+            song = job.to_song()
+            database.add_song(song)
+            logger.log_activity(song, SongStatus.DOWNLOADED, requested_by)
+        for row in jobs.get(job.id, []):
+            row.download = job.state.value
+            if job.state is JobState.DONE:
+                row.status = DOWNLOADED
+        if all(row.download in settled for job_rows in jobs.values() for row in job_rows):
+            finished.set()
+
+    manager.on_update = on_update
+    with lock:
+        for row in rows:
+            if row.status == DOWNLOADABLE:
+                job, created = manager.submit(row.version())
+                jobs.setdefault(job.id, []).append(row)
+                row.download = job.state.value
+                if created and job.state is JobState.DONE:
+                    # Already downloaded; the manager does not report these.
+                    settle(job)
+    if not jobs or finished.is_set():
+        return
+    manager.start()
+    try:
+        finished.wait()
+    finally:
+        manager.stop()
+
+
+def write_report(rows: List[ReportRow], out: TextIO, fmt: str = "csv") -> None:
+    if fmt == "json":
+        json.dump([asdict(row) for row in rows], out, indent=2)
+        out.write("\n")
+        return
+    writer = csv.DictWriter(out, fieldnames=REPORT_FIELDS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(asdict(row))
+
+
+def summarize(rows: List[ReportRow], elapsed: float) -> str:
+    counts: Dict[str, int] = {}
+    for row in rows:
+        counts[row.status] = counts.get(row.status, 0) + 1
+    parts = [f"{status} {counts[status]}" for status in (LOCAL, DOWNLOADABLE, DOWNLOADED, UNAVAILABLE) if status in counts]
+    return f"{len(rows)} queries in {elapsed:.1f}s: " + ", ".join(parts)
+
+
+async def run(args, queries: List[str], database: SongDatabase) -> List[ReportRow]:
+    async with AsyncKaraokeNerdsScraper(
+        search_url=args.search_url,
+        max_connections=args.concurrency,
+        rate=args.rate,
+        burst=args.burst,
+    ) as scraper:
+        pipeline = QueryPipeline(database, scraper)
+        return await resolve_all(pipeline, queries, args.concurrency, online=not args.offline)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m karaoke_triage.batch",
+        description=__doc__.splitlines()[0],
+    )
+    parser.add_argument("input", nargs="?", help="file with one query per line (default: stdin)")
+    parser.add_argument("--output", "-o", help="report path (default: stdout)")
+    parser.add_argument("--format", choices=("csv", "json"), default="csv")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY,
+                        help="queries resolved at once, also the HTTP connection pool size")
+    parser.add_argument("--rate", type=float, default=RATE_LIMIT_PER_SECOND, help="KaraokeNerds requests per second")
+    parser.add_argument("--burst", type=int, default=RATE_LIMIT_BURST)
+    parser.add_argument("--offline", action="store_true", help="only check the local library")
+    parser.add_argument("--download", action="store_true", help="download the first version of each downloadable query")
+    parser.add_argument("--requested-by", help="name recorded in the activity log")
+    parser.add_argument("--database", type=Path, help="song database path")
+    parser.add_argument("--backend", choices=("csv", "sqlite"), default=DATABASE_BACKEND)
+    parser.add_argument("--metrics", type=Path, help="write stage timings here in Prometheus text format")
+    parser.add_argument("--search-url", default=KARAOKENERDS_SEARCH_URL,
+                        help="search endpoint, e.g. the one printed by benchmarks.stub_server")
+    parser.add_argument("--profile", type=int, metavar="N",
+                        help="profile the first N queries and downloads into data/profiles/")
+    parser.add_argument("--profile-mode", choices=PROFILE_MODES, default=PROFILE_MODE)
+    args = parser.parse_args(argv[1:])
+
+    if args.input:
+        with open(args.input) as f:
+            queries = read_queries(f)
+    else:
+        queries = read_queries(sys.stdin)
+
+    database = SongDatabase(args.database, backend=args.backend)
+    logger = ActivityLogger()
+    capture = profiler.arm(args.profile, args.profile_mode)[0] if args.profile else None
+    start = time.perf_counter()
+    rows = asyncio.run(run(args, queries, database))
+
+    for row in rows:
+        if row.status == LOCAL:
+            logger.log_activity(Song(title=row.title, artist=row.artist, source=row.provider), SongStatus.LOCAL, args.requested_by)
+        elif row.status == UNAVAILABLE and not args.offline:
+            logger.log_activity(Song(title=row.query, artist=""), SongStatus.UNAVAILABLE, args.requested_by)
+
+    if args.download:
+        try:
+            download_rows(rows, database, logger, DownloadManager(), args.requested_by)
+        except KeyboardInterrupt:
+            print("Interrupted; unfinished downloads stay queued.", file=sys.stderr)
+
+    logger.close()
+    if capture is not None:
+        # Fewer operations than asked for still get written.
+        capture.stop()
+        capture.written.wait()
+        print(f"Profile written to {capture.directory}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            write_report(rows, f, args.format)
+    else:
+        write_report(rows, sys.stdout, args.format)
+    print(summarize(rows, time.perf_counter() - start), file=sys.stderr)
+    if args.metrics:
+        metrics.write(args.metrics)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,240 @@
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .config import (
+    SCRAPE_CACHE_MAX_ENTRIES,
+    SCRAPE_CACHE_NEGATIVE_TTL,
+    SCRAPE_CACHE_PATH,
+    SCRAPE_CACHE_TTL,
+)
+from .columns import StringDictionary
+from .metrics import metrics
+from .models import KaraokeVersion
+
+
+def normalize_query(query: str) -> str:
+    """Cache key for a search: case-folded with whitespace collapsed."""
+    return ' '.join(query.casefold().split())
+
+
+def pack_versions(versions: List[KaraokeVersion]) -> str:
+    """JSON for a result list, with artist and provider names stored once each.
+
+    A page of results repeats the same few artists and providers; decoding
+    the packed form shares one string per name between all the versions.
+    """
+    artists = StringDictionary()
+    providers = StringDictionary()
+    rows = [
+        [v.title, artists.encode(v.artist), providers.encode(v.provider), v.youtube_link]
+        for v in versions
+    ]
+    return json.dumps({'artists': artists.values, 'providers': providers.values, 'rows': rows})
+
+
+def unpack_versions(text: str) -> List[KaraokeVersion]:
+    data = json.loads(text)
+    if isinstance(data, list):
+        # Written before results were packed: one [title, artist, provider, link] per version.
+        return [KaraokeVersion(*fields) for fields in data]
+    artists, providers = data['artists'], data['providers']
+    return [
+        KaraokeVersion(title, artists[artist], providers[provider], link)
+        for title, artist, provider, link in data['rows']
+    ]
+
+
+@dataclass
+class CacheEntry:
+    versions: List[KaraokeVersion]
+    fetched_at: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    @property
+    def negative(self) -> bool:
+        """True when the search returned no versions."""
+        return not self.versions
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """Request headers that let the server answer 304 if the page is unchanged."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    negative_hits: int = 0
+    misses: int = 0
+    stale: int = 0
+    revalidated: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups answered without downloading a page."""
+        lookups = self.hits + self.negative_hits + self.misses + self.stale
+        answered = self.hits + self.negative_hits + self.revalidated
+        return answered / lookups if lookups else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'revalidated': self.revalidated,
+            'evictions': self.evictions,
+            'hit_rate': self.hit_rate,
+        }
+
+
+class ScrapeCache:
+    """On-disk cache of parsed KaraokeNerds results, keyed by normalized query.
+
+    Entries older than their TTL are stale but kept, so the scraper can
+    revalidate them with the stored ETag/Last-Modified and fall back to them
+    when the site is unreachable. Searches with no results use the shorter
+    negative TTL. Once there are more than `max_entries` entries, the least
+    recently used ones are evicted.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        key TEXT PRIMARY KEY,
+        versions TEXT NOT NULL,
+        etag TEXT,
+        last_modified TEXT,
+        fetched_at REAL NOT NULL,
+        accessed_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at);
+    """
+
+    def __init__(
+        self,
+        path: Path = SCRAPE_CACHE_PATH,
+        ttl: float = SCRAPE_CACHE_TTL,
+        negative_ttl: float = SCRAPE_CACHE_NEGATIVE_TTL,
+        max_entries: int = SCRAPE_CACHE_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        metrics.add_source('scrape_cache', self.stats.as_dict)
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.connection as conn:
+            conn.executescript(self.SCHEMA)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections must not be shared."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def is_fresh(self, entry: CacheEntry, now: Optional[float] = None) -> bool:
+        ttl = self.negative_ttl if entry.negative else self.ttl
+        return (now or time.time()) - entry.fetched_at < ttl
+
+    def get(self, query: str) -> Optional[CacheEntry]:
+        """Return the entry for `query`, fresh or stale, and mark it recently used."""
+        key = normalize_query(query)
+        with self.connection as conn:
+            record = conn.execute(
+                'SELECT versions, etag, last_modified, fetched_at FROM entries WHERE key = ?',
+                (key,),
+            ).fetchone()
+            if record is None:
+                return None
+            conn.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        versions, etag, last_modified, fetched_at = record
+        return CacheEntry(
+            versions=unpack_versions(versions),
+            fetched_at=fetched_at,
+            etag=etag,
+            last_modified=last_modified,
+        )
+
+    def fetched_at(self, query: str) -> Optional[float]:
+        """When the entry for `query` was fetched, or None; leaves its recency alone."""
+        record = self.connection.execute(
+            'SELECT fetched_at FROM entries WHERE key = ?', (normalize_query(query),)
+        ).fetchone()
+        return record[0] if record else None
+
+    def lookup(self, query: str) -> Tuple[Optional[CacheEntry], bool]:
+        """Return (entry, fresh) for a search, counting it in the stats.
+
+        A fresh entry can be used as is; a stale one should be revalidated.
+        """
+        entry = self.get(query)
+        if entry is None:
+            self.stats.misses += 1
+            return None, False
+        if not self.is_fresh(entry):
+            self.stats.stale += 1
+            return entry, False
+        if entry.negative:
+            self.stats.negative_hits += 1
+        else:
+            self.stats.hits += 1
+        return entry, True
+
+    def put(
+        self,
+        query: str,
+        versions: List[KaraokeVersion],
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        now = time.time()
+        with self.connection as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO entries (key, versions, etag, last_modified, fetched_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (normalize_query(query), pack_versions(versions),
+                 etag, last_modified, now, now),
+            )
+            self._evict(conn)
+
+    def touch(self, query: str) -> None:
+        """Mark an entry as freshly fetched after a 304 Not Modified."""
+        now = time.time()
+        with self.connection as conn:
+            conn.execute(
+                'UPDATE entries SET fetched_at = ?, accessed_at = ? WHERE key = ?',
+                (now, now, normalize_query(query)),
+            )
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        (count,) = conn.execute('SELECT COUNT(*) FROM entries').fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                'DELETE FROM entries WHERE key IN '
+                '(SELECT key FROM entries ORDER BY accessed_at LIMIT ?)',
+                (excess,),
+            )
+            self.stats.evictions += excess
+
+    def clear(self) -> None:
+        with self.connection as conn:
+            conn.execute('DELETE FROM entries')
@@ -0,0 +1,466 @@
+"""Local mirror of the KaraokeNerds catalog, so searches work without the site.
+
+    python -m karaoke_triage.catalog crawl "queen" "abba" --from-library --from-log
+    python -m karaoke_triage.catalog crawl            # refresh whatever is due
+    python -m karaoke_triage.catalog lookup "bohemian rhapsody queen"
+    python -m karaoke_triage.catalog stats
+
+The site has no catalog listing, so the mirror is built from search pages.
+A crawl fetches the pages of its seed queries (given on the command line,
+the artists in the local library, the most requested unavailable songs in
+the activity log), then the pages of the artists found on them, down to
+CATALOG_CRAWL_DEPTH levels. Each page is committed together with its
+versions as soon as it has been parsed, so an interrupted crawl carries on
+where it stopped. A page is due again CATALOG_MAX_AGE seconds after it was
+fetched and is then revalidated with its ETag, so refreshing an unchanged
+catalog costs one 304 per page. Requests go through the scraper's token
+bucket at CATALOG_CRAWL_RATE and at most CATALOG_CRAWL_MAX_PAGES are
+fetched per run.
+
+The scrapers answer a search from the mirror only when it names a mirrored
+song's title and artist almost exactly: a token_sort score (word order
+ignored, but unmatched words on either side count against it) of at least
+CATALOG_MATCH_THRESHOLD. Anything vaguer, such as a title alone, goes to the
+site, since the mirror may hold only some of the songs that match it.
+"""
+import argparse
+import asyncio
+import logging
+import re
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+from rapidfuzz import fuzz, process, utils
+
+from .cache import normalize_query
+from .config import (
+    CATALOG_CRAWL_CONCURRENCY,
+    CATALOG_CRAWL_DEPTH,
+    CATALOG_CRAWL_MAX_PAGES,
+    CATALOG_CRAWL_RATE,
+    CATALOG_ENABLED,
+    CATALOG_MATCH_THRESHOLD,
+    CATALOG_MAX_AGE,
+    CATALOG_MAX_ATTEMPTS,
+    CATALOG_MAX_CANDIDATES,
+    CATALOG_PATH,
+    KARAOKENERDS_SEARCH_URL,
+)
+from .metrics import metrics
+from .models import KaraokeVersion
+
+if TYPE_CHECKING:
+    from .async_scraper import AsyncKaraokeNerdsScraper
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'  # never fetched
+DONE = 'done'
+FAILED = 'failed'  # last fetch failed; retried by the next run up to CATALOG_MAX_ATTEMPTS times
+
+
+@dataclass
+class Page:
+    """One search page of the crawl frontier."""
+    query: str
+    depth: int = 0
+    state: str = PENDING
+    attempts: int = 0
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: Optional[float] = None
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+@dataclass
+class CrawlStats:
+    fetched: int = 0
+    unchanged: int = 0  # revalidated with a 304
+    failed: int = 0
+    discovered: int = 0  # new pages added to the frontier
+    versions: int = 0
+
+    @property
+    def pages(self) -> int:
+        return self.fetched + self.unchanged + self.failed
+
+    def describe(self) -> str:
+        return (f"{self.pages} pages: {self.fetched} fetched ({self.versions} versions), "
+                f"{self.unchanged} unchanged, {self.failed} failed; {self.discovered} new pages queued")
+
+
+class CatalogMirror:
+    """SQLite store of crawled search pages and the versions listed on them.
+
+    Songs and providers are stored once and referenced by id from the
+    versions, and songs carry an FTS5 index that shortlists candidates for
+    `lookup`. Each version belongs to the page that listed it most recently,
+    so re-fetching a page drops the versions that have left it.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS pages (
+        query TEXT PRIMARY KEY,
+        depth INTEGER NOT NULL DEFAULT 0,
+        state TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        etag TEXT,
+        last_modified TEXT,
+        fetched_at REAL,
+        versions INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS providers (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS songs (
+        id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        artist TEXT NOT NULL,
+        UNIQUE (title, artist)
+    );
+    CREATE TABLE IF NOT EXISTS versions (
+        youtube_link TEXT PRIMARY KEY,
+        song_id INTEGER NOT NULL REFERENCES songs (id),
+        provider_id INTEGER NOT NULL REFERENCES providers (id),
+        page TEXT NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS versions_song ON versions (song_id);
+    CREATE INDEX IF NOT EXISTS versions_page ON versions (page);
+    CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5 (
+        title, artist, content='songs', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    );
+    CREATE TRIGGER IF NOT EXISTS songs_ai AFTER INSERT ON songs BEGIN
+        INSERT INTO songs_fts (rowid, title, artist) VALUES (new.id, new.title, new.artist);
+    END;
+    """
+
+    def __init__(
+        self,
+        path: Path = CATALOG_PATH,
+        threshold: float = CATALOG_MATCH_THRESHOLD,
+        max_candidates: int = CATALOG_MAX_CANDIDATES,
+    ):
+        self.path = path
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.connection as conn:
+            conn.executescript(self.SCHEMA)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections must not be shared."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    # -- crawl frontier ------------------------------------------------------
+
+    def add_pages(self, queries: Iterable[str], depth: int = 0) -> int:
+        """Queue the search pages of `queries` that are not known yet; returns how many were new."""
+        keys = {normalize_query(query) for query in queries}
+        keys.discard('')
+        with self.connection as conn:
+            before = conn.total_changes
+            conn.executemany('INSERT OR IGNORE INTO pages (query, depth) VALUES (?, ?)',
+                             ((key, depth) for key in keys))
+            return conn.total_changes - before
+
+    def due_pages(self, limit: int, max_age: float, max_attempts: int, run_started: float) -> List[Page]:
+        """Pages to fetch next: never fetched first (shallowest first), then the stalest.
+
+        A page that failed before `run_started` is retried until it has
+        failed `max_attempts` times in a row; after that it waits `max_age`
+        like a fetched page.
+        """
+        cursor = self.connection.execute(
+            'SELECT query, depth, state, attempts, etag, last_modified, fetched_at FROM pages '
+            'WHERE state = ? OR (state = ? AND attempts < ? AND fetched_at < ?) OR fetched_at < ? '
+            'ORDER BY state != ?, depth, fetched_at LIMIT ?',
+            # Nothing fetched during this run is due again in it.
+            (PENDING, FAILED, max_attempts, run_started, min(time.time() - max_age, run_started), PENDING, limit),
+        )
+        return [Page(*record) for record in cursor]
+
+    def store_page(
+        self,
+        query: str,
+        versions: List[KaraokeVersion],
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        """Replace the versions listed on `query`'s page and mark it fetched."""
+        key = normalize_query(query)
+        with self.connection as conn:
+            conn.execute('INSERT OR IGNORE INTO pages (query) VALUES (?)', (key,))
+            conn.execute('DELETE FROM versions WHERE page = ?', (key,))
+            for version in versions:
+                conn.execute(
+                    'INSERT OR REPLACE INTO versions (youtube_link, song_id, provider_id, page) VALUES (?, ?, ?, ?)',
+                    (version.youtube_link, self._song_id(conn, version), self._provider_id(conn, version.provider), key),
+                )
+            conn.execute(
+                'UPDATE pages SET state = ?, attempts = 0, etag = ?, last_modified = ?, fetched_at = ?, versions = ? '
+                'WHERE query = ?',
+                (DONE, etag, last_modified, time.time(), len(versions), key),
+            )
+
+    @staticmethod
+    def _song_id(conn: sqlite3.Connection, version: KaraokeVersion) -> int:
+        conn.execute('INSERT OR IGNORE INTO songs (title, artist) VALUES (?, ?)', (version.title, version.artist))
+        (song_id,) = conn.execute('SELECT id FROM songs WHERE title = ? AND artist = ?',
+                                  (version.title, version.artist)).fetchone()
+        return song_id
+
+    @staticmethod
+    def _provider_id(conn: sqlite3.Connection, name: str) -> int:
+        conn.execute('INSERT OR IGNORE INTO providers (name) VALUES (?)', (name,))
+        (provider_id,) = conn.execute('SELECT id FROM providers WHERE name = ?', (name,)).fetchone()
+        return provider_id
+
+    def touch_page(self, query: str) -> None:
+        """Mark a page as freshly fetched after a 304 Not Modified."""
+        with self.connection as conn:
+            conn.execute('UPDATE pages SET state = ?, attempts = 0, fetched_at = ? WHERE query = ?',
+                         (DONE, time.time(), normalize_query(query)))
+
+    def fail_page(self, query: str) -> None:
+        with self.connection as conn:
+            conn.execute('UPDATE pages SET state = ?, attempts = attempts + 1, fetched_at = ? WHERE query = ?',
+                         (FAILED, time.time(), normalize_query(query)))
+
+    def counts(self) -> Dict[str, float]:
+        conn = self.connection
+        counts: Dict[str, float] = {f'pages_{state}': 0 for state in (PENDING, DONE, FAILED)}
+        for state, count in conn.execute('SELECT state, COUNT(*) FROM pages GROUP BY state'):
+            counts[f'pages_{state}'] = count
+        (counts['songs'],) = conn.execute(
+            'SELECT COUNT(DISTINCT song_id) FROM versions').fetchone()
+        (counts['versions'],) = conn.execute('SELECT COUNT(*) FROM versions').fetchone()
+        (oldest,) = conn.execute('SELECT MIN(fetched_at) FROM pages WHERE state = ?', (DONE,)).fetchone()
+        counts['oldest_page_age'] = time.time() - oldest if oldest else 0
+        return counts
+
+    # -- search --------------------------------------------------------------
+
+    def lookup(self, query: str) -> List[KaraokeVersion]:
+        """Versions of the mirrored songs matching `query`, best match first; [] when none is confident."""
+        tokens = [token for token in re.findall(r'\w+', query.casefold()) if len(token) > 1]
+        if not tokens:
+            return []
+        with metrics.span('catalog_lookup'):
+            versions = self._lookup(query, tokens)
+        metrics.inc('catalog_hits_total' if versions else 'catalog_misses_total')
+        return versions
+
+    def _lookup(self, query: str, tokens: List[str]) -> List[KaraokeVersion]:
+        conn = self.connection
+        # Any word may match, so a typo in one word still shortlists the
+        # song; bm25 puts rows matching more of the words first.
+        match = ' OR '.join(f'"{token}"*' for token in tokens)
+        cursor = conn.execute(
+            'SELECT songs.id, songs.title, songs.artist FROM songs_fts '
+            'JOIN songs ON songs.id = songs_fts.rowid '
+            'WHERE songs_fts MATCH ? ORDER BY rank LIMIT ?',
+            (match, self.max_candidates),
+        )
+        choices = {song_id: f"{title} {artist}" for song_id, title, artist in cursor}
+        ranked = process.extract(
+            query, choices, scorer=fuzz.token_sort_ratio, processor=utils.default_process,
+            score_cutoff=self.threshold, limit=None,
+        )
+        if not ranked:
+            return []
+        order = {song_id: rank for rank, (_, _, song_id) in enumerate(ranked)}
+        placeholders = ','.join('?' * len(order))
+        records = conn.execute(
+            'SELECT versions.song_id, songs.title, songs.artist, providers.name, versions.youtube_link '
+            'FROM versions JOIN songs ON songs.id = versions.song_id '
+            'JOIN providers ON providers.id = versions.provider_id '
+            f'WHERE versions.song_id IN ({placeholders})',
+            list(order),
+        ).fetchall()
+        records.sort(key=lambda record: (order[record[0]], record[3]))
+        return [KaraokeVersion(title, artist, provider, link) for _, title, artist, provider, link in records]
+
+
+def open_catalog(path: Path = CATALOG_PATH, enabled: bool = CATALOG_ENABLED) -> Optional[CatalogMirror]:
+    """The mirror at `path` if it is enabled and has been crawled, else None."""
+    if not enabled or not path.exists():
+        return None
+    try:
+        return CatalogMirror(path)
+    except sqlite3.Error as e:
+        logger.warning("Ignoring unreadable catalog mirror %s: %s", path, e)
+        return None
+
+
+class CatalogCrawler:
+    """Fills a CatalogMirror from the site through a scraper's rate-limited client."""
+
+    def __init__(
+        self,
+        mirror: CatalogMirror,
+        scraper: 'AsyncKaraokeNerdsScraper',
+        concurrency: int = CATALOG_CRAWL_CONCURRENCY,
+        max_depth: int = CATALOG_CRAWL_DEPTH,
+        max_age: float = CATALOG_MAX_AGE,
+        max_attempts: int = CATALOG_MAX_ATTEMPTS,
+    ):
+        self.mirror = mirror
+        self.scraper = scraper
+        self.concurrency = concurrency
+        self.max_depth = max_depth
+        self.max_age = max_age
+        self.max_attempts = max_attempts
+
+    async def crawl(self, seeds: Iterable[str] = (), max_pages: int = CATALOG_CRAWL_MAX_PAGES) -> CrawlStats:
+        """Queue `seeds` and fetch up to `max_pages` due pages."""
+        stats = CrawlStats()
+        started = time.time()
+        stats.discovered += await asyncio.to_thread(self.mirror.add_pages, seeds)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while stats.pages < max_pages:
+            batch = await asyncio.to_thread(
+                self.mirror.due_pages,
+                min(self.concurrency * 4, max_pages - stats.pages),
+                self.max_age, self.max_attempts, started,
+            )
+            if not batch:
+                break
+            await asyncio.gather(*(self._crawl_page(page, stats, semaphore) for page in batch))
+        return stats
+
+    async def _crawl_page(self, page: Page, stats: CrawlStats, semaphore: asyncio.Semaphore) -> None:
+        import httpx
+        async with semaphore:
+            try:
+                response = await self.scraper.fetch(page.query, page.conditional_headers())
+                if response.status_code == 304:
+                    await asyncio.to_thread(self.mirror.touch_page, page.query)
+                    stats.unchanged += 1
+                    return
+                response.raise_for_status()
+                versions = await asyncio.to_thread(self.scraper.parser.parse, response.text)
+            except httpx.HTTPError as e:
+                logger.warning("Could not crawl %r: %s", page.query, e)
+                await asyncio.to_thread(self.mirror.fail_page, page.query)
+                stats.failed += 1
+                return
+        await asyncio.to_thread(
+            self.mirror.store_page, page.query, versions,
+            response.headers.get('ETag'), response.headers.get('Last-Modified'),
+        )
+        stats.fetched += 1
+        stats.versions += len(versions)
+        if page.depth < self.max_depth:
+            artists = {version.artist for version in versions if version.artist}
+            stats.discovered += await asyncio.to_thread(self.mirror.add_pages, artists, page.depth + 1)
+
+
+def library_seeds() -> List[str]:
+    """Every artist in the local library."""
+    from .database import SongDatabase
+    store = SongDatabase().store
+    return sorted({row[1] for _, row in store.iter_rows() if row[1]})
+
+
+def log_seeds(limit: int) -> List[str]:
+    """The most requested songs the activity log has as unavailable."""
+    from .config import LOG_PATH, REPORT_ROLLUP_PATH
+    from .report import Rollup, update_rollup
+    rollup = Rollup.load(REPORT_ROLLUP_PATH)
+    update_rollup(rollup, LOG_PATH)
+    rollup.save(REPORT_ROLLUP_PATH)
+    return [query for query, _, _ in rollup.top_unavailable(limit)]
+
+
+async def run_crawl(args, seeds: List[str]) -> CrawlStats:
+    from .async_scraper import AsyncKaraokeNerdsScraper
+    mirror = CatalogMirror(args.catalog)
+    async with AsyncKaraokeNerdsScraper(
+        search_url=args.search_url,
+        use_cache=False,
+        use_catalog=False,
+        max_connections=args.concurrency,
+        rate=args.rate,
+        burst=1,
+    ) as scraper:
+        crawler = CatalogCrawler(mirror, scraper, concurrency=args.concurrency,
+                                 max_depth=args.depth, max_age=args.max_age)
+        return await crawler.crawl(seeds, args.max_pages)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m karaoke_triage.catalog", description=__doc__.splitlines()[0])
+    parser.add_argument("--catalog", type=Path, default=CATALOG_PATH, help="mirror database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    crawl = commands.add_parser("crawl", help="fetch new and stale pages")
+    crawl.add_argument("queries", nargs="*", help="seed queries, e.g. artist names")
+    crawl.add_argument("--from-library", action="store_true", help="seed with every artist in the local library")
+    crawl.add_argument("--from-log", type=int, metavar="N", default=0,
+                       help="seed with the N most requested unavailable songs in the activity log")
+    crawl.add_argument("--max-pages", type=int, default=CATALOG_CRAWL_MAX_PAGES)
+    crawl.add_argument("--depth", type=int, default=CATALOG_CRAWL_DEPTH, help="levels of artists to follow")
+    crawl.add_argument("--max-age", type=float, default=CATALOG_MAX_AGE, help="seconds before a page is refetched")
+    crawl.add_argument("--rate", type=float, default=CATALOG_CRAWL_RATE, help="requests per second")
+    crawl.add_argument("--concurrency", type=int, default=CATALOG_CRAWL_CONCURRENCY)
+    crawl.add_argument("--search-url", default=KARAOKENERDS_SEARCH_URL,
+                       help="search endpoint, e.g. the one printed by benchmarks.stub_server")
+
+    lookup = commands.add_parser("lookup", help="search the mirror")
+    lookup.add_argument("query")
+
+    commands.add_parser("stats", help="show what the mirror holds")
+    args = parser.parse_args(argv[1:])
+
+    if args.command == "crawl":
+        seeds = list(args.queries)
+        if args.from_library:
+            seeds += library_seeds()
+        if args.from_log:
+            seeds += log_seeds(args.from_log)
+        try:
+            stats = asyncio.run(run_crawl(args, seeds))
+        except KeyboardInterrupt:
+            print("Interrupted; the next crawl picks up from here.", file=sys.stderr)
+            return 1
+        print(stats.describe())
+        return 0
+
+    mirror = CatalogMirror(args.catalog)
+    if args.command == "lookup":
+        start = time.perf_counter()
+        versions = mirror.lookup(args.query)
+        for version in versions:
+            print(f"{version.title} - {version.artist}  [{version.provider}]  {version.youtube_link}")
+        print(f"{len(versions)} versions in {(time.perf_counter() - start) * 1000:.1f} ms", file=sys.stderr)
+        return 0 if versions else 1
+
+    for name, value in mirror.counts().items():
+        print(f"{name:<16} {value:,.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
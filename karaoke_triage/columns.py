@@ -0,0 +1,159 @@
+"""Column-oriented, dictionary-encoded storage for the in-memory song library.
+
+A library held as one tuple of five strings per row spends most of its
+memory on object headers and on copies of the same few artist, folder and
+source names. `SongColumns` keeps each field in its own column instead:
+
+    titles      one str per row
+    artists     array of codes into a `StringDictionary` of artist names
+    folders     array of codes into a dictionary of directories; the file
+                name itself is the only per-row string of a path
+    downloaded  array of int64 microseconds since the epoch, turned into a
+                datetime only when a Song is built
+    sources     array of codes into a dictionary of source names
+
+`Song` objects are built on demand by `song()`, so only the handful of rows
+a search returns are ever materialized.
+"""
+import os
+import sys
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from .models import Song
+from .storage import Row
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+NO_DATE = -(2 ** 63)  # date_downloaded was empty
+OTHER_DATE = NO_DATE + 1  # not a naive ISO timestamp; the text is kept in `_other_dates`
+
+
+class StringDictionary:
+    """Maps repeated strings to small integer codes and back. Code 0 is ''."""
+
+    def __init__(self):
+        self.values: List[str] = ['']
+        self._codes: Dict[str, int] = {'': 0}
+
+    def encode(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(sys.intern(value))
+        return code
+
+    def code(self, value: str) -> Optional[int]:
+        """The code of `value`, or None if it was never encoded."""
+        return self._codes.get(value)
+
+    def __getitem__(self, code: int) -> str:
+        return self.values[code]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+def encode_timestamp(text: str) -> int:
+    """Microseconds since the epoch for a naive ISO timestamp, else NO_DATE/OTHER_DATE."""
+    if not text:
+        return NO_DATE
+    try:
+        moment = datetime.fromisoformat(text)
+    except ValueError:
+        return OTHER_DATE
+    if moment.tzinfo is not None:
+        return OTHER_DATE
+    return (moment - _EPOCH) // _MICROSECOND
+
+
+class SongColumns:
+    """The rows of a song library as parallel columns; see the module docstring."""
+
+    def __init__(self):
+        self.titles: List[str] = []
+        self.artists = array('I')
+        self.folders = array('I')
+        self.file_names: List[str] = []
+        self.downloaded = array('q')
+        self.sources = array('I')
+        self.artist_names = StringDictionary()
+        self.folder_names = StringDictionary()
+        self.source_names = StringDictionary()
+        # Timestamps that are not naive ISO text, by position; rare enough to keep as is.
+        self._other_dates: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def append(self, row: Row) -> None:
+        self.extend((row,))
+
+    def extend(self, rows: Iterable[Row]) -> None:
+        """Append rows; the loop a whole library load goes through, so names are bound locally."""
+        add_title = self.titles.append
+        add_artist = self.artists.append
+        add_folder = self.folders.append
+        add_file_name = self.file_names.append
+        add_stamp = self.downloaded.append
+        add_source = self.sources.append
+        artist_codes, encode_artist = self.artist_names._codes, self.artist_names.encode
+        folder_codes, encode_folder = self.folder_names._codes, self.folder_names.encode
+        source_codes, encode_source = self.source_names._codes, self.source_names.encode
+        other_dates = self._other_dates
+        sep = os.sep
+        position = len(self.titles)
+        for title, artist, file_path, date_downloaded, source in rows:
+            add_title(title)
+            code = artist_codes.get(artist)
+            add_artist(encode_artist(artist) if code is None else code)
+            folder, slash, name = file_path.rpartition(sep)
+            folder += slash
+            code = folder_codes.get(folder)
+            add_folder(encode_folder(folder) if code is None else code)
+            add_file_name(name)
+            stamp = encode_timestamp(date_downloaded)
+            if stamp == OTHER_DATE:
+                other_dates[position] = date_downloaded
+            add_stamp(stamp)
+            code = source_codes.get(source)
+            add_source(encode_source(source) if code is None else code)
+            position += 1
+
+    def artist(self, position: int) -> str:
+        return self.artist_names[self.artists[position]]
+
+    def file_path(self, position: int) -> str:
+        return self.folder_names[self.folders[position]] + self.file_names[position]
+
+    def find_file(self, file_path: str) -> Optional[int]:
+        """Position of the first row with this file path, or None."""
+        folder, sep, name = file_path.rpartition(os.sep)
+        code = self.folder_names.code(folder + sep)
+        if code is None:
+            return None
+        folders = self.folders
+        for position, file_name in enumerate(self.file_names):
+            if file_name == name and folders[position] == code:
+                return position
+        return None
+
+    def date_downloaded(self, position: int) -> Optional[datetime]:
+        stamp = self.downloaded[position]
+        if stamp == NO_DATE:
+            return None
+        if stamp == OTHER_DATE:
+            return datetime.fromisoformat(self._other_dates[position])
+        return _EPOCH + stamp * _MICROSECOND
+
+    def song(self, position: int) -> Song:
+        # Inlines artist(), file_path() and date_downloaded(): search results are built here.
+        stamp = self.downloaded[position]
+        return Song(
+            title=self.titles[position],
+            artist=self.artist_names.values[self.artists[position]],
+            file_path=self.folder_names.values[self.folders[position]] + self.file_names[position],
+            date_downloaded=_EPOCH + stamp * _MICROSECOND if stamp > OTHER_DATE else self.date_downloaded(position),
+            source=self.source_names.values[self.sources[position]],
+        )
@@ -5,15 +5,128 @@ BASE_DIR = Path(__file__).parent.parent
 DATA_DIR = BASE_DIR / "data"
 DOWNLOADS_DIR = DATA_DIR / "downloads"
 DATABASE_PATH = DATA_DIR / "songs.csv"
+SQLITE_DATABASE_PATH = DATA_DIR / "songs.db"
 LOG_PATH = DATA_DIR / "activity.log"
+REPORT_ROLLUP_PATH = DATA_DIR / "activity_rollup.json"
+SCRAPE_CACHE_PATH = DATA_DIR / "scrape_cache.db"
+CATALOG_PATH = DATA_DIR / "catalog.db"
+DOWNLOAD_JOBS_PATH = DATA_DIR / "download_jobs.json"
+ARTIFACT_INDEX_PATH = DATA_DIR / "artifacts.json"
+LIBRARY_SCAN_STATE_PATH = DATA_DIR / "library_scan.json"
+PREFETCH_STATE_PATH = DATA_DIR / "prefetch.json"
+DEBUG_LOG_PATH = DATA_DIR / "debug.log"
+PROFILE_DIR = DATA_DIR / "profiles"
+
+# Storage settings
+DATABASE_BACKEND = "csv"  # "csv" (songs.csv) or "sqlite" (songs.db, see `python -m karaoke_triage.storage migrate`)
 
 # Search settings
 FUZZY_MATCH_THRESHOLD = 70  # Minimum confidence score for fuzzy matching
+LOCAL_MATCH_SCORER = "ratio"  # Scorer deciding whether a song is available locally
+NEAR_MISS_SCORER = "token_sort"  # Scorer for the ranked near-miss list ("ratio", "token_sort", "token_set", "wratio")
+NEAR_MISS_THRESHOLD = 50  # Minimum score for a local near miss to be shown
+NEAR_MISS_LIMIT = 5  # Number of local near misses shown
+SPECULATIVE_ONLINE_DELAY_MS = 150  # Start the online search if the local lookup takes longer than this
+SEARCH_CHUNK_SIZE = 4096  # Rows scored per batch when ranking the top matches
+NGRAM_INDEX_MIN_ROWS = 50000  # Libraries at least this large are pruned with a trigram index
+NGRAM_MAX_CANDIDATES = 2000  # Rows shortlisted by the trigram index before fuzzy scoring
+NGRAM_MAX_POSTINGS = 100000  # Row ids merged per query; the most common trigrams are dropped past this
+NGRAM_INDEX_PERSIST = True  # Save the trigram index next to the CSV to skip rebuilding it on startup
+NGRAM_DELTA_MAX = 1000  # Songs added to the saved trigram index as a cheap delta before it is saved whole
+
+# Search-as-you-type settings
+LIVE_SEARCH_DEBOUNCE_MS = 120  # Wait this long after the last keystroke before matching
+LIVE_SEARCH_BUDGET_MS = 30  # Time allowed per keystroke; the best matches so far are shown
+LIVE_SEARCH_MIN_CHARS = 3  # Shorter input shows no live matches
+LIVE_SEARCH_LIMIT = 5  # Number of live matches shown under the input
+LIVE_SEARCH_SCORER = "token_sort"  # Scorer used to rank live matches
+
+# Activity log settings
+LOG_FLUSH_INTERVAL = 1.0  # Seconds a logged request may wait in memory; at most this much is lost on a crash
+LOG_MAX_BATCH = 500  # Rows written together; a full batch is written without waiting for the interval
+LOG_FSYNC = False  # fsync every batch, so the loss bound also covers power cuts
+LOG_ROTATE = "size"  # "size", "daily" or None
+LOG_ROTATE_BYTES = 10 * 1024 * 1024  # Size at which activity.log is rotated when LOG_ROTATE is "size"
+LOG_COMPRESS_ROTATED = True  # gzip rotated activity.log segments
+REPORT_GROUP_THRESHOLD = 85  # token_sort score at which unavailable requests are reported as one song
+REPORT_MAX_QUERIES = 50000  # Distinct unavailable queries tracked by the report (up to twice this between trims); rarer ones are dropped
+REPORT_GROUP_CANDIDATES = 10  # Near-duplicate grouping looks at this many times as many queries as are reported
 
 # KaraokeNerds settings
 KARAOKENERDS_SEARCH_URL = "https://www.karaokenerds.com/Search"
+HTML_PARSER = "auto"  # Results page parser: "auto", "lxml", "strained" or "soup"
+SCRAPE_CACHE_ENABLED = True  # Keep parsed search results on disk between lookups
+SCRAPE_CACHE_TTL = 7 * 24 * 3600  # Seconds before a cached result is revalidated
+SCRAPE_CACHE_NEGATIVE_TTL = 6 * 3600  # Seconds before a cached "no results" is retried
+SCRAPE_CACHE_MAX_ENTRIES = 20000  # Least recently used queries are evicted past this
+CATALOG_ENABLED = True  # Answer searches from CATALOG_PATH, once `python -m karaoke_triage.catalog crawl` has built it
+CATALOG_MATCH_THRESHOLD = 90  # token_sort score of "title artist" a mirrored song needs to answer a search without the site
+CATALOG_MAX_CANDIDATES = 200  # Songs shortlisted by the mirror's full-text index before fuzzy scoring
+CATALOG_MAX_AGE = 14 * 24 * 3600  # Seconds before a crawled page is due to be fetched again
+CATALOG_CRAWL_RATE = 0.5  # Requests per second while crawling; deliberately gentler than RATE_LIMIT_PER_SECOND
+CATALOG_CRAWL_CONCURRENCY = 2  # Pages fetched at once while crawling
+CATALOG_CRAWL_MAX_PAGES = 500  # Pages fetched per crawl run; the rest wait for the next run
+CATALOG_CRAWL_DEPTH = 1  # Artists found on a seed page are crawled this many levels deep
+CATALOG_MAX_ATTEMPTS = 3  # Failed fetches of a page before it waits for CATALOG_MAX_AGE
+HTTP_TIMEOUT = 10.0  # Seconds before a KaraokeNerds request is abandoned
+HTTP_MAX_CONNECTIONS = 4  # Connection pool size of the async scraper
+HTTP_MAX_RETRIES = 3  # Retries after a timeout, connection error, 429 or 5xx
+HTTP_BACKOFF_BASE = 0.5  # Seconds; retry n waits a random time up to base * 2**n
+HTTP_MAX_RETRY_AFTER = 2.0  # Longest Retry-After a query waits out; beyond it the query falls back to a stale cached answer
+RATE_LIMIT_PER_SECOND = 2.0  # Sustained requests per second to one host
+RATE_LIMIT_BURST = 4  # Requests allowed back to back before the rate limit applies
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 
-# Ensure directories exist
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-DOWNLOADS_DIR.mkdir(parents=True, exist_ok=True)
+# Download queue settings
+DOWNLOAD_WORKERS = 2  # Downloads running at the same time
+DOWNLOAD_MAX_RETRIES = 3  # Retries after a failed download
+DOWNLOAD_BACKOFF_BASE = 5.0  # Seconds; retry n waits about base * 2**(n-1)
+PROGRESS_MAX_RATE = 4.0  # Download progress reports per second per download; hook calls in between are coalesced
+PROGRESS_SPEED_SMOOTHING = 0.3  # Weight of the newest sample in the smoothed download speed
+DOWNLOAD_FILENAME = "%(title)s [%(id)s].%(ext)s"  # yt-dlp output template inside DOWNLOADS_DIR
+ARTIFACT_CHECKSUMS = True  # Record a SHA-256 of every downloaded file in ARTIFACT_INDEX_PATH
+BATCH_CONCURRENCY = 8  # Queries resolved at once by `python -m karaoke_triage.batch`
+
+# Library scanner settings
+LIBRARY_ROOTS = []  # Folders scanned besides DOWNLOADS_DIR, e.g. [Path("/media/karaoke")]
+LIBRARY_EXTENSIONS = (".mp4", ".mkv", ".webm", ".avi", ".mov", ".mp3", ".m4a", ".zip")
+LIBRARY_SCAN_WORKERS = 8  # Threads listing directories and reading file metadata
+LIBRARY_SCAN_HASH = False  # SHA-256 new and changed files to find duplicates (reads every byte once)
+LIBRARY_SCAN_INTERVAL = 300  # Seconds between background rescans in the TUI; 0 turns them off
+
+# Prefetch settings
+PREFETCH_ENABLED = True  # Resolve songs the activity log keeps asking for while the app is idle
+PREFETCH_IDLE_SECONDS = 30  # Quiet time after the last search before prefetching starts
+PREFETCH_INTERVAL = 600  # Seconds between prefetch passes
+PREFETCH_MAX_QUERIES = 20  # Searches per pass
+PREFETCH_CANDIDATE_FACTOR = 5  # Queries grouped per pass, as a multiple of PREFETCH_MAX_QUERIES
+PREFETCH_MIN_REQUESTS = 2  # Times an unavailable song must have been asked for
+PREFETCH_RECENT_WINDOW = 7 * 24 * 3600  # Songs unavailable this recently are retried even if asked for once
+PREFETCH_RETRY_AFTER = 24 * 3600  # Seconds before the same song is prefetched again
+PREFETCH_DOWNLOAD = False  # Also download the first version found
+PREFETCH_MAX_BYTES = 2 * 1024 ** 3  # Disk space prefetched downloads may take in total
+PREFETCH_DAILY_BYTES = 500 * 1024 ** 2  # Bytes prefetching may download per day
+
+# Shared service
+# "auto" uses a running `python -m karaoke_triage.service` if there is one and
+# otherwise keeps everything in the TUI's own process; "local" never looks
+# for the service; "remote" refuses to start without it.
+SERVICE_MODE = "auto"
+SERVICE_HOST = "127.0.0.1"  # The service has no authentication; keep it on loopback
+SERVICE_PORT = 8766
+SERVICE_CONNECT_TIMEOUT = 0.3  # Seconds the TUI waits for the service's health check
+SERVICE_REQUEST_TIMEOUT = 10  # Seconds a client waits for a reply that is not streamed
+SERVICE_STREAM_TIMEOUT = 300  # Seconds a client waits between lines of a streamed /resolve or /search reply
+SERVICE_EVENT_WAIT = 20  # Seconds a client's download event poll is held open
+
+# Diagnostics
+METRICS_ENABLED = True  # Time pipeline stages into in-process histograms (Ctrl+T in the TUI shows them)
+METRICS_EXPORT_PATH = None  # Path of a Prometheus text file rewritten every METRICS_EXPORT_INTERVAL seconds
+METRICS_EXPORT_INTERVAL = 15
+METRICS_HTTP_PORT = None  # Serve Prometheus text at http://127.0.0.1:<port>/metrics
+DEBUG_LOG_LEVEL = "WARNING"  # Level written to DEBUG_LOG_PATH; "DEBUG" traces every download step
+PROFILE_OPERATIONS = 10  # Queries and downloads one capture covers (Ctrl+R in the TUI arms one)
+PROFILE_MODE = "sample"  # "sample" only samples stacks; "cprofile" also traces every call, at a cost
+PROFILE_SAMPLE_INTERVAL = 0.005  # Seconds between stack samples while a capture runs
+PROFILE_TOP_ALLOCATIONS = 25  # Allocation sites listed in a capture's allocations.txt
+# Directories are created by whatever first writes into them, not on import.
@@ -1,53 +1,337 @@
-import csv
-from datetime import datetime
+import heapq
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
 from pathlib import Path
-from typing import List, Optional
-from rapidfuzz import fuzz
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+from rapidfuzz import fuzz, process
 
-from .config import DATABASE_PATH
-from .models import Song
+from .columns import SongColumns
+from .config import (
+    DATABASE_BACKEND,
+    FUZZY_MATCH_THRESHOLD,
+    LOCAL_MATCH_SCORER,
+    NEAR_MISS_LIMIT,
+    NEAR_MISS_SCORER,
+    NGRAM_DELTA_MAX,
+    NGRAM_INDEX_MIN_ROWS,
+    NGRAM_INDEX_PERSIST,
+    NGRAM_MAX_CANDIDATES,
+    NGRAM_MAX_POSTINGS,
+    SEARCH_CHUNK_SIZE,
+)
+from .metrics import metrics
+from .models import SearchResult, Song, SongStatus
+from .ngram import TrigramIndex
+from .storage import Row, SongStore, open_store
+
+logger = logging.getLogger(__name__)
+
+# Scorers selectable by name in config.py and SongDatabase.search_many.
+SCORERS = {
+    'ratio': fuzz.ratio,
+    'token_sort': fuzz.token_sort_ratio,
+    'token_set': fuzz.token_set_ratio,
+    'wratio': fuzz.WRatio,
+}
 
 class SongDatabase:
-    def __init__(self, database_path: Path = DATABASE_PATH):
-        self.database_path = database_path
-        self._ensure_database_exists()
-        
-    def _ensure_database_exists(self):
-        if not self.database_path.exists():
-            with open(self.database_path, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['title', 'artist', 'file_path', 'date_downloaded', 'source'])
-    
-    def search(self, query: str, threshold: int = 70) -> Optional[Song]:
-        query = query.lower()
-        best_match = None
-        highest_score = 0
-        
-        with open(self.database_path, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                search_key = f"{row['title']} {row['artist']}".lower()
-                score = fuzz.ratio(query, search_key)
-                
-                if score > highest_score and score >= threshold:
-                    highest_score = score
-                    best_match = Song(
-                        title=row['title'],
-                        artist=row['artist'],
-                        file_path=row['file_path'],
-                        date_downloaded=datetime.fromisoformat(row['date_downloaded']) if row['date_downloaded'] else None,
-                        source=row['source']
-                    )
-        
-        return best_match
-    
-    def add_song(self, song: Song):
-        with open(self.database_path, 'a', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                song.title,
-                song.artist,
-                song.file_path,
-                song.date_downloaded.isoformat() if song.date_downloaded else '',
-                song.source
-            ]) 
\ No newline at end of file
+    def __init__(self, database_path: Optional[Path] = None, backend: str = DATABASE_BACKEND):
+        self.store: SongStore = open_store(backend, database_path)
+        self.database_path = self.store.path
+        self.store.ensure_exists()
+        # In-memory index: one entry per stored row, all sequences kept in step.
+        self._ids = array('q')
+        self._columns = SongColumns()
+        self._keys: List[str] = []
+        self._signature: Optional[Tuple] = None
+        self._ngrams: Optional[TrigramIndex] = None
+        self._generation = 0
+        # Searches run on worker threads; reloads and writes must not interleave.
+        self._lock = threading.RLock()
+
+    @property
+    def ngram_index_path(self) -> Path:
+        return self.database_path.with_name(self.database_path.name + '.trigrams')
+
+    def _load(self):
+        """(Re)build the in-memory index from the store."""
+        self.store.ensure_exists()
+        signature = self.store.signature()
+        ids = array('q')
+        columns = SongColumns()
+        add_id = ids.append
+
+        def rows():
+            for row_id, row in self.store.iter_rows():
+                add_id(row_id)
+                yield row
+
+        columns.extend(rows())
+        artists = columns.artist_names.values
+        keys = [f"{title} {artists[code]}".lower() for title, code in zip(columns.titles, columns.artists)]
+        self._ids = ids
+        self._columns = columns
+        self._keys = keys
+        self._signature = signature
+        self._generation += 1
+        self._load_ngrams()
+
+    def _load_ngrams(self):
+        """Attach a trigram index once the library is large enough to need pruning.
+
+        Stores that can prefilter on their own (SQLite FTS5) do not need one.
+        """
+        if len(self._keys) < NGRAM_INDEX_MIN_ROWS or self.store.supports_prefilter:
+            self._ngrams = None
+            return
+        if NGRAM_INDEX_PERSIST:
+            self._ngrams = TrigramIndex.load(self.ngram_index_path, self._signature, len(self._keys))
+            if self._ngrams is not None:
+                return
+        self._ngrams = TrigramIndex.build(self._keys)
+        self._save_ngrams()
+
+    def _save_ngrams(self):
+        if self._ngrams is None or not NGRAM_INDEX_PERSIST:
+            return
+        try:
+            self._ngrams.save(self.ngram_index_path, self._signature)
+        except OSError as e:
+            logger.warning("Could not save trigram index %s: %s", self.ngram_index_path, e)
+
+    def _save_ngram(self, key: str):
+        """Persist one added key: appended to the delta, or a full save once the delta is long."""
+        if not NGRAM_INDEX_PERSIST:
+            return
+        if self._ngrams.delta_size >= NGRAM_DELTA_MAX:
+            self._save_ngrams()
+            return
+        try:
+            self._ngrams.append_delta(self.ngram_index_path, self._signature, key)
+        except OSError as e:
+            logger.warning("Could not save trigram index %s: %s", self.ngram_index_path, e)
+
+    def _ensure_loaded(self):
+        """Reload the index if the store has changed on disk since the last load."""
+        with self._lock:
+            if self._signature is None or self.store.signature() != self._signature:
+                self._load()
+
+    def load(self) -> None:
+        """Load the index now instead of on the first search.
+
+        Safe to call from a background thread; a search issued meanwhile
+        waits for the load to finish.
+        """
+        with metrics.span('db_load'):
+            self._ensure_loaded()
+
+    def _shortlist(self, query: str) -> Optional[List[int]]:
+        """Positions of rows worth scoring for `query`, or None to score every row."""
+        if len(self._keys) < NGRAM_INDEX_MIN_ROWS:
+            return None
+        if self._ngrams is not None:
+            return self._ngrams.candidates(query, NGRAM_MAX_CANDIDATES, NGRAM_MAX_POSTINGS)
+        row_ids = self.store.candidates(query, NGRAM_MAX_CANDIDATES)
+        if not row_ids:
+            # Nothing shares a token prefix (typos); fall back to a full scan.
+            return None
+        positions = []
+        for row_id in row_ids:
+            position = bisect_left(self._ids, row_id)
+            if position < len(self._ids) and self._ids[position] == row_id:
+                positions.append(position)
+        return positions
+
+    def _make_song(self, index: int) -> Song:
+        return self._columns.song(index)
+
+    def _rank(
+        self,
+        query: str,
+        k: int,
+        scorer: Callable,
+        threshold: float,
+        positions: Optional[Sequence[int]] = None,
+        deadline: Optional[float] = None,
+    ) -> List[Tuple[float, int]]:
+        """Return up to `k` (score, position) pairs, best first, earlier rows winning ties.
+
+        Rows are scored a chunk at a time. Once `k` results are held, the k-th
+        best score becomes the cutoff for later chunks (rapidfuzz skips work
+        below it), and scoring stops as soon as all `k` results are perfect,
+        or when the `deadline` (a time.perf_counter() value) has passed.
+        Only `positions` are scored when given.
+        """
+        shortlist = self._shortlist(query) if positions is None else positions
+        positions = range(len(self._keys)) if shortlist is None else shortlist
+        keys = self._keys
+
+        if k == 1:
+            choices = keys if shortlist is None else {i: keys[i] for i in shortlist}
+            match = process.extractOne(query, choices, scorer=scorer, processor=None, score_cutoff=threshold)
+            return [] if match is None else [(match[1], match[2])]
+
+        heap: List[Tuple[float, int]] = []  # min-heap of (score, -position)
+        cutoff = threshold
+        for start in range(0, len(positions), SEARCH_CHUNK_SIZE):
+            chunk = positions[start:start + SEARCH_CHUNK_SIZE]
+            choices = {i: keys[i] for i in chunk}
+            for _, score, position in process.extract(
+                query, choices, scorer=scorer, processor=None, limit=k, score_cutoff=cutoff
+            ):
+                if len(heap) < k:
+                    heapq.heappush(heap, (score, -position))
+                elif score > heap[0][0]:
+                    heapq.heapreplace(heap, (score, -position))
+            if len(heap) == k:
+                cutoff = max(cutoff, heap[0][0])
+                if cutoff >= 100:
+                    break
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+        return sorted(((score, -neg) for score, neg in heap), key=lambda pair: (-pair[0], pair[1]))
+
+    def search(self, query: str, threshold: int = FUZZY_MATCH_THRESHOLD) -> Optional[Song]:
+        with metrics.span('db_search'), self._lock:
+            self._ensure_loaded()
+            ranked = self._rank(query.lower(), 1, SCORERS[LOCAL_MATCH_SCORER], threshold)
+            if not ranked:
+                return None
+            _, index = ranked[0]
+            return self._make_song(index)
+
+    def search_many(
+        self,
+        query: str,
+        k: int = NEAR_MISS_LIMIT,
+        scorer: Union[str, Callable] = NEAR_MISS_SCORER,
+        threshold: float = 0,
+        positions: Optional[Sequence[int]] = None,
+        deadline: Optional[float] = None,
+    ) -> List[SearchResult]:
+        """Return up to `k` local matches ranked by score, with the score as confidence.
+
+        `scorer` is a name from SCORERS or any rapidfuzz-compatible scorer.
+        `positions` (from filter_positions) restricts the rows scored, and
+        `deadline` returns the best found so far once it has passed.
+        """
+        if isinstance(scorer, str):
+            scorer = SCORERS[scorer]
+        with metrics.span('db_search_many'), self._lock:
+            self._ensure_loaded()
+            return [
+                SearchResult(song=self._make_song(index), status=SongStatus.LOCAL, confidence=score)
+                for score, index in self._rank(query.lower(), k, scorer, threshold, positions, deadline)
+            ]
+
+    @property
+    def size(self) -> int:
+        """Songs in the in-memory index; 0 until it has been loaded."""
+        return len(self._keys)
+
+    @property
+    def generation(self) -> int:
+        """Changes whenever the in-memory index changes, invalidating saved positions."""
+        return self._generation
+
+    def filter_positions(
+        self,
+        tokens: Sequence[str],
+        within: Optional[Sequence[int]] = None,
+        deadline: Optional[float] = None,
+    ) -> Tuple[List[int], bool]:
+        """Positions of rows whose search key contains every token.
+
+        Only positions in `within` are checked when given. Returns
+        (positions, complete); complete is False when the `deadline` cut the
+        scan short.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            keys = self._keys
+            candidates = range(len(keys)) if within is None else within
+            matched = []
+            for start in range(0, len(candidates), SEARCH_CHUNK_SIZE):
+                matched.extend(
+                    i for i in candidates[start:start + SEARCH_CHUNK_SIZE]
+                    if all(token in keys[i] for token in tokens)
+                )
+                if deadline is not None and time.perf_counter() > deadline:
+                    return matched, start + SEARCH_CHUNK_SIZE >= len(candidates)
+            return matched, True
+
+    def file_rows(self) -> List[Tuple[int, str]]:
+        """(row id, file_path) of every row that has a file path."""
+        with self._lock:
+            self._ensure_loaded()
+            columns = self._columns
+            rows = []
+            for position, row_id in enumerate(self._ids):
+                path = columns.file_path(position)
+                if path:
+                    rows.append((row_id, path))
+            return rows
+
+    def has_file(self, file_path: Optional[str]) -> bool:
+        """True if some row already points at `file_path`."""
+        if not file_path:
+            return False
+        with self._lock:
+            self._ensure_loaded()
+            return self._columns.find_file(file_path) is not None
+
+    def apply_changes(
+        self,
+        add: Sequence[Song] = (),
+        remove: Sequence[int] = (),
+        paths: Optional[dict] = None,
+    ) -> Tuple[int, int, int]:
+        """Add songs, delete rows by id and move rows to new file paths in one go.
+
+        Ids are those returned by `file_rows`. The index is rebuilt once
+        afterwards rather than per change. Returns (added, removed, moved).
+        """
+        with self._lock:
+            self._ensure_loaded()
+            # Paths and removals first: a CSV store renumbers rows on removal.
+            moved = self.store.set_paths(paths) if paths else 0
+            removed = self.store.remove(remove) if remove else 0
+            added = self.store.add_many(self._song_row(song) for song in add) if add else 0
+            if added or removed or moved:
+                self._load()
+            return added, removed, moved
+
+    @staticmethod
+    def _song_row(song: Song) -> Row:
+        return (
+            song.title,
+            song.artist,
+            song.file_path or '',
+            song.date_downloaded.isoformat() if song.date_downloaded else '',
+            song.source or '',
+        )
+
+    def add_song(self, song: Song) -> bool:
+        """Store a song. Returns False if the backend rejected it as a duplicate."""
+        with self._lock:
+            self._ensure_loaded()
+            row = self._song_row(song)
+            row_id = self.store.add(row)
+            if row_id is None:
+                return False
+            # Keep the index in step with our own write instead of re-reading the store.
+            self._ids.append(row_id)
+            self._columns.append(row)
+            self._keys.append(f"{song.title} {song.artist}".lower())
+            self._signature = self.store.signature()
+            self._generation += 1
+            if self._ngrams is not None:
+                self._ngrams.add(self._keys[-1])
+                self._save_ngram(self._keys[-1])
+            elif len(self._keys) >= NGRAM_INDEX_MIN_ROWS:
+                self._load_ngrams()
+            return True
@@ -0,0 +1,391 @@
+import heapq
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from enum import Enum
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from .artifacts import Artifact, ArtifactIndex, video_id
+from .config import (
+    DOWNLOAD_BACKOFF_BASE,
+    DOWNLOAD_JOBS_PATH,
+    DOWNLOAD_MAX_RETRIES,
+    DOWNLOAD_WORKERS,
+)
+from .downloader import download_youtube_video
+from .metrics import metrics
+from .models import KaraokeVersion, Song
+from .profiling import profiler
+from .progress import DownloadProgress, ProgressThrottle
+
+logger = logging.getLogger(__name__)
+
+JOBS_FORMAT_VERSION = 1
+
+# Lower runs first.
+PRIORITY_NEXT_UP = 0  # the singer about to go on stage
+PRIORITY_NORMAL = 10
+PRIORITY_PREFETCH = 20  # guesses by the prefetcher wait behind every request
+
+
+class JobState(Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+ACTIVE_STATES = (JobState.PENDING, JobState.RUNNING)
+
+
+@dataclass
+class DownloadJob:
+    id: str
+    title: str
+    artist: str
+    provider: str
+    url: str
+    priority: int = PRIORITY_NORMAL
+    state: JobState = JobState.PENDING
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    not_before: float = 0.0  # time.time() before which a retry is not started
+    file_path: Optional[str] = None  # where the finished download is
+    requested_by: Optional[str] = None  # recorded in the activity log when the download finishes
+    progress: Optional[DownloadProgress] = None  # latest report while running
+
+    @classmethod
+    def for_version(
+        cls,
+        version: KaraokeVersion,
+        priority: int = PRIORITY_NORMAL,
+        requested_by: Optional[str] = None,
+    ) -> 'DownloadJob':
+        return cls(
+            id=uuid.uuid4().hex[:12],
+            title=version.title,
+            artist=version.artist,
+            provider=version.provider,
+            url=version.youtube_link,
+            priority=priority,
+            requested_by=requested_by,
+        )
+
+    @property
+    def version(self) -> KaraokeVersion:
+        return KaraokeVersion(self.title, self.artist, self.provider, self.url)
+
+    @property
+    def video_id(self) -> Optional[str]:
+        return video_id(self.url)
+
+    @property
+    def key(self) -> str:
+        """What makes two jobs the same download: the video ID, else the URL."""
+        return self.video_id or self.url
+
+    def to_song(self) -> Song:
+        """Library entry for a finished download."""
+        return Song(
+            title=self.title,
+            artist=self.artist,
+            file_path=self.file_path or str(self.url),
+            date_downloaded=datetime.now(),
+            source=self.provider
+        )
+
+    @property
+    def active(self) -> bool:
+        return self.state in ACTIVE_STATES
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data['state'] = self.state.value
+        del data['progress']
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'DownloadJob':
+        data = dict(data)
+        data['state'] = JobState(data['state'])
+        return cls(**data)
+
+
+class DownloadManager:
+    """Background download queue around `download_youtube_video`.
+
+    Up to `workers` downloads run at once, lowest priority number first and
+    first come first served within a priority. Jobs are keyed by YouTube
+    video ID, so however a video is linked, submitting one that is already
+    queued or downloading returns the existing job (raising its priority if
+    needed) instead of downloading it twice, and one that `artifacts` says
+    is already on disk comes back finished without downloading anything. A
+    failed download is retried up to `max_retries` times after a jittered,
+    growing delay.
+
+    Unfinished jobs are kept in `jobs_path` and picked up again by the next
+    manager, so quitting or crashing mid-download only restarts that download.
+    `on_update` is called with the job, from a worker thread, whenever a job
+    changes state or reports progress.
+    """
+
+    def __init__(
+        self,
+        download: Callable[..., Optional[Path]] = download_youtube_video,
+        jobs_path: Optional[Path] = DOWNLOAD_JOBS_PATH,
+        artifacts: Optional[ArtifactIndex] = None,
+        workers: int = DOWNLOAD_WORKERS,
+        max_retries: int = DOWNLOAD_MAX_RETRIES,
+        backoff_base: float = DOWNLOAD_BACKOFF_BASE,
+        on_update: Optional[Callable[[DownloadJob], None]] = None,
+    ):
+        self.download = download
+        self.jobs_path = jobs_path
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.on_update = on_update
+        self.artifacts = artifacts if artifacts is not None else ArtifactIndex()
+        self.jobs: Dict[str, DownloadJob] = {}
+        self._by_key: Dict[str, str] = {}  # job key -> id of the active job
+        self._ready: List[Tuple[int, int, str]] = []  # (priority, seq, job id)
+        self._delayed: List[Tuple[float, int, str]] = []  # (not_before, seq, job id)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+        self._load()
+
+    # -- persistence -------------------------------------------------------
+
+    def _load(self) -> None:
+        if self.jobs_path is None or not self.jobs_path.exists():
+            return
+        try:
+            with open(self.jobs_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable download queue %s: %s", self.jobs_path, e)
+            return
+        if data.get('version') != JOBS_FORMAT_VERSION:
+            return
+        for item in data.get('jobs', []):
+            job = DownloadJob.from_dict(item)
+            # A job that was running when the last session ended starts over.
+            job.state = JobState.PENDING
+            self.jobs[job.id] = job
+            self._by_key[job.key] = job.id
+            self._schedule(job)
+
+    def _save(self) -> None:
+        """Write the unfinished jobs; call with the lock held."""
+        if self.jobs_path is None:
+            return
+        self.jobs_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.jobs_path.with_name(self.jobs_path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'version': JOBS_FORMAT_VERSION,
+                'jobs': [job.to_dict() for job in self.jobs.values() if job.active],
+            }, f, indent=1)
+        tmp_path.replace(self.jobs_path)
+
+    # -- scheduling --------------------------------------------------------
+
+    def _schedule(self, job: DownloadJob) -> None:
+        if job.not_before > time.time():
+            heapq.heappush(self._delayed, (job.not_before, next(self._seq), job.id))
+        else:
+            heapq.heappush(self._ready, (job.priority, next(self._seq), job.id))
+
+    def _next_job(self) -> Optional[DownloadJob]:
+        """Block until a job is due; None once the manager is closed."""
+        with self._cond:
+            while not self._closed:
+                now = time.time()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, _, job_id = heapq.heappop(self._delayed)
+                    job = self.jobs.get(job_id)
+                    if job is not None and job.state is JobState.PENDING:
+                        heapq.heappush(self._ready, (job.priority, next(self._seq), job_id))
+                while self._ready:
+                    priority, _, job_id = heapq.heappop(self._ready)
+                    job = self.jobs.get(job_id)
+                    # Stale heap entries are left behind by cancels and priority bumps.
+                    if (job is None or job.state is not JobState.PENDING
+                            or job.priority != priority or job.not_before > now):
+                        continue
+                    job.state = JobState.RUNNING
+                    job.attempts += 1
+                    job.progress = None
+                    self._save()
+                    return job
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._cond.wait(timeout)
+            return None
+
+    def _notify(self, job: DownloadJob) -> None:
+        if self.on_update is not None:
+            self.on_update(job)
+
+    def _run(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            logger.debug("job %s started (attempt %d): %s", job.id, job.attempts, job.url)
+            self._notify(job)
+
+            def report(progress: DownloadProgress, job=job) -> None:
+                job.progress = progress
+                self._notify(job)
+
+            artifact = self.artifacts.get(job.video_id)
+            if artifact is not None:
+                # Downloaded under another job since this one was queued.
+                self._reuse(job, artifact)
+                self._finish(job, True, None)
+                self._notify(job)
+                continue
+
+            throttle = ProgressThrottle(report)
+            try:
+                with profiler.operation():
+                    result = self.download(job.url, progress_callback=throttle)
+                success = bool(result)
+                error = None if success else "download failed"
+            except Exception as e:
+                logger.exception("job %s raised", job.id)
+                success, error, result = False, str(e), None
+            logger.debug("job %s %s after %d progress hooks, %d reports",
+                         job.id, "finished" if success else "failed", throttle.calls, throttle.reports)
+            metrics.inc('download_bytes_total', throttle.finished_bytes)
+            metrics.inc('downloads_succeeded_total' if success else 'downloads_failed_total')
+            if success:
+                self._record(job, result)
+            self._finish(job, success, error)
+            self._notify(job)
+
+    def _record(self, job: DownloadJob, result: Union[Path, str, bool]) -> None:
+        """Note where a finished download went and add it to the artifact index."""
+        if not isinstance(result, (Path, str)):
+            return
+        job.file_path = str(result)
+        if job.video_id is None:
+            return
+        try:
+            artifact = self.artifacts.record(job.video_id, Path(result))
+        except OSError as e:
+            logger.warning("Could not index %s for job %s: %s", result, job.id, e)
+            return
+        job.file_path = artifact.path
+
+    def _reuse(self, job: DownloadJob, artifact: Artifact) -> None:
+        logger.debug("job %s reuses %s", job.id, artifact.path)
+        job.file_path = artifact.path
+        metrics.inc('downloads_reused_total')
+
+    def _finish(self, job: DownloadJob, success: bool, error: Optional[str]) -> None:
+        with self._cond:
+            job.error = error
+            if success:
+                job.state = JobState.DONE
+            elif job.attempts <= self.max_retries:
+                job.state = JobState.PENDING
+                delay = random.uniform(0.5, 1.0) * self.backoff_base * 2 ** (job.attempts - 1)
+                job.not_before = time.time() + delay
+                logger.info("job %s failed (%s), retrying in %.1fs", job.id, error, delay)
+                self._schedule(job)
+                self._cond.notify()
+            else:
+                job.state = JobState.FAILED
+                logger.warning("job %s gave up after %d attempts: %s", job.id, job.attempts, job.url)
+            if not job.active and self._by_key.get(job.key) == job.id:
+                del self._by_key[job.key]
+            self._save()
+
+    # -- public API --------------------------------------------------------
+
+    def start(self) -> 'DownloadManager':
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"download-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self) -> None:
+        """Stop taking new jobs. Downloads in progress are resumed next session."""
+        with self._cond:
+            self._closed = True
+            self.on_update = None
+            self._cond.notify_all()
+
+    def submit(
+        self,
+        version: KaraokeVersion,
+        priority: int = PRIORITY_NORMAL,
+        requested_by: Optional[str] = None,
+    ) -> Tuple[DownloadJob, bool]:
+        """Queue a download; returns (job, created).
+
+        A version whose video is already queued or downloading returns that
+        job with `created` False, moved up to `priority` if that is more
+        urgent. A video that is already downloaded returns a new job that is
+        DONE straight away, without on_update being called.
+        """
+        with self._cond:
+            job_id = self._by_key.get(video_id(version.youtube_link) or version.youtube_link)
+            if job_id is not None:
+                job = self.jobs[job_id]
+                if priority < job.priority:
+                    job.priority = priority
+                    if job.state is JobState.PENDING and job.not_before <= time.time():
+                        self._schedule(job)
+                    self._save()
+                return job, False
+
+            job = DownloadJob.for_version(version, priority, requested_by)
+            self.jobs[job.id] = job
+            artifact = self.artifacts.get(job.video_id)
+            if artifact is not None:
+                self._reuse(job, artifact)
+                job.state = JobState.DONE
+                return job, True
+            self._by_key[job.key] = job.id
+            self._schedule(job)
+            self._save()
+            self._cond.notify()
+        return job, True
+
+    def cancel(self, job_id: str) -> bool:
+        """Drop a job that has not started; running downloads cannot be cancelled."""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None or job.state is not JobState.PENDING:
+                return False
+            job.state = JobState.CANCELLED
+            self._by_key.pop(job.key, None)
+            self._save()
+        return True
+
+    def snapshot(self) -> List[DownloadJob]:
+        """All jobs of this session, running first, then in the order they will run."""
+        order = {JobState.RUNNING: 0, JobState.PENDING: 1}
+        with self._cond:
+            return sorted(
+                self.jobs.values(),
+                key=lambda job: (order.get(job.state, 2), job.priority, job.created_at),
+            )
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return sum(1 for job in self.jobs.values() if job.active)
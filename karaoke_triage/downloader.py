@@ -1,57 +1,60 @@
-# import json
-# import os
+import logging
 from pathlib import Path
-# import subprocess
 from typing import Optional, Callable
-from yt_dlp import YoutubeDL
 
-from .config import DOWNLOADS_DIR
+from .config import DOWNLOAD_FILENAME, DOWNLOADS_DIR
+from .metrics import metrics
 
+logger = logging.getLogger(__name__)
 
-# def progress_hook(d):
-#     # TODO Use this to show a progress bar modal
-#     with open('/Users/sean/hook-format.txt', 'a') as f:
-#         f.write(json.dumps(d))
-#         f.write('\n-----------------\n')
 
+def downloaded_path(info: dict) -> Optional[Path]:
+    """The final file yt-dlp wrote, from the info dict of a finished download.
+
+    After merging video and audio the file is in requested_downloads;
+    single-file formats also carry it as `filepath`.
+    """
+    for entry in info.get('requested_downloads') or ():
+        if entry.get('filepath'):
+            return Path(entry['filepath'])
+    if info.get('filepath'):
+        return Path(info['filepath'])
+    if info.get('_filename'):
+        return Path(info['_filename'])
+    return None
+
+
+def download_youtube_video(url: str, output_path: Optional[Path] = None, progress_callback: Optional[Callable] = None) -> Optional[Path]:
+    """Download a YouTube video using yt-dlp; returns the file written, or None on failure.
+
+    `progress_callback` is installed as a yt-dlp progress hook and receives
+    every raw hook dict; wrap it in a progress.ProgressThrottle to rate-limit it.
+    """
+    from yt_dlp import YoutubeDL  # slow to import; only load it once something is downloaded
 
-def download_youtube_video(url: str, output_path: Optional[Path] = None, progress_callback: Optional[Callable] = None) -> bool:
-    """Download a YouTube video using yt-dlp."""
-    # p = Path(os.path.expanduser('~/kldssdkljffdsklj.txt'))
     if output_path is None:
-        output_path = DOWNLOADS_DIR / "%(title)s.%(ext)s"
-
-    def progress_hook(d):
-        # Only call progress_callback if we have fragment information
-        if progress_callback and 'downloaded_bytes' in d and 'total_bytes' in d:
-            # with open(p, 'a') as f:
-            #     f.write('1a\n')
-            progress_callback(d)
-        # else:
-        #     if progress_callback:
-        #         cond1 = True
-        #     else:
-        #         cond1 = False
-        #     cond2 = 'fragment_index' in d
-        #     cond3 = 'fragment_count' in d
-        #     # with open(p, 'a') as f:
-        #     #     # f.write(f'2a x={cond1}, y={cond2}, z={cond3}\n')
-        #     #     f.write(f'{json.dumps(d)}')
+        output_path = DOWNLOADS_DIR / DOWNLOAD_FILENAME
 
     ydl_opts = {
         'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]',
         'outtmpl': str(output_path),
-        'progress_hooks': [progress_hook],
+        'progress_hooks': [progress_callback] if progress_callback else [],
         'merge_output_format': 'mp4',
         'noplaylist': True,
+        'quiet': True,
+        'noprogress': True,
     }
 
     try:
-        # with open(p, 'a') as f:
-        #     f.write('xa\n')
-        with YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
-        return True
+        logger.debug("yt-dlp download %s -> %s", url, output_path)
+        with metrics.span('download'), YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=True)
+        path = downloaded_path(info or {})
+        logger.debug("yt-dlp finished %s -> %s", url, path)
+        if path is None or not path.exists():
+            logger.error("yt-dlp reported no output file for %s", url)
+            return None
+        return path
     except Exception as e:
-        print(f"Error downloading video: {e}")
-        return False
+        logger.error("Error downloading video %s: %s", url, e)
+        return None
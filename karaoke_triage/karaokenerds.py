@@ -1,83 +1,81 @@
 import requests
-from bs4 import BeautifulSoup
 import sys
 from typing import List, Optional
 from urllib.parse import quote_plus
 
-from .config import KARAOKENERDS_SEARCH_URL, USER_AGENT
+from .cache import ScrapeCache
+from .catalog import CatalogMirror, open_catalog
+from .config import CATALOG_ENABLED, HTTP_TIMEOUT, KARAOKENERDS_SEARCH_URL, SCRAPE_CACHE_ENABLED, USER_AGENT
+from .metrics import metrics
 from .models import KaraokeVersion
+from .parsers import ResultsParser, get_parser
 
 class KaraokeNerdsScraper:
-    def __init__(self):
+    def __init__(
+        self,
+        cache: Optional[ScrapeCache] = None,
+        parser: Optional[ResultsParser] = None,
+        search_url: str = KARAOKENERDS_SEARCH_URL,
+        use_cache: bool = SCRAPE_CACHE_ENABLED,
+        catalog: Optional[CatalogMirror] = None,
+        use_catalog: bool = CATALOG_ENABLED,
+    ):
         self.session = requests.Session()
         self.session.headers.update({'User-Agent': USER_AGENT})
+        self.parser = parser or get_parser()
+        if cache is None and use_cache:
+            cache = ScrapeCache()
+        self.cache = cache
+        if catalog is None and use_catalog:
+            catalog = open_catalog()
+        self.catalog = catalog
+        self.search_url = search_url
 
     def search(self, query: str) -> List[KaraokeVersion]:
         """Search KaraokeNerds and return all available versions."""
+        entry = None
+        headers = {}
+        if self.cache:
+            entry, fresh = self.cache.lookup(query)
+            if fresh:
+                return entry.versions
+            if entry is not None:
+                headers = entry.conditional_headers()
+        if self.catalog is not None:
+            versions = self.catalog.lookup(query)
+            if versions:
+                return versions
+
         encoded_query = quote_plus(query)
-        url = f"{KARAOKENERDS_SEARCH_URL}?query={encoded_query}"
-        versions = []
+        url = f"{self.search_url}?query={encoded_query}"
 
         try:
-            response = self.session.get(url)
+            with metrics.span('scrape_http'):
+                response = self.session.get(url, headers=headers, timeout=HTTP_TIMEOUT)
+            if response.status_code == 304 and entry is not None:
+                self.cache.stats.revalidated += 1
+                self.cache.touch(query)
+                return entry.versions
             response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # Find all group rows
-            group_rows = soup.find_all('tr', class_='group')
-
-            for group in group_rows:
-                tds = group.find_all('td')
-                # Extract song metadata from the group row
-                title_td, artist_td, details_td = tds
-                title = title_td.get_text(strip=True)
-                artist = artist_td.get_text(strip=True)
-                details = details_td.get_text(strip=True)
-
-                # Find the corresponding details row
-                details = group.find_next_sibling('tr', class_='details')
-                if not details:
-                    continue
-
-                # Find all versions in the details section
-                version_items = details.find_all('li', class_='track')
-                
-                for item in version_items:
-
-                    span = item.find('span', title='You can watch this version online')
-                    if not span:
-                        # No watchable link, skipping
-                        continue
-
-                    link = span.parent
-
-                    if not link:
-                        continue
-                        
-                    href = link.get('href')
-                    if not (href and ('youtube.com' in href or 'youtu.be' in href)):
-                        continue
-
-                    # Extract provider name
-                    provider = "Unknown"
-                    provider_elems = item.find_all('span', class_='badge')
-                    assert len(provider_elems) == 1
-                    provider_elem = provider_elems[0]
-                    if provider_elem:
-                        provider = provider_elem.get_text(strip=True)
-
-                    versions.append(KaraokeVersion(
-                        title=title,
-                        artist=artist,
-                        provider=provider,
-                        youtube_link=href
-                    ))
-
+            with metrics.span('scrape_parse'):
+                versions = self.parse(response.text)
+            if self.cache:
+                self.cache.put(
+                    query,
+                    versions,
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified'),
+                )
             return versions
 
         except requests.RequestException as e:
             print(f"Error searching KaraokeNerds: {e}")
-            return []
+            # A stale answer beats none when the site is unreachable.
+            return entry.versions if entry is not None else []
+
+    def parse(self, html: str) -> List[KaraokeVersion]:
+        """Extract the watchable versions from a search results page."""
+        return self.parser.parse(html)
 
 
 def search(scraper, query):
@@ -109,6 +107,9 @@ def main(args):
 
             search(scraper, query)
 
+    if scraper.cache:
+        print(f"\nCache: {scraper.cache.stats.as_dict()}")
+
 
 if __name__ == '__main__':
     main(sys.argv)
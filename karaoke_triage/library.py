@@ -0,0 +1,348 @@
+"""Keep the song library in step with the files on disk.
+
+    python -m karaoke_triage.library
+    python -m karaoke_triage.library --hash --dry-run
+
+The scanner walks DOWNLOADS_DIR and LIBRARY_ROOTS on a thread pool, one
+directory listing per task, and remembers the size and mtime of every file
+it saw in LIBRARY_SCAN_STATE_PATH. On the next scan a file whose size and
+mtime are unchanged is taken from that state as is, so only new and changed
+files are hashed (with --hash / LIBRARY_SCAN_HASH) or otherwise looked at.
+
+`reconcile` then brings the database in line with the scan in one bulk
+write: files nobody has recorded are added, rows whose file is gone are
+removed, and a row whose file was renamed or moved within the roots (same
+inode, or same checksum) has its path updated instead. Rows whose file_path
+is not under a scanned root, such as YouTube links recorded by older
+versions, are left alone. A root that is missing (an unplugged drive) is
+skipped rather than treated as empty.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .artifacts import file_checksum
+from .config import (
+    DOWNLOADS_DIR,
+    LIBRARY_EXTENSIONS,
+    LIBRARY_ROOTS,
+    LIBRARY_SCAN_HASH,
+    LIBRARY_SCAN_STATE_PATH,
+    LIBRARY_SCAN_WORKERS,
+)
+from .database import SongDatabase
+from .metrics import metrics
+from .models import Song
+
+logger = logging.getLogger(__name__)
+
+STATE_FORMAT_VERSION = 1
+
+# Files modified more recently than this may still be being written.
+SETTLE_SECONDS = 30
+
+# yt-dlp's partial and per-format intermediate files, e.g. "x.f137.mp4"
+PARTIAL_FILE = re.compile(r'\.(part|ytdl|temp)$|\.f\d+\.\w+$', re.IGNORECASE)
+VIDEO_ID_SUFFIX = re.compile(r'\s*\[[A-Za-z0-9_-]{11}\]$')
+KARAOKE_TAG = re.compile(r'\s*[(\[][^)\]]*karaoke[^)\]]*[)\]]', re.IGNORECASE)
+
+
+@dataclass
+class FileEntry:
+    path: str
+    size: int
+    mtime_ns: int
+    inode: Tuple[int, int]  # (st_dev, st_ino), to recognise a renamed file
+    sha256: Optional[str] = None
+
+    @classmethod
+    def from_stat(cls, path: str, st: os.stat_result) -> 'FileEntry':
+        return cls(path, st.st_size, st.st_mtime_ns, (st.st_dev, st.st_ino))
+
+    def same_file(self, other: 'FileEntry') -> bool:
+        if self.size != other.size:
+            return False
+        if self.sha256 and other.sha256:
+            return self.sha256 == other.sha256
+        return tuple(self.inode) == tuple(other.inode)
+
+
+@dataclass
+class ScanResult:
+    roots: List[Path]  # the roots that could be read
+    entries: Dict[str, FileEntry]
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: Dict[str, FileEntry] = field(default_factory=dict)
+    unchanged: int = 0
+    hashed: int = 0
+    elapsed: float = 0.0
+
+    def duplicates(self) -> List[List[str]]:
+        """Paths of files with the same checksum, for files that were hashed."""
+        by_hash: Dict[str, List[str]] = {}
+        for entry in self.entries.values():
+            if entry.sha256:
+                by_hash.setdefault(entry.sha256, []).append(entry.path)
+        return [sorted(paths) for paths in by_hash.values() if len(paths) > 1]
+
+    def describe(self) -> str:
+        return (f"{len(self.entries):,} files in {self.elapsed:.2f}s: {len(self.added)} new, "
+                f"{len(self.changed)} changed, {len(self.removed)} gone, {self.unchanged:,} unchanged"
+                + (f", {self.hashed} hashed" if self.hashed else ""))
+
+
+@dataclass
+class ReconcileReport:
+    added: int = 0
+    removed: int = 0
+    moved: int = 0
+    duplicates: List[List[str]] = field(default_factory=list)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.removed or self.moved)
+
+    def describe(self) -> str:
+        text = f"library: {self.added} added, {self.removed} removed, {self.moved} moved"
+        if self.duplicates:
+            text += f", {len(self.duplicates)} sets of duplicate files"
+        return text
+
+
+def default_roots() -> List[Path]:
+    return [DOWNLOADS_DIR, *LIBRARY_ROOTS]
+
+
+def is_under(path: str, roots: Sequence[Path]) -> bool:
+    return any(path == str(root) or path.startswith(str(root) + os.sep) for root in roots)
+
+
+def song_from_filename(path: str, mtime: Optional[float] = None) -> Song:
+    """Best guess at the song in a file named "Artist - Title.mp4".
+
+    The "[video id]" yt-dlp adds and "(Karaoke Version)"-style tags are
+    dropped; a name without " - " becomes the title.
+    """
+    name = Path(path).stem
+    name = VIDEO_ID_SUFFIX.sub('', name)
+    name = KARAOKE_TAG.sub('', name).strip()
+    artist, sep, title = name.partition(' - ')
+    if not sep:
+        artist, title = '', name
+    return Song(
+        title=title.strip(),
+        artist=artist.strip(),
+        file_path=path,
+        date_downloaded=datetime.fromtimestamp(mtime) if mtime else None,
+        source='library',
+    )
+
+
+class LibraryScanner:
+    """Incremental, multi-threaded scan of the library roots."""
+
+    def __init__(
+        self,
+        roots: Optional[Iterable[Path]] = None,
+        state_path: Optional[Path] = LIBRARY_SCAN_STATE_PATH,
+        workers: int = LIBRARY_SCAN_WORKERS,
+        hash_files: bool = LIBRARY_SCAN_HASH,
+        extensions: Sequence[str] = LIBRARY_EXTENSIONS,
+    ):
+        self.roots = [Path(root).expanduser().resolve() for root in (roots if roots is not None else default_roots())]
+        self.state_path = state_path
+        self.workers = workers
+        self.hash_files = hash_files
+        self.extensions = tuple(extension.lower() for extension in extensions)
+        self._state: Optional[Dict[str, FileEntry]] = None
+        self._lock = threading.Lock()  # one scan at a time
+
+    # -- state -------------------------------------------------------------
+
+    def _load_state(self) -> Dict[str, FileEntry]:
+        if self.state_path is None or not self.state_path.exists():
+            return {}
+        try:
+            with open(self.state_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable scan state %s: %s", self.state_path, e)
+            return {}
+        if data.get('version') != STATE_FORMAT_VERSION:
+            return {}
+        entries = {}
+        for item in data.get('files', []):
+            entry = FileEntry(**item)
+            entry.inode = tuple(entry.inode)
+            entries[entry.path] = entry
+        return entries
+
+    def _save_state(self, entries: Dict[str, FileEntry]) -> None:
+        if self.state_path is None:
+            return
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_name(self.state_path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'version': STATE_FORMAT_VERSION,
+                'files': [asdict(entry) for entry in entries.values()],
+            }, f)
+        tmp_path.replace(self.state_path)
+
+    # -- scanning ----------------------------------------------------------
+
+    def _list_dir(self, path: str) -> Tuple[List[str], List[Tuple[str, os.stat_result]]]:
+        """Subdirectories and (path, stat) of the library files in one directory."""
+        dirs, files = [], []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            dirs.append(entry.path)
+                        elif (entry.is_file() and entry.name.lower().endswith(self.extensions)
+                              and not PARTIAL_FILE.search(entry.name)):
+                            files.append((entry.path, entry.stat()))
+                    except OSError:
+                        continue
+        except OSError as e:
+            logger.warning("Could not list %s: %s", path, e)
+        return dirs, files
+
+    def _hash(self, entry: FileEntry) -> FileEntry:
+        try:
+            entry.sha256 = file_checksum(Path(entry.path))
+        except OSError as e:
+            logger.warning("Could not hash %s: %s", entry.path, e)
+        return entry
+
+    def scan(self, save: bool = True) -> ScanResult:
+        """Walk the roots; with `save`, the next scan compares against this one."""
+        with self._lock, metrics.span('library_scan'):
+            return self._scan(save)
+
+    def _scan(self, save: bool) -> ScanResult:
+        start = time.perf_counter()
+        if self._state is None:
+            self._state = self._load_state()
+        previous = self._state
+        roots = [root for root in self.roots if root.is_dir()]
+        for root in self.roots:
+            if root not in roots:
+                logger.info("Library root %s is not available; keeping what was known about it", root)
+        result = ScanResult(roots=roots, entries={})
+        hashing: List[Future] = []
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='library-scan') as pool:
+            pending = {pool.submit(self._list_dir, str(root)) for root in roots}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    dirs, files = future.result()
+                    pending.update(pool.submit(self._list_dir, path) for path in dirs)
+                    for path, st in files:
+                        old = previous.get(path)
+                        if old is not None and old.size == st.st_size and old.mtime_ns == st.st_mtime_ns:
+                            entry = old
+                            result.unchanged += 1
+                        else:
+                            entry = FileEntry.from_stat(path, st)
+                            (result.changed if old is not None else result.added).append(path)
+                        if self.hash_files and entry.sha256 is None:
+                            hashing.append(pool.submit(self._hash, entry))
+                        result.entries[path] = entry
+            for future in hashing:
+                future.result()
+        result.hashed = len(hashing)
+
+        for path, entry in previous.items():
+            if path in result.entries:
+                continue
+            if is_under(path, roots):
+                result.removed[path] = entry
+            elif is_under(path, self.roots):
+                # Under a root that is offline right now.
+                result.entries[path] = entry
+        if save:
+            self._state = result.entries
+            self._save_state(result.entries)
+        result.elapsed = time.perf_counter() - start
+        logger.info("Scanned %s", result.describe())
+        return result
+
+
+def reconcile(
+    database: SongDatabase,
+    result: ScanResult,
+    dry_run: bool = False,
+    settle: float = SETTLE_SECONDS,
+) -> ReconcileReport:
+    """Bring the rows under the scanned roots in line with `result`."""
+    report = ReconcileReport(duplicates=result.duplicates())
+    recorded: Dict[str, int] = {}
+    for row_id, path in database.file_rows():
+        recorded.setdefault(path, row_id)
+    missing = {path: row_id for path, row_id in recorded.items()
+               if is_under(path, result.roots) and path not in result.entries}
+    cutoff = time.time() - settle
+    new = [entry for path, entry in result.entries.items()
+           if path not in recorded and entry.mtime_ns / 1e9 < cutoff]
+
+    # A missing file that turns up under another name is a move, not a
+    # removal plus an addition.
+    paths: Dict[int, str] = {}
+    for path, row_id in missing.items():
+        old = result.removed.get(path)
+        if old is None:
+            continue
+        for i, entry in enumerate(new):
+            if entry.same_file(old):
+                paths[row_id] = entry.path
+                del new[i]
+                break
+    # A row recorded after the walk listed its directory (a download that
+    # finished mid-scan) is missing from `result` but not from the disk.
+    remove = [row_id for path, row_id in missing.items()
+              if row_id not in paths and not os.path.exists(path)]
+    add = [song_from_filename(entry.path, entry.mtime_ns / 1e9) for entry in new]
+
+    if dry_run:
+        report.added, report.removed, report.moved = len(add), len(remove), len(paths)
+    elif add or remove or paths:
+        with metrics.span('library_reconcile'):
+            report.added, report.removed, report.moved = database.apply_changes(add, remove, paths)
+    logger.info("Reconciled %s", report.describe())
+    return report
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m karaoke_triage.library", description=__doc__.splitlines()[0])
+    parser.add_argument("--root", type=Path, action="append", default=[], help="scan this folder too (repeatable)")
+    parser.add_argument("--hash", action="store_true", default=LIBRARY_SCAN_HASH, help="checksum new and changed files to find duplicates")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing to the library")
+    parser.add_argument("--workers", type=int, default=LIBRARY_SCAN_WORKERS)
+    args = parser.parse_args(argv[1:])
+
+    scanner = LibraryScanner(roots=default_roots() + args.root, workers=args.workers, hash_files=args.hash)
+    result = scanner.scan(save=not args.dry_run)
+    print(result.describe())
+    report = reconcile(SongDatabase(), result, dry_run=args.dry_run)
+    print(("would change " if args.dry_run else "") + report.describe())
+    for paths in report.duplicates:
+        print("duplicates:\n  " + "\n  ".join(paths))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,83 @@
+import re
+import threading
+import time
+from typing import List, Optional
+
+from .config import (
+    LIVE_SEARCH_BUDGET_MS,
+    LIVE_SEARCH_LIMIT,
+    LIVE_SEARCH_MIN_CHARS,
+    LIVE_SEARCH_SCORER,
+)
+from .database import SongDatabase
+from .models import SearchResult
+
+
+def query_tokens(query: str) -> List[str]:
+    """Lower-cased words of two or more characters."""
+    return [token for token in re.findall(r'\w+', query.lower()) if len(token) > 1]
+
+
+class LiveMatcher:
+    """Local matches for a query that is still being typed.
+
+    Each update first narrows the library to rows whose search key contains
+    every query word, then ranks those rows. When the new query extends the
+    previous one, the previous candidate rows are a superset of the new ones,
+    so only they are re-checked. If nothing contains every word (typically a
+    typo), the whole library is ranked by fuzzy score instead. Both steps stop
+    at the per-keystroke `budget` and return the best found so far.
+    """
+
+    def __init__(
+        self,
+        database: SongDatabase,
+        limit: int = LIVE_SEARCH_LIMIT,
+        budget: float = LIVE_SEARCH_BUDGET_MS / 1000,
+        scorer: str = LIVE_SEARCH_SCORER,
+    ):
+        self.database = database
+        self.limit = limit
+        self.budget = budget
+        self.scorer = scorer
+        self._lock = threading.Lock()
+        self._query = ''
+        self._candidates: Optional[List[int]] = None
+        self._generation = -1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._query = ''
+            self._candidates = None
+
+    def update(self, query: str) -> List[SearchResult]:
+        deadline = time.perf_counter() + self.budget
+        query = query.strip()
+        with self._lock:
+            if len(query) < LIVE_SEARCH_MIN_CHARS:
+                self._query = ''
+                self._candidates = None
+                return []
+
+            tokens = query_tokens(query)
+            if not tokens:
+                self._query = ''
+                self._candidates = None
+                return self.database.search_many(query, self.limit, self.scorer, deadline=deadline)
+
+            within = None
+            if (self._candidates is not None
+                    and self._generation == self.database.generation
+                    and query.lower().startswith(self._query.lower())):
+                within = self._candidates
+
+            candidates, complete = self.database.filter_positions(tokens, within, deadline)
+            # Only a complete scan is a safe superset for the next keystroke.
+            self._query = query if complete else ''
+            self._candidates = candidates if complete else None
+            self._generation = self.database.generation
+
+            positions = candidates if candidates else None
+            return self.database.search_many(
+                query, self.limit, self.scorer, positions=positions, deadline=deadline
+            )
@@ -1,29 +1,291 @@
+import atexit
 import csv
-from datetime import datetime
+import gzip
+import logging
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Tuple
 
-from .config import LOG_PATH
+from .config import (
+    LOG_COMPRESS_ROTATED,
+    LOG_FLUSH_INTERVAL,
+    LOG_FSYNC,
+    LOG_MAX_BATCH,
+    LOG_PATH,
+    LOG_ROTATE,
+    LOG_ROTATE_BYTES,
+)
 from .models import Song, SongStatus
 
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks; writers still follow rotations
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Logs written before the source column was added have five columns.
+LOG_HEADER = ['timestamp', 'requested_by', 'title', 'artist', 'status', 'source']
+HEADER_BYTES = len(','.join(LOG_HEADER)) + 2  # csv line terminator is \r\n
+
+# activity.log.20240131-235959[-N][.gz]
+SEGMENT_PATTERN = re.compile(r'\.(\d{8}-\d{6})(?:-(\d+))?(\.gz)?$')
+
+_STOP = object()
+
+
 class ActivityLogger:
-    def __init__(self, log_path: Path = LOG_PATH):
+    """Appends request outcomes to activity.log from a background thread.
+
+    `log_activity` only puts the row on a queue, so it never waits for the
+    disk. A writer thread collects rows into batches and writes a batch once
+    `flush_interval` seconds have passed since its first row or `max_batch`
+    rows are waiting, whichever comes first. `close()` (also run at exit)
+    writes whatever is queued.
+
+    Loss bound: a batch is handed to the operating system as soon as it is
+    written, so if the process dies only rows still queued are lost. A row
+    is queued for at most `flush_interval` seconds, unless rows arrive faster
+    than the disk takes them. So a crash loses at most the rows logged in
+    the last `flush_interval` seconds. With `fsync` the same bound holds
+    for a power cut or OS crash.
+
+    With `rotate` set to "size" the log is rotated before it would grow past
+    `rotate_bytes`; with "daily" the first write on a new day rotates it.
+    Rotated segments are named activity.log.YYYYMMDD-HHMMSS and gzipped when
+    `compress` is set. Each segment starts with the CSV header.
+
+    Several processes may log to the same file (TUIs, the service, the
+    batch CLI). Each batch is written, and the log rotated, while holding an
+    advisory lock on activity.log.lock, and a writer reopens the path when
+    it no longer names the file it has open. So no process appends to a
+    segment after it has been rotated away and compressed.
+    """
+
+    def __init__(
+        self,
+        log_path: Path = LOG_PATH,
+        flush_interval: float = LOG_FLUSH_INTERVAL,
+        max_batch: int = LOG_MAX_BATCH,
+        rotate: Optional[str] = LOG_ROTATE,
+        rotate_bytes: int = LOG_ROTATE_BYTES,
+        compress: bool = LOG_COMPRESS_ROTATED,
+        fsync: bool = LOG_FSYNC,
+    ):
+        if rotate not in (None, 'size', 'daily'):
+            raise ValueError(f"Unknown log rotation {rotate!r}; expected None, 'size' or 'daily'")
         self.log_path = log_path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.rotate = rotate
+        self.rotate_bytes = rotate_bytes
+        self.compress = compress
+        self.fsync = fsync
+        self.written = 0
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._file = None
+        self._lock_file = None
+        self._day: Optional[date] = None
+        self._closed = False
         self._ensure_log_exists()
-    
+        self._thread = threading.Thread(target=self._run, name='activity-log', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
     def _ensure_log_exists(self):
         if not self.log_path.exists():
-            with open(self.log_path, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['timestamp', 'requested_by', 'title', 'artist', 'status'])
-    
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                # 'x': another process creating it at the same moment must not be truncated.
+                with open(self.log_path, 'x', newline='') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(LOG_HEADER)
+            except FileExistsError:
+                pass
+
     def log_activity(self, song: Song, status: SongStatus, requested_by: Optional[str] = None):
-        with open(self.log_path, 'a', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                datetime.now().isoformat(),
-                requested_by or 'anonymous',
-                song.title,
-                song.artist,
-                status.value
-            ]) 
\ No newline at end of file
+        self._queue.put((
+            datetime.now().isoformat(),
+            requested_by or 'anonymous',
+            song.title,
+            song.artist,
+            status.value,
+            song.source or ''
+        ))
+
+    def flush(self) -> None:
+        """Block until everything logged so far is written."""
+        if self._closed:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self) -> None:
+        """Write the queued rows and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    # -- writer thread -----------------------------------------------------
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: List[Tuple] = []
+            waiters: List[threading.Event] = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.max_batch:
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._write(batch)
+                except OSError:
+                    logger.exception("Could not write %d activity log rows", len(batch))
+            for waiter in waiters:
+                waiter.set()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    @contextmanager
+    def _locked(self):
+        """Hold the advisory lock shared by every process writing this log."""
+        if fcntl is None:
+            yield
+            return
+        if self._lock_file is None:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            self._lock_file = open(self.log_path.with_name(self.log_path.name + '.lock'), 'a')
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _replaced(self) -> bool:
+        """True when the log path no longer names the open file (another process rotated it)."""
+        try:
+            on_disk = os.stat(self.log_path)
+        except FileNotFoundError:
+            return True
+        held = os.fstat(self._file.fileno())
+        return (on_disk.st_ino, on_disk.st_dev) != (held.st_ino, held.st_dev)
+
+    def _open(self):
+        if self._file is not None and self._replaced():
+            self._file.close()
+            self._file = None
+        if self._file is None:
+            self._ensure_log_exists()
+            self._file = open(self.log_path, 'a', newline='')
+            self._writer = csv.writer(self._file)
+            self._day = date.fromtimestamp(self.log_path.stat().st_mtime)
+        return self._file
+
+    def _write(self, batch: List[Tuple]) -> None:
+        rotated = None
+        with self._locked():
+            f = self._open()
+            if self._should_rotate(f, batch):
+                rotated = self._rotate()
+                f = self._open()
+            self._writer.writerows(batch)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        self._day = date.today()
+        self.written += len(batch)
+        if rotated is not None and self.compress:
+            # Outside the lock: nobody writes to a segment once it is renamed.
+            self._compress_rotated()
+
+    def _should_rotate(self, f, batch: List[Tuple]) -> bool:
+        if f.tell() <= HEADER_BYTES:
+            return False
+        if self.rotate == 'daily':
+            return self._day is not None and self._day != date.today()
+        if self.rotate == 'size':
+            # Rough size of the batch; a segment may overshoot by a few rows.
+            incoming = sum(len(','.join(row)) + 2 for row in batch)
+            return f.tell() + incoming > self.rotate_bytes
+        return False
+
+    def _rotate(self) -> Path:
+        self._file.close()
+        self._file = None
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        rotated = self.log_path.with_name(f"{self.log_path.name}.{stamp}")
+        suffix = 1
+        while rotated.exists() or rotated.with_name(rotated.name + '.gz').exists():
+            rotated = self.log_path.with_name(f"{self.log_path.name}.{stamp}-{suffix}")
+            suffix += 1
+        self.log_path.replace(rotated)
+        logger.info("Rotated %s to %s", self.log_path, rotated)
+        return rotated
+
+    def _compress_rotated(self) -> None:
+        """Compress every rotated segment that is not yet, including any an earlier failure left."""
+        for segment in log_segments(self.log_path):
+            if segment != self.log_path and segment.suffix != '.gz':
+                self._compress(segment)
+
+    def _compress(self, segment: Path) -> None:
+        compressed = segment.with_name(segment.name + '.gz')
+        # Written under a name log_segments ignores, so a crash never leaves a truncated .gz.
+        tmp_path = segment.with_name(f"{compressed.name}.{os.getpid()}.tmp")
+        try:
+            with open(segment, 'rb') as src, gzip.open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            tmp_path.replace(compressed)
+            segment.unlink()
+        except FileNotFoundError:
+            pass  # another process compressed it meanwhile
+        except OSError as e:
+            logger.warning("Could not compress %s; will retry at the next rotation: %s", segment, e)
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+
+
+def log_segments(log_path: Path = LOG_PATH) -> List[Path]:
+    """The rotated segments of `log_path`, oldest first, followed by the live log."""
+    rotated = []
+    for path in log_path.parent.glob(log_path.name + '.*'):
+        match = SEGMENT_PATTERN.fullmatch(path.name[len(log_path.name):])
+        if match:
+            rotated.append((match.group(1), int(match.group(2) or 0), path))
+    segments = [path for _, _, path in sorted(rotated)]
+    if log_path.exists():
+        segments.append(log_path)
+    return segments
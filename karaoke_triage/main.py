@@ -1,8 +1,20 @@
+import logging
+
+from .config import DEBUG_LOG_LEVEL, DEBUG_LOG_PATH
+from .service import connect
 from .tui import KaraokeTriageApp
 
 def main():
-    app = KaraokeTriageApp()
+    # The TUI owns the terminal, so diagnostics go to a file.
+    DEBUG_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(
+        filename=DEBUG_LOG_PATH,
+        level=DEBUG_LOG_LEVEL,
+        format="%(asctime)s %(levelname)s %(threadName)s %(name)s: %(message)s",
+    )
+    # Use the shared service when it is running (see SERVICE_MODE).
+    app = KaraokeTriageApp(connect())
     app.run()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
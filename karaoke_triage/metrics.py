@@ -0,0 +1,201 @@
+"""In-process timing histograms and counters, exportable to Prometheus.
+
+Code under measurement does
+
+    with metrics.span('db_search'):
+        ...
+
+and the shared `metrics` registry keeps a histogram per span name. When the
+registry is disabled (METRICS_ENABLED = False) `span` hands back one shared
+no-op context manager and `observe`/`inc` return immediately, so the
+instrumentation costs an attribute check per call.
+"""
+import bisect
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .config import METRICS_ENABLED
+
+PREFIX = 'ktriage_'
+
+# Bucket upper bounds in seconds: 10 µs to ~2 h, 25% apart, so a quantile
+# read back from the buckets is within 12.5% of the true value.
+BUCKETS: List[float] = []
+_bound = 0.00001
+while _bound < 7200:
+    BUCKETS.append(_bound)
+    _bound *= 1.25
+
+_NOOP = nullcontext()
+
+
+class Histogram:
+    """Fixed log-spaced buckets; quantiles are interpolated within a bucket."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else lower * 1.25
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+
+class _Span:
+    __slots__ = ('registry', 'name', 'start')
+
+    def __init__(self, registry: 'MetricsRegistry', name: str):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self) -> '_Span':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.registry.observe(self.name, time.perf_counter() - self.start)
+
+
+class MetricsRegistry:
+    """Span histograms, counters and gauge callbacks behind one lock."""
+
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+        self._sources: Dict[str, Callable[[], Dict[str, float]]] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def span(self, name: str):
+        """Context manager timing its body into the `name` histogram (seconds)."""
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, name)
+
+    def observe(self, name: str, value: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_source(self, prefix: str, collect: Callable[[], Dict[str, float]]) -> None:
+        """Report the numbers `collect()` returns as gauges named prefix_key."""
+        self._sources[prefix] = collect
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def gauges(self) -> Dict[str, float]:
+        gauges = {}
+        for prefix, collect in list(self._sources.items()):
+            for key, value in collect().items():
+                if isinstance(value, (int, float)):
+                    gauges[f"{prefix}_{key}"] = value
+        return gauges
+
+    def snapshot(self) -> dict:
+        """Plain numbers: span name -> count/p50/p95/p99/sum, plus counters and gauges."""
+        with self._lock:
+            spans = {
+                name: {
+                    'count': h.count,
+                    'sum': h.sum,
+                    'p50': h.quantile(0.5),
+                    'p95': h.quantile(0.95),
+                    'p99': h.quantile(0.99),
+                }
+                for name, h in sorted(self.histograms.items())
+            }
+            counters = dict(sorted(self.counters.items()))
+        return {'spans': spans, 'counters': counters, 'gauges': self.gauges()}
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (spans as summaries)."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, span in snapshot['spans'].items():
+            metric = f"{PREFIX}{name}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for q in ('p50', 'p95', 'p99'):
+                lines.append(f'{metric}{{quantile="0.{q[1:]}"}} {span[q]:.6g}')
+            lines.append(f"{metric}_sum {span['sum']:.6g}")
+            lines.append(f"{metric}_count {span['count']}")
+        for name, value in snapshot['counters'].items():
+            metric = f"{PREFIX}{name}"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value:.6g}")
+        for name, value in snapshot['gauges'].items():
+            metric = f"{PREFIX}{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value:.6g}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path) -> None:
+        """Write the Prometheus text to `path` (e.g. for node_exporter's textfile collector)."""
+        tmp_path = path.with_name(path.name + '.tmp')
+        tmp_path.write_text(self.render_prometheus())
+        tmp_path.replace(path)
+
+    def serve(self, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+        """Serve GET /metrics from a daemon thread."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+        return self._server
+
+    def stop_serving(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+metrics = MetricsRegistry()
@@ -1,14 +1,18 @@
+import sys
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
 from typing import Optional, List
 
+# Slotted records drop the per-instance __dict__ (Python 3.10+).
+_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
 class SongStatus(Enum):
     LOCAL = "local"
     DOWNLOADED = "downloaded"
     UNAVAILABLE = "unavailable"
 
-@dataclass
+@dataclass(**_SLOTS)
 class Song:
     title: str
     artist: str
@@ -16,14 +20,14 @@ class Song:
     date_downloaded: Optional[datetime] = None
     source: Optional[str] = None
     
-@dataclass
+@dataclass(**_SLOTS)
 class SearchResult:
     song: Song
     status: SongStatus
     youtube_link: Optional[str] = None
     confidence: Optional[float] = None
 
-@dataclass
+@dataclass(**_SLOTS)
 class KaraokeVersion:
     title: str
     artist: str
@@ -0,0 +1,154 @@
+import json
+import pickle
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from rapidfuzz import fuzz, process
+
+INDEX_FORMAT_VERSION = 1
+
+
+def trigrams(text: str) -> Set[str]:
+    """Return the set of character trigrams of a lower-cased search key."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """Inverted index from character trigrams to row numbers.
+
+    Used to shortlist a bounded number of rows that share the most trigrams
+    with a query, so that only those rows need a full fuzzy score.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, array] = {}
+        self.size = 0
+        self.delta_size = 0  # keys appended to the delta file since the last full save
+
+    @classmethod
+    def build(cls, keys: Iterable[str]) -> 'TrigramIndex':
+        index = cls()
+        for key in keys:
+            index.add(key)
+        return index
+
+    def add(self, key: str) -> int:
+        row = self.size
+        postings = self.postings
+        for gram in trigrams(key):
+            ids = postings.get(gram)
+            if ids is None:
+                ids = postings[gram] = array('I')
+            ids.append(row)
+        self.size += 1
+        return row
+
+    def candidates(self, query: str, limit: int, max_postings: int = 100000) -> List[int]:
+        """Return up to `limit` rows sharing the most trigrams with `query`.
+
+        Posting lists are merged rarest first, and merging stops once about
+        `max_postings` row ids have been counted: the very common trigrams that
+        would be skipped carry little signal and dominate the cost.
+        """
+        lists = sorted(
+            (self.postings[g] for g in trigrams(query.lower()) if g in self.postings),
+            key=len,
+        )
+        counts = Counter()
+        merged = 0
+        for ids in lists:
+            if merged and merged + len(ids) > max_postings:
+                break
+            counts.update(ids)
+            merged += len(ids)
+        return [row for row, _ in counts.most_common(limit)]
+
+    @staticmethod
+    def delta_path(path: Path) -> Path:
+        return path.with_name(path.name + '.delta')
+
+    def save(self, path: Path, signature: Tuple) -> None:
+        # The delta belongs to the index being replaced; drop it first so a
+        # crash in between leaves an index that fails its signature check.
+        self.delta_path(path).unlink(missing_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({
+                'version': INDEX_FORMAT_VERSION,
+                'signature': signature,
+                'size': self.size,
+                'postings': self.postings,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path.replace(path)
+        self.delta_size = 0
+
+    def append_delta(self, path: Path, signature: Tuple, key: str) -> None:
+        """Record a key added since the last save, and the store signature after it.
+
+        Much cheaper than `save` for a single row; `load` replays the delta.
+        """
+        with open(self.delta_path(path), 'a') as f:
+            f.write(json.dumps([list(signature), key]) + '\n')
+        self.delta_size += 1
+
+    @classmethod
+    def load(cls, path: Path, signature: Tuple, size: int) -> Optional['TrigramIndex']:
+        """Load a persisted index, or return None if it is missing or out of date."""
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if data.get('version') != INDEX_FORMAT_VERSION:
+            return None
+        index = cls()
+        index.postings = data['postings']
+        index.size = data['size']
+        saved_signature = tuple(data.get('signature', ()))
+        try:
+            with open(cls.delta_path(path)) as f:
+                for line in f:
+                    delta_signature, key = json.loads(line)
+                    index.add(key)
+                    index.delta_size += 1
+                    saved_signature = tuple(delta_signature)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError):
+            return None  # a torn last line from a crash; rebuild
+        if saved_signature != tuple(signature) or index.size != size:
+            return None
+        return index
+
+
+def measure_recall(
+    index: TrigramIndex,
+    keys: Sequence[str],
+    queries: Iterable[str],
+    limit: int,
+    max_postings: int = 100000,
+    threshold: float = 0,
+    scorer: Callable = fuzz.ratio,
+) -> float:
+    """Fraction of queries where the pruned search finds as good a match as brute force.
+
+    A query counts as recalled when the best score among the shortlisted rows
+    equals the best score over every row (ties on a different row are fine).
+    Queries with no brute-force match above `threshold` are ignored.
+    """
+    total = 0
+    recalled = 0
+    for query in queries:
+        query = query.lower()
+        best = process.extractOne(query, keys, scorer=scorer, processor=None, score_cutoff=threshold)
+        if best is None:
+            continue
+        total += 1
+        shortlist = {row: keys[row] for row in index.candidates(query, limit, max_postings)}
+        pruned = process.extractOne(query, shortlist, scorer=scorer, processor=None, score_cutoff=threshold)
+        if pruned is not None and pruned[1] >= best[1]:
+            recalled += 1
+    return recalled / total if total else 1.0
@@ -0,0 +1,189 @@
+import importlib.util
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Type
+
+from .config import HTML_PARSER
+from .models import KaraokeVersion
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+
+# bs4 and lxml are imported by the parser that uses them, not at startup.
+# lxml is optional; the BeautifulSoup parsers cover for it.
+HAVE_LXML = importlib.util.find_spec('lxml') is not None
+
+WATCH_ONLINE_TITLE = 'You can watch this version online'
+
+
+def is_youtube_link(href: Optional[str]) -> bool:
+    return bool(href and ('youtube.com' in href or 'youtu.be' in href))
+
+
+class ResultsParser:
+    """Turns a karaokenerds search results page into KaraokeVersions.
+
+    Results come in pairs of rows: a <tr class="group"> holding the title and
+    artist, followed by a <tr class="details"> listing each version as an
+    <li class="track">. A version is kept when it has a YouTube link marked
+    "You can watch this version online"; its provider is the first badge.
+    """
+
+    name = ''
+
+    def iter_versions(self, html: str) -> Iterator[KaraokeVersion]:
+        raise NotImplementedError
+
+    def parse(self, html: str) -> List[KaraokeVersion]:
+        return list(self.iter_versions(html))
+
+
+class SoupParser(ResultsParser):
+    """Reference parser: a full html.parser BeautifulSoup tree of the page."""
+
+    name = 'soup'
+
+    def make_soup(self, html: str) -> 'BeautifulSoup':
+        from bs4 import BeautifulSoup
+        return BeautifulSoup(html, 'html.parser')
+
+    def iter_versions(self, html: str) -> Iterator[KaraokeVersion]:
+        soup = self.make_soup(html)
+
+        for group in soup.find_all('tr', class_='group'):
+            # Extract song metadata from the group row
+            tds = group.find_all('td')
+            if len(tds) < 2:
+                continue
+            title = tds[0].get_text(strip=True)
+            artist = tds[1].get_text(strip=True)
+
+            # Find the corresponding details row
+            details = group.find_next_sibling('tr', class_='details')
+            if not details:
+                continue
+
+            for item in details.find_all('li', class_='track'):
+                span = item.find('span', title=WATCH_ONLINE_TITLE)
+                if not span or not span.parent:
+                    # No watchable link, skipping
+                    continue
+
+                href = span.parent.get('href')
+                if not is_youtube_link(href):
+                    continue
+
+                badge = item.find('span', class_='badge')
+                provider = badge.get_text(strip=True) if badge else "Unknown"
+
+                yield KaraokeVersion(
+                    title=title,
+                    artist=artist,
+                    provider=provider,
+                    youtube_link=href
+                )
+
+
+def _is_result_row(class_value: Optional[str]) -> bool:
+    # The strainer sees the raw attribute ("details d-none"), not the class list.
+    return bool(class_value) and not {'group', 'details'}.isdisjoint(class_value.split())
+
+
+class StrainedSoupParser(SoupParser):
+    """Only builds the result rows, skipping the rest of the page.
+
+    Uses lxml as the tree builder when it is installed.
+    """
+
+    name = 'strained'
+
+    def __init__(self):
+        from bs4 import SoupStrainer
+        self.strainer = SoupStrainer('tr', class_=_is_result_row)
+
+    def make_soup(self, html: str) -> 'BeautifulSoup':
+        from bs4 import BeautifulSoup
+        features = 'lxml' if HAVE_LXML else 'html.parser'
+        return BeautifulSoup(html, features, parse_only=self.strainer)
+
+
+def _has_class(name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+class LxmlParser(ResultsParser):
+    """libxml2 tree walked with precompiled XPath; requires lxml."""
+
+    name = 'lxml'
+
+    def __init__(self):
+        if not HAVE_LXML:
+            raise ImportError("The lxml results parser requires the lxml package")
+        import lxml.html
+        from lxml import etree
+        self._document_fromstring = lxml.html.document_fromstring
+        self._groups = etree.XPath(f"//tr[{_has_class('group')}]")
+        self._cells = etree.XPath('.//td')
+        self._details = etree.XPath(f"following-sibling::tr[{_has_class('details')}][1]")
+        self._tracks = etree.XPath(f".//li[{_has_class('track')}]")
+        self._watch_spans = etree.XPath('.//span[@title=$title]')
+        self._badges = etree.XPath(f".//span[{_has_class('badge')}]")
+        self._text_nodes = etree.XPath('.//text()')
+
+    def _text(self, element) -> str:
+        """Same result as BeautifulSoup's get_text(strip=True)."""
+        return ''.join(part.strip() for part in self._text_nodes(element))
+
+    def iter_versions(self, html: str) -> Iterator[KaraokeVersion]:
+        if not html.strip():
+            return
+        root = self._document_fromstring(html)
+
+        for group in self._groups(root):
+            tds = self._cells(group)
+            if len(tds) < 2:
+                continue
+            title = self._text(tds[0])
+            artist = self._text(tds[1])
+
+            details = self._details(group)
+            if not details:
+                continue
+
+            for item in self._tracks(details[0]):
+                spans = self._watch_spans(item, title=WATCH_ONLINE_TITLE)
+                if not spans or spans[0].getparent() is None:
+                    continue
+
+                href = spans[0].getparent().get('href')
+                if not is_youtube_link(href):
+                    continue
+
+                badges = self._badges(item)
+                provider = self._text(badges[0]) if badges else "Unknown"
+
+                yield KaraokeVersion(
+                    title=title,
+                    artist=artist,
+                    provider=provider,
+                    youtube_link=href
+                )
+
+
+PARSERS: Dict[str, Type[ResultsParser]] = {
+    SoupParser.name: SoupParser,
+    StrainedSoupParser.name: StrainedSoupParser,
+    LxmlParser.name: LxmlParser,
+}
+
+
+def available_parsers() -> List[str]:
+    return [name for name in PARSERS if name != LxmlParser.name or HAVE_LXML]
+
+
+def get_parser(name: str = HTML_PARSER) -> ResultsParser:
+    """Return a parser by name; "auto" picks the fastest one installed."""
+    if name == 'auto':
+        name = LxmlParser.name if HAVE_LXML else StrainedSoupParser.name
+    try:
+        return PARSERS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown results parser: {name}") from None
@@ -0,0 +1,187 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .async_scraper import AsyncKaraokeNerdsScraper
+from .config import NEAR_MISS_THRESHOLD, SPECULATIVE_ONLINE_DELAY_MS
+from .database import SongDatabase
+from .metrics import metrics
+from .models import KaraokeVersion, SearchResult, Song, SongStatus
+from .profiling import profiler
+
+
+@dataclass
+class QueryOutcome:
+    """Everything the pipeline learned about one request."""
+    query: str
+    local_match: Optional[Song] = None
+    near_misses: List[SearchResult] = field(default_factory=list)
+    versions: Optional[List[KaraokeVersion]] = None  # None when the online stage did not run
+    timings: Dict[str, float] = field(default_factory=dict)  # stage name -> seconds
+    speculative: bool = False  # the online stage started before the local one finished
+
+    @property
+    def status(self) -> Optional[SongStatus]:
+        """LOCAL or UNAVAILABLE when settled; None while a download or a decision is pending."""
+        if self.local_match:
+            return SongStatus.LOCAL
+        if self.versions is not None and not self.versions:
+            return SongStatus.UNAVAILABLE
+        return None
+
+    def describe_timings(self) -> str:
+        parts = [f"{stage} {seconds * 1000:.0f} ms" for stage, seconds in self.timings.items()]
+        if self.speculative:
+            parts.append("online started early")
+        return " · ".join(parts)
+
+
+class _VersionGate:
+    """Holds back streamed versions until the local lookup has missed.
+
+    A speculative online search starts before the caller knows whether it
+    wants the versions; they are buffered until `open()` and dropped for
+    good by `close()`.
+    """
+
+    def __init__(self, on_version: Callable[[KaraokeVersion], None]):
+        self.on_version = on_version
+        self.is_open = False
+        self.closed = False
+        self._held: List[KaraokeVersion] = []
+
+    def __call__(self, version: KaraokeVersion) -> None:
+        if self.is_open:
+            self.on_version(version)
+        elif not self.closed:
+            self._held.append(version)
+
+    def open(self) -> None:
+        self.is_open = True
+        held, self._held = self._held, []
+        for version in held:
+            self.on_version(version)
+
+    def close(self) -> None:
+        self.closed = True
+        self._held = []
+
+
+class QueryPipeline:
+    """Local lookup followed by an online search, without blocking the event loop.
+
+    The local lookup runs in a worker thread. If it has not answered within
+    `speculative_delay` seconds, the online search starts alongside it and is
+    cancelled if the local lookup turns out to be a hit. Cancelling `resolve`
+    cancels whatever stage is in flight.
+    """
+
+    def __init__(
+        self,
+        database: SongDatabase,
+        scraper: AsyncKaraokeNerdsScraper,
+        speculative_delay: float = SPECULATIVE_ONLINE_DELAY_MS / 1000,
+    ):
+        self.database = database
+        self.scraper = scraper
+        self.speculative_delay = speculative_delay
+        self._background: Set[asyncio.Task] = set()
+
+    def _lookup_local_sync(self, query: str) -> Tuple[Optional[Song], List[SearchResult]]:
+        match = self.database.search(query)
+        if match:
+            return match, []
+        return None, self.database.search_many(query, threshold=NEAR_MISS_THRESHOLD)
+
+    async def lookup_local(self, query: str) -> Tuple[Optional[Song], List[SearchResult]]:
+        """Return (confident match, near misses) from the local library."""
+        return await asyncio.to_thread(self._lookup_local_sync, query)
+
+    async def search_online(
+        self,
+        query: str,
+        on_version: Optional[Callable[[KaraokeVersion], None]] = None,
+    ) -> List[KaraokeVersion]:
+        return await self.scraper.search(query, on_version)
+
+    async def _timed(self, coro, outcome: QueryOutcome, stage: str):
+        start = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            outcome.timings[stage] = time.perf_counter() - start
+            metrics.observe(f'query_{stage}', outcome.timings[stage])
+
+    async def resolve(
+        self,
+        query: str,
+        online: bool = True,
+        stop_on_near_miss: bool = True,
+        on_version: Optional[Callable[[KaraokeVersion], None]] = None,
+    ) -> QueryOutcome:
+        """Run the pipeline for one query.
+
+        With `stop_on_near_miss`, the online stage is skipped when the local
+        library has close but not confident matches, so the caller can offer
+        them first; a speculative online search already in flight is left to
+        finish in the background so it warms the results cache.
+
+        `on_version` receives online versions as they are parsed, but only
+        once the local lookup has missed and the online stage is wanted.
+        """
+        with profiler.operation(), metrics.span('query'):
+            outcome = await self._resolve(query, online, stop_on_near_miss, on_version)
+        if outcome.local_match:
+            metrics.inc('queries_local_total')
+        elif outcome.versions:
+            metrics.inc('queries_online_total')
+        elif outcome.versions is not None:
+            metrics.inc('queries_unavailable_total')
+        elif outcome.near_misses:
+            metrics.inc('queries_near_miss_total')
+        return outcome
+
+    async def _resolve(
+        self,
+        query: str,
+        online: bool,
+        stop_on_near_miss: bool,
+        on_version: Optional[Callable[[KaraokeVersion], None]],
+    ) -> QueryOutcome:
+        outcome = QueryOutcome(query=query)
+        gate = _VersionGate(on_version) if on_version is not None else None
+        local = asyncio.ensure_future(self._timed(self.lookup_local(query), outcome, 'local'))
+        remote = None
+        try:
+            if online:
+                done, _ = await asyncio.wait({local}, timeout=self.speculative_delay)
+                if not done:
+                    outcome.speculative = True
+                    remote = asyncio.ensure_future(self._timed(self.search_online(query, gate), outcome, 'online'))
+
+            outcome.local_match, outcome.near_misses = await local
+            if outcome.local_match or not online:
+                return outcome
+            if outcome.near_misses and stop_on_near_miss:
+                if remote is not None:
+                    self._keep_in_background(remote)
+                    remote = None
+                return outcome
+
+            if gate is not None:
+                gate.open()
+            if remote is None:
+                remote = asyncio.ensure_future(self._timed(self.search_online(query, gate), outcome, 'online'))
+            outcome.versions = await remote
+            return outcome
+        finally:
+            if gate is not None and not gate.is_open:
+                gate.close()
+            local.cancel()
+            if remote is not None and not remote.done():
+                remote.cancel()
+
+    def _keep_in_background(self, task: asyncio.Task) -> None:
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
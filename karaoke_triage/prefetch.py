@@ -0,0 +1,423 @@
+"""Resolve, and optionally download, songs the activity log says will be asked for.
+
+    python -m karaoke_triage.prefetch            # what prefetching has done so far
+    python -m karaoke_triage.prefetch --once     # run one pass now
+
+The activity log is folded into the report's rollup, and its unavailable
+requests are grouped the way the report groups them. A group is a candidate
+when it was asked for at least PREFETCH_MIN_REQUESTS times, or came back
+unavailable within PREFETCH_RECENT_WINDOW (worth another look: providers
+add songs all the time). Candidates that are in the library by now, or were
+prefetched in the last PREFETCH_RETRY_AFTER seconds, are skipped.
+
+Each candidate is searched through the scraper, which leaves the result in
+the scrape cache so the next request for it is answered without the site.
+With PREFETCH_DOWNLOAD the first version found is also queued at
+PRIORITY_PREFETCH, as long as the prefetched files stay within
+PREFETCH_MAX_BYTES on disk and PREFETCH_DAILY_BYTES downloaded per day.
+
+The prefetcher only works while the app is idle: nothing searched for
+PREFETCH_IDLE_SECONDS and no requested download queued or running. A search
+it started is cancelled as soon as someone starts one of their own.
+Requests answered locally by a prefetched download count as local hits.
+The first search answered from the very cache entry a prefetch left counts
+as a warm hit; one answered after that entry was refetched does not.
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .cache import normalize_query
+from .config import (
+    LOG_PATH,
+    PREFETCH_CANDIDATE_FACTOR,
+    PREFETCH_DAILY_BYTES,
+    PREFETCH_DOWNLOAD,
+    PREFETCH_IDLE_SECONDS,
+    PREFETCH_INTERVAL,
+    PREFETCH_MAX_BYTES,
+    PREFETCH_MAX_QUERIES,
+    PREFETCH_MIN_REQUESTS,
+    PREFETCH_RECENT_WINDOW,
+    PREFETCH_RETRY_AFTER,
+    PREFETCH_STATE_PATH,
+    REPORT_ROLLUP_PATH,
+)
+from .download_queue import DownloadJob, JobState, PRIORITY_PREFETCH
+from .metrics import metrics
+from .models import Song
+from .report import Rollup, update_rollup
+
+logger = logging.getLogger(__name__)
+
+STATE_FORMAT_VERSION = 1
+REQUESTED_BY = 'prefetch'  # activity log name of prefetched downloads
+POLL_INTERVAL = 0.5  # seconds between idle checks while paused
+
+
+class IdleMonitor:
+    """Tracks whether anyone is using the app right now."""
+
+    def __init__(self, quiet: float = PREFETCH_IDLE_SECONDS):
+        self.quiet = quiet
+        self._active = 0
+        self._last = time.monotonic() - quiet
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def busy(self):
+        """Mark the app busy for the duration of an interactive request."""
+        with self._lock:
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._last = time.monotonic()
+
+    def touch(self) -> None:
+        """Note a short interaction, such as a keystroke in the search box."""
+        with self._lock:
+            self._last = time.monotonic()
+
+    def is_idle(self) -> bool:
+        with self._lock:
+            return not self._active and time.monotonic() - self._last >= self.quiet
+
+
+@dataclass
+class PrefetchState:
+    resolved: Dict[str, float] = field(default_factory=dict)  # query -> time.time() of the last prefetch
+    # Query -> fetched_at of the scrape cache entry its prefetch left, until a search uses it.
+    warm: Dict[str, float] = field(default_factory=dict)
+    # Download job id -> {'query', 'path', 'bytes'}; path is None until the download finishes.
+    downloads: Dict[str, dict] = field(default_factory=dict)
+    daily_bytes: Dict[str, int] = field(default_factory=dict)  # ISO date -> bytes downloaded
+    local_hits: int = 0
+    warm_hits: int = 0
+
+    def to_dict(self) -> dict:
+        return {'version': STATE_FORMAT_VERSION, **asdict(self)}
+
+    @classmethod
+    def load(cls, path: Path) -> 'PrefetchState':
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls()
+        if data.pop('version', None) != STATE_FORMAT_VERSION:
+            return cls()
+        return cls(**data)
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        tmp_path.replace(path)
+
+
+class Prefetcher:
+    """Background prefetching for a TriageService; see the module docstring.
+
+    `run` is a coroutine for the event loop the service's scraper uses.
+    `note_outcome` and `on_download` may be called from any thread;
+    `note_outcome` only queues the outcome, which a background thread
+    counts, so the query path never waits for the state file.
+    """
+
+    def __init__(
+        self,
+        service,
+        state_path: Path = PREFETCH_STATE_PATH,
+        log_path: Path = LOG_PATH,
+        rollup_path: Path = REPORT_ROLLUP_PATH,
+        download: bool = PREFETCH_DOWNLOAD,
+        interval: float = PREFETCH_INTERVAL,
+        max_queries: int = PREFETCH_MAX_QUERIES,
+        min_requests: int = PREFETCH_MIN_REQUESTS,
+        recent_window: float = PREFETCH_RECENT_WINDOW,
+        retry_after: float = PREFETCH_RETRY_AFTER,
+        max_bytes: int = PREFETCH_MAX_BYTES,
+        daily_bytes: int = PREFETCH_DAILY_BYTES,
+    ):
+        self.service = service
+        self.state_path = state_path
+        self.log_path = log_path
+        self.rollup_path = rollup_path
+        self.download = download
+        self.interval = interval
+        self.max_queries = max_queries
+        self.min_requests = min_requests
+        self.recent_window = recent_window
+        self.retry_after = retry_after
+        self.max_bytes = max_bytes
+        self.daily_bytes = daily_bytes
+        self.state = PrefetchState.load(state_path)
+        self._paths = {entry['path'] for entry in self.state.downloads.values() if entry['path']}
+        self._lock = threading.Lock()
+        self._outcomes: queue.SimpleQueue = queue.SimpleQueue()
+        self._counter: Optional[threading.Thread] = None
+        metrics.add_source('prefetch', self.summary)
+
+    # -- bookkeeping -----------------------------------------------------
+
+    def _save(self) -> None:
+        """Write the state; call with the lock held."""
+        try:
+            self.state.save(self.state_path)
+        except OSError as e:
+            logger.warning("Could not save prefetch state: %s", e)
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            finished = [entry for entry in self.state.downloads.values() if entry['path']]
+            return {
+                'resolved': len(self.state.resolved),
+                'downloads': len(finished),
+                'bytes': sum(entry['bytes'] for entry in finished),
+                'local_hits': self.state.local_hits,
+                'warm_hits': self.state.warm_hits,
+            }
+
+    def note_outcome(self, query: str, local_match: Optional[Song], answered_online: bool) -> None:
+        """Queue a request's outcome, to be counted if prefetching answered it ahead of time."""
+        if local_match is not None:
+            if local_match.file_path:
+                self._outcomes.put((query, local_match.file_path))
+        elif answered_online:
+            self._outcomes.put((query, None))
+        else:
+            return
+        if self._counter is None:
+            with self._lock:
+                if self._counter is None:
+                    self._counter = threading.Thread(target=self._count_outcomes, name='prefetch-hits', daemon=True)
+                    self._counter.start()
+
+    def _count_outcomes(self) -> None:
+        """Counter thread: counts queued outcomes, saving the state once per batch."""
+        while True:
+            batch = [self._outcomes.get()]
+            while True:
+                try:
+                    batch.append(self._outcomes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._count(batch)
+            except Exception:
+                logger.exception("Could not count %d prefetch outcomes", len(batch))
+
+    def _count(self, batch: List[Tuple[str, Optional[str]]]) -> None:
+        cache = self.service.scraper.cache
+        changed = False
+        for query, path in batch:
+            if path is not None:
+                with self._lock:
+                    if path in self._paths:
+                        self.state.local_hits += 1
+                        metrics.inc('prefetch_local_hits_total')
+                        changed = True
+                continue
+            key = normalize_query(query)
+            with self._lock:
+                prefetched = self.state.warm.get(key)
+            if prefetched is None or not cache:
+                continue
+            # Answered from the prefetched entry only if nothing has refetched it since.
+            if cache.fetched_at(key) != prefetched:
+                with self._lock:
+                    self.state.warm.pop(key, None)
+                    changed = True
+                continue
+            with self._lock:
+                if self.state.warm.pop(key, None) is not None:
+                    self.state.warm_hits += 1
+                    metrics.inc('prefetch_warm_hits_total')
+                    changed = True
+        if changed:
+            with self._lock:
+                self._save()
+
+    def on_download(self, job: DownloadJob) -> None:
+        """Download listener: records the size of prefetched downloads as they finish."""
+        with self._lock:
+            entry = self.state.downloads.get(job.id)
+            if entry is None or entry['path']:
+                return
+            if job.state is JobState.DONE and job.file_path:
+                try:
+                    size = os.path.getsize(job.file_path)
+                except OSError:
+                    size = 0
+                entry['path'] = job.file_path
+                entry['bytes'] = size
+                self._paths.add(job.file_path)
+                today = date.today().isoformat()
+                self.state.daily_bytes = {today: self.state.daily_bytes.get(today, 0) + size}
+                self._save()
+            elif job.state in (JobState.FAILED, JobState.CANCELLED):
+                del self.state.downloads[job.id]
+                self._save()
+
+    def _within_budget(self) -> bool:
+        with self._lock:
+            used = sum(entry['bytes'] for entry in self.state.downloads.values())
+            today = self.state.daily_bytes.get(date.today().isoformat(), 0)
+            # Sizes are known only once a download finishes; queue one at a time.
+            waiting = any(not entry['path'] for entry in self.state.downloads.values())
+        return not waiting and used < self.max_bytes and today < self.daily_bytes
+
+    # -- idleness --------------------------------------------------------
+
+    def is_idle(self) -> bool:
+        if not self.service.idle.is_idle():
+            return False
+        return not any(job.active and job.priority < PRIORITY_PREFETCH for job in self.service.downloads.snapshot())
+
+    async def wait_until_idle(self) -> None:
+        while not self.is_idle():
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def _while_idle(self, coro):
+        """Await `coro`, cancelling it if the app stops being idle; None if cancelled."""
+        task = asyncio.ensure_future(coro)
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=POLL_INTERVAL)
+                if not task.done() and not self.is_idle():
+                    task.cancel()
+                    return None
+            return task.result()
+        finally:
+            task.cancel()
+
+    # -- passes ----------------------------------------------------------
+
+    def candidates(self) -> List[Tuple[str, int]]:
+        """(query, times requested) worth prefetching now, most requested first."""
+        rollup = Rollup.load(self.rollup_path)
+        update_rollup(rollup, self.log_path)
+        rollup.save(self.rollup_path)
+
+        recent = (datetime.now() - timedelta(seconds=self.recent_window)).isoformat()
+        now = time.time()
+        with self._lock:
+            resolved = dict(self.state.resolved)
+        # Group only a few times more queries than one pass resolves: the
+        # most requested, plus the most recent ones the recency rule may pick.
+        pool = self.max_queries * PREFETCH_CANDIDATE_FACTOR
+        keys = set(heapq.nlargest(pool, rollup.unavailable, key=rollup.unavailable.__getitem__))
+        keys.update(heapq.nlargest(pool, rollup.unavailable_last, key=rollup.unavailable_last.__getitem__))
+        candidates = []
+        for query, count, variants in rollup.top_unavailable(len(keys), keys=keys):
+            last = max(rollup.unavailable_last.get(key, '') for key in [query, *variants])
+            if count < self.min_requests and last < recent:
+                continue
+            if now - resolved.get(query, 0) < self.retry_after:
+                continue
+            candidates.append((query, count))
+        return candidates
+
+    async def run_once(self) -> int:
+        """One pass over the candidates; returns how many were resolved."""
+        candidates = await asyncio.to_thread(self.candidates)
+        resolved = 0
+        for query, count in candidates:
+            if resolved >= self.max_queries:
+                break
+            await self.wait_until_idle()
+            if await asyncio.to_thread(self.service.database.search, query):
+                continue  # in the library by now
+            started = time.time()
+            versions = await self._while_idle(self.service.scraper.search(query))
+            if versions is None:
+                continue  # interrupted; picked up again by the next pass
+            resolved += 1
+            metrics.inc('prefetch_resolved_total')
+            logger.info("Prefetched %r (requested %d times): %d versions", query, count, len(versions))
+            cache = self.service.scraper.cache
+            fetched_at = await asyncio.to_thread(cache.fetched_at, query) if cache else None
+            with self._lock:
+                self.state.resolved[query] = time.time()
+                if fetched_at is not None and fetched_at >= started:  # not an entry someone else left
+                    self.state.warm[normalize_query(query)] = fetched_at
+                self._save()
+            if versions and self.download and self._within_budget():
+                self._queue_download(query, versions[0])
+        return resolved
+
+    def _queue_download(self, query: str, version) -> None:
+        job, created = self.service.submit(version, PRIORITY_PREFETCH, REQUESTED_BY)
+        if not created:
+            return  # already wanted by someone
+        with self._lock:
+            self.state.downloads[job.id] = {'query': query, 'path': None, 'bytes': 0}
+        self.on_download(job)  # finished already if the file was on disk
+        with self._lock:
+            self._save()
+
+    async def run(self) -> None:
+        """Prefetch every `interval` seconds until cancelled."""
+        while True:
+            await self.wait_until_idle()
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Prefetch pass failed")
+            await asyncio.sleep(self.interval)
+
+
+def format_summary(summary: Dict[str, float]) -> str:
+    return (f"{summary['resolved']:.0f} queries prefetched, {summary['downloads']:.0f} downloads "
+            f"({summary['bytes'] / 2 ** 20:.1f} MB); later requests answered by them: "
+            f"{summary['local_hits']:.0f} local hits, {summary['warm_hits']:.0f} warm searches")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m karaoke_triage.prefetch", description=__doc__.splitlines()[0])
+    parser.add_argument("--once", action="store_true", help="run one pass now instead of only reporting")
+    parser.add_argument("--download", action="store_true", default=PREFETCH_DOWNLOAD,
+                        help="also download the first version found, within the budget")
+    args = parser.parse_args(argv[1:])
+
+    from .service import TriageService
+    service = TriageService(prefetch=False)
+    prefetcher = Prefetcher(service, download=args.download)
+    if args.once:
+        service.idle.quiet = 0
+        service.add_listener(prefetcher.on_download)
+        service.start()
+
+        async def run():
+            try:
+                resolved = await prefetcher.run_once()
+                while service.pending_count():
+                    await asyncio.sleep(POLL_INTERVAL)
+                return resolved
+            finally:
+                await service.aclose()
+
+        resolved = asyncio.run(run())
+        print(f"Resolved {resolved} queries", file=sys.stderr)
+    print(format_summary(prefetcher.summary()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,320 @@
+"""On-demand profiling of the next few queries and downloads.
+
+Code worth profiling is marked with
+
+    with profiler.operation():
+        ...
+
+and nothing else happens until a capture is armed, from the TUI (Ctrl+R),
+the service (POST /profile) or `python -m karaoke_triage.batch --profile N`.
+While nothing is armed `operation` hands back one shared no-op context
+manager, so the markers cost an attribute check.
+
+An armed capture starts tracemalloc and a thread that samples every other
+thread's stack; in "cprofile" mode each thread is also traced with cProfile
+while it is inside an operation. Once the requested number of operations
+has finished the capture stops and writes, under PROFILE_DIR/<timestamp>/:
+
+    stacks.txt        collapsed stacks ("frame;frame;frame count"), for
+                      flamegraph.pl or speedscope
+    allocations.txt   the allocation sites holding the most memory
+    profile.pstats    cProfile data, for pstats or snakeviz (cprofile mode)
+    profile.txt       the same, sorted by cumulative time (cprofile mode)
+
+Only threads that used CPU since the previous sample are recorded, so the
+flame graph shows work rather than threads parked on a queue. Where the
+platform has no per-thread CPU clock, threads waiting on a lock, a queue or
+a selector are left out instead.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import nullcontext
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from .config import (
+    PROFILE_DIR,
+    PROFILE_MODE,
+    PROFILE_OPERATIONS,
+    PROFILE_SAMPLE_INTERVAL,
+    PROFILE_TOP_ALLOCATIONS,
+)
+
+logger = logging.getLogger(__name__)
+
+MODES = ("sample", "cprofile")
+
+_NOOP = nullcontext()
+_PACKAGE_ROOT = str(Path(__file__).resolve().parent.parent) + os.sep
+
+# (file name, function) of the frames a thread sits in while it waits, for
+# platforms without per-thread CPU clocks.
+_IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('selectors.py', 'select'),
+    ('thread.py', '_worker'),
+    ('queue.py', 'get'),
+    ('socketserver.py', 'serve_forever'),
+}
+
+
+@dataclass
+class CaptureInfo:
+    """Where a capture writes and how far along it is."""
+    directory: str
+    mode: str
+    operations: int
+    completed: int = 0
+    armed: bool = True  # False once it has stopped and is being written
+
+
+class Capture:
+    """One profiling session covering the next `operations` operations."""
+
+    def __init__(
+        self,
+        directory: Path,
+        operations: int = PROFILE_OPERATIONS,
+        mode: str = PROFILE_MODE,
+        sample_interval: float = PROFILE_SAMPLE_INTERVAL,
+        top_allocations: int = PROFILE_TOP_ALLOCATIONS,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"unknown profile mode {mode!r}; expected one of {', '.join(MODES)}")
+        self.directory = Path(directory)
+        self.operations = operations
+        self.mode = mode
+        self.sample_interval = sample_interval
+        self.top_allocations = top_allocations
+        self.completed = 0
+        self.samples: Counter = Counter()
+        self.written = threading.Event()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profiles: List[cProfile.Profile] = []
+        self._active = 0
+        self._stopping = False
+        self._writing = False
+        self._stop_sampling = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+        self._started_tracemalloc = False
+        self._started = 0.0
+        self.on_stop = None  # called once with this capture when it stops taking operations
+
+    def info(self) -> CaptureInfo:
+        return CaptureInfo(str(self.directory), self.mode, self.operations, self.completed, not self._stopping)
+
+    def start(self) -> None:
+        self._started = time.perf_counter()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._sampler.start()
+
+    def __enter__(self) -> 'Capture':
+        with self._lock:
+            self._active += 1
+        if self.mode == "cprofile":
+            local = self._local
+            depth = getattr(local, 'depth', 0)
+            if depth == 0:
+                profile = getattr(local, 'profile', None)
+                if profile is None:
+                    profile = local.profile = cProfile.Profile()
+                    with self._lock:
+                        self._profiles.append(profile)
+                try:
+                    profile.enable()
+                except ValueError:
+                    # Another profiler already owns this thread (or, on
+                    # Python 3.12+, the process); the samples still cover it.
+                    local.profile = None
+                    with self._lock:
+                        self._profiles.remove(profile)
+            local.depth = depth + 1
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.mode == "cprofile":
+            local = self._local
+            local.depth -= 1
+            if local.depth == 0 and local.profile is not None:
+                local.profile.disable()
+        with self._lock:
+            self._active -= 1
+            self.completed += 1
+            stopping = not self._stopping and self.completed >= self.operations
+            if stopping:
+                self._stopping = True
+            finished = self._ready_to_write()
+        if stopping and self.on_stop is not None:
+            self.on_stop(self)
+        if finished:
+            self._write_in_background()
+
+    def stop(self) -> None:
+        """Stop taking operations; written as soon as the ones in flight finish."""
+        with self._lock:
+            if self._stopping:
+                return
+            self._stopping = True
+            finished = self._ready_to_write()
+        if self.on_stop is not None:
+            self.on_stop(self)
+        if finished:
+            self._write_in_background()
+
+    def _ready_to_write(self) -> bool:
+        # Called under the lock; true exactly once.
+        if self._stopping and not self._active and not self._writing:
+            self._writing = True
+            return True
+        return False
+
+    def _sample(self) -> None:
+        me = threading.get_ident()
+        names = {}
+        clocks = {}
+        cpu_used = {}
+        while not self._stop_sampling.wait(self.sample_interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                    clocks = {ident: _cpu_clock(ident) for ident in names}
+                clock = clocks.get(ident)
+                if clock is not None:
+                    try:
+                        used = time.clock_gettime(clock)
+                    except OSError:  # the thread has just exited
+                        continue
+                    if cpu_used.get(ident) == used:
+                        continue
+                    cpu_used[ident] = used
+                else:
+                    code = frame.f_code
+                    if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                        continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def _write_in_background(self) -> None:
+        threading.Thread(target=self.write, name='profile-writer', daemon=True).start()
+
+    def write(self) -> None:
+        """Stop sampling and tracing and write the artifacts."""
+        elapsed = time.perf_counter() - self._started
+        self._stop_sampling.set()
+        self._sampler.join()
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        current, peak = tracemalloc.get_traced_memory()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.directory / 'stacks.txt', 'w') as f:
+                for stack, count in sorted(self.samples.items()):
+                    f.write(f"{stack} {count}\n")
+            with open(self.directory / 'allocations.txt', 'w') as f:
+                f.write(f"# {self.completed} operations in {elapsed:.1f}s; "
+                        f"traced memory {current / 1024 ** 2:.1f} MB, peak {peak / 1024 ** 2:.1f} MB\n")
+                if snapshot is not None:
+                    snapshot = snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+                    for stat in snapshot.statistics('lineno')[:self.top_allocations]:
+                        frame = stat.traceback[0]
+                        f.write(f"{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  "
+                                f"{_short_path(frame.filename)}:{frame.lineno}\n")
+            if self._profiles:
+                stats = pstats.Stats(*self._profiles)
+                stats.dump_stats(self.directory / 'profile.pstats')
+                text = io.StringIO()
+                pstats.Stats(*self._profiles, stream=text).sort_stats('cumulative').print_stats(50)
+                (self.directory / 'profile.txt').write_text(text.getvalue())
+        except OSError as e:
+            logger.warning("Could not write profile to %s: %s", self.directory, e)
+        else:
+            logger.info("Profile of %d operations written to %s", self.completed, self.directory)
+        finally:
+            self.written.set()
+
+
+def _cpu_clock(ident: int) -> Optional[int]:
+    try:
+        return time.pthread_getcpuclockid(ident)
+    except (AttributeError, OSError):
+        return None
+
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(_PACKAGE_ROOT):
+        return filename[len(_PACKAGE_ROOT):]
+    parts = Path(filename).parts
+    return os.path.join(*parts[-2:]) if len(parts) > 1 else filename
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Profiler:
+    """Hands out the armed capture, if any, to operation markers."""
+
+    def __init__(self, directory: Path = PROFILE_DIR):
+        self.directory = Path(directory)
+        self.capture: Optional[Capture] = None
+        self._lock = threading.Lock()
+
+    def operation(self):
+        """Context manager marking one query or download."""
+        capture = self.capture
+        if capture is None:
+            return _NOOP
+        return capture
+
+    def arm(self, operations: int = PROFILE_OPERATIONS, mode: str = PROFILE_MODE) -> Tuple[Capture, bool]:
+        """Start a capture for the next `operations` operations.
+
+        Returns (capture, created); when one is already armed it is returned
+        unchanged.
+        """
+        with self._lock:
+            if self.capture is not None:
+                return self.capture, False
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+            capture = Capture(self.directory / stamp, max(1, operations), mode)
+            capture.on_stop = self._disarm
+            capture.start()
+            self.capture = capture
+        logger.info("Profiling the next %d operations into %s", capture.operations, capture.directory)
+        return capture, True
+
+    def toggle(self, operations: int = PROFILE_OPERATIONS, mode: str = PROFILE_MODE) -> CaptureInfo:
+        """Arm a capture, or stop the armed one early."""
+        capture, created = self.arm(operations, mode)
+        if not created:
+            capture.stop()
+        return capture.info()
+
+    def _disarm(self, capture: Capture) -> None:
+        with self._lock:
+            if self.capture is capture:
+                self.capture = None
+
+
+profiler = Profiler()
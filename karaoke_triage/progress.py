@@ -0,0 +1,145 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from .config import PROGRESS_MAX_RATE, PROGRESS_SPEED_SMOOTHING
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DownloadProgress:
+    """One coalesced progress report for a download."""
+    status: str  # yt-dlp's status: "downloading" or "finished"
+    downloaded_bytes: int = 0
+    total_bytes: Optional[int] = None
+    estimated: bool = False  # total_bytes came from yt-dlp's total_bytes_estimate or the fragment count
+    fragment_index: Optional[int] = None
+    fragment_count: Optional[int] = None
+    speed: Optional[float] = None  # bytes per second, smoothed
+    eta: Optional[float] = None  # seconds
+
+    @property
+    def fraction(self) -> Optional[float]:
+        """0..1, from bytes when the size is known and from fragments otherwise."""
+        if self.status == 'finished':
+            return 1.0
+        if self.total_bytes:
+            return min(1.0, self.downloaded_bytes / self.total_bytes)
+        if self.fragment_count:
+            return min(1.0, (self.fragment_index or 0) / self.fragment_count)
+        return None
+
+    def describe(self) -> str:
+        parts = []
+        fraction = self.fraction
+        if fraction is not None:
+            parts.append(f"{fraction * 100:3.0f}%{'~' if self.estimated else ''}")
+        if self.speed:
+            parts.append(f"{format_bytes(self.speed)}/s")
+        if self.eta is not None and self.status != 'finished':
+            minutes, seconds = divmod(int(self.eta), 60)
+            parts.append(f"{minutes}:{seconds:02d} left")
+        return " ".join(parts)
+
+
+def format_bytes(count: float) -> str:
+    for unit in ('B', 'KB', 'MB'):
+        if count < 1024:
+            return f"{count:.0f} {unit}" if unit == 'B' else f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} GB"
+
+
+class ProgressThrottle:
+    """yt-dlp progress hook that reports at most `max_rate` times per second.
+
+    yt-dlp calls its hooks for every chunk written, which is many times a
+    second. This hook keeps the latest state and hands `report` a
+    DownloadProgress only when 1 / max_rate seconds have passed since the
+    previous report; the updates in between are coalesced into the next one.
+    The "finished" update of each file is always reported.
+
+    yt-dlp does not always know the size: HLS/DASH streams often only carry
+    total_bytes_estimate, or just fragment counts. Both are used, and a size
+    derived from them is flagged as `estimated`. Throughput is an
+    exponentially smoothed average of the byte deltas between hook calls.
+    """
+
+    def __init__(
+        self,
+        report: Callable[[DownloadProgress], None],
+        max_rate: float = PROGRESS_MAX_RATE,
+        smoothing: float = PROGRESS_SPEED_SMOOTHING,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.report = report
+        self.interval = 1 / max_rate if max_rate > 0 else 0.0
+        self.smoothing = smoothing
+        self.clock = clock
+        self.calls = 0
+        self.reports = 0
+        self.finished_bytes = 0  # size of the files completed so far
+        self._filename = None
+        self._last_report = None
+        self._last_sample = None  # (time, downloaded bytes)
+        self._speed = None
+
+    def __call__(self, d: dict) -> None:
+        self.calls += 1
+        now = self.clock()
+        status = d.get('status', 'downloading')
+        downloaded = d.get('downloaded_bytes') or 0
+        if status == 'finished':
+            self.finished_bytes += downloaded or d.get('total_bytes') or 0
+
+        # Video and audio are separate files, each starting from zero.
+        filename = d.get('filename')
+        if filename != self._filename:
+            self._filename = filename
+            self._last_sample = None
+            self._speed = None
+
+        if self._last_sample is not None:
+            elapsed = now - self._last_sample[0]
+            if elapsed > 0 and downloaded >= self._last_sample[1]:
+                sample = (downloaded - self._last_sample[1]) / elapsed
+                if self._speed is None:
+                    self._speed = sample
+                else:
+                    self._speed += self.smoothing * (sample - self._speed)
+        self._last_sample = (now, downloaded)
+
+        if status == 'downloading' and self._last_report is not None and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        self.reports += 1
+        progress = self._progress(d, status, downloaded)
+        logger.debug("progress %s %s", filename, progress)
+        self.report(progress)
+
+    def _progress(self, d: dict, status: str, downloaded: int) -> DownloadProgress:
+        total = d.get('total_bytes')
+        estimated = False
+        if not total and d.get('total_bytes_estimate'):
+            total, estimated = int(d['total_bytes_estimate']), True
+        fragment_index = d.get('fragment_index')
+        fragment_count = d.get('fragment_count')
+        if not total and fragment_index and fragment_count and downloaded:
+            total, estimated = int(downloaded * fragment_count / fragment_index), True
+
+        speed = self._speed or d.get('speed')
+        eta = d.get('eta')
+        if total and speed:
+            eta = max(0, total - downloaded) / speed
+        return DownloadProgress(
+            status=status,
+            downloaded_bytes=downloaded,
+            total_bytes=total,
+            estimated=estimated,
+            fragment_index=fragment_index,
+            fragment_count=fragment_count,
+            speed=speed,
+            eta=eta,
+        )
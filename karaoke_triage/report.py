@@ -0,0 +1,279 @@
+"""Summarize the activity log, including rotated and gzipped segments.
+
+    python -m karaoke_triage.report --top 20
+    python -m karaoke_triage.report --format json --rebuild
+
+Rows are streamed one at a time, so memory does not grow with the length of
+the log. The totals are saved as a rollup next to the log, along with how far
+each segment has been read, so the next run only reads rows logged since.
+Unavailable requests are counted per normalized query and near-duplicates
+("bohemian rhapsody" / "bohemian rapsody queen") are grouped when the report
+is printed.
+"""
+import argparse
+import csv
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import sys
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from rapidfuzz import fuzz, process
+
+from .cache import normalize_query
+from .config import (
+    LOG_PATH,
+    REPORT_GROUP_CANDIDATES,
+    REPORT_GROUP_THRESHOLD,
+    REPORT_MAX_QUERIES,
+    REPORT_ROLLUP_PATH,
+)
+from .logger import log_segments
+from .models import SongStatus
+
+ROLLUP_FORMAT_VERSION = 2
+
+
+@dataclass
+class Rollup:
+    """Aggregates over every log row read so far; all fields merge by addition."""
+    rows: int = 0
+    first: Optional[str] = None  # ISO timestamps of the earliest and latest rows
+    last: Optional[str] = None
+    statuses: Dict[str, int] = field(default_factory=dict)
+    providers: Dict[str, int] = field(default_factory=dict)  # downloads per provider
+    hours: List[int] = field(default_factory=lambda: [0] * 24)  # requests per hour of day
+    unavailable: Dict[str, int] = field(default_factory=dict)  # normalized query -> count
+    unavailable_last: Dict[str, str] = field(default_factory=dict)  # normalized query -> latest ISO timestamp
+    # Counts dropped to keep `unavailable` within 2 * max_queries; every
+    # count there may be short by up to this much.
+    unavailable_error: int = 0
+    # Segment fingerprint -> [bytes read, finished]
+    segments: Dict[str, list] = field(default_factory=dict)
+
+    def add(self, row: List[str], max_queries: int = REPORT_MAX_QUERIES) -> None:
+        if len(row) < 5:
+            return
+        timestamp, _, title, artist, status = row[:5]
+        source = row[5] if len(row) > 5 else ''
+        self.rows += 1
+        if self.first is None or timestamp < self.first:
+            self.first = timestamp
+        if self.last is None or timestamp > self.last:
+            self.last = timestamp
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        try:
+            self.hours[datetime.fromisoformat(timestamp).hour] += 1
+        except ValueError:
+            pass
+        if status == SongStatus.DOWNLOADED.value:
+            provider = source or 'unknown'
+            self.providers[provider] = self.providers.get(provider, 0) + 1
+        elif status == SongStatus.UNAVAILABLE.value:
+            key = normalize_query(f"{title} {artist}")
+            self.unavailable[key] = self.unavailable.get(key, 0) + 1
+            if timestamp > self.unavailable_last.get(key, ''):
+                self.unavailable_last[key] = timestamp
+            if len(self.unavailable) >= 2 * max_queries:
+                self._shrink(max_queries)
+
+    def _shrink(self, keep: int) -> None:
+        # Misra-Gries, batched: once the table has doubled, subtract the
+        # (keep + 1)-th largest count from every count, leaving at most
+        # `keep` keys. Rebuilding the table once per `keep` new keys rather
+        # than once per key keeps this amortized O(log n); each count is
+        # still short by at most rows / (keep + 1).
+        cut = heapq.nlargest(keep + 1, self.unavailable.values())[-1]
+        self.unavailable_error += cut
+        self.unavailable = {key: count - cut for key, count in self.unavailable.items() if count > cut}
+        self.unavailable_last = {key: self.unavailable_last[key] for key in self.unavailable}
+
+    @property
+    def hit_rate(self) -> float:
+        return self.statuses.get(SongStatus.LOCAL.value, 0) / self.rows if self.rows else 0.0
+
+    def top_unavailable(
+        self,
+        limit: int,
+        threshold: float = REPORT_GROUP_THRESHOLD,
+        keys: Optional[Iterable[str]] = None,
+    ) -> List[Tuple[str, int, List[str]]]:
+        """(representative query, total count, other spellings) for the most requested groups.
+
+        Queries are visited from most to least requested; each joins the
+        first group whose representative scores at least `threshold` against
+        it, or starts a new group. Grouping compares every query with every
+        group, so only `keys` are grouped, by default the
+        limit * REPORT_GROUP_CANDIDATES most requested ones.
+        """
+        if keys is None:
+            keys = heapq.nlargest(limit * REPORT_GROUP_CANDIDATES, self.unavailable, key=self.unavailable.__getitem__)
+        counts = [(key, self.unavailable[key]) for key in set(keys) if key in self.unavailable]
+        representatives: List[str] = []
+        groups: List[list] = []
+        for key, count in sorted(counts, key=lambda item: (-item[1], item[0])):
+            match = process.extractOne(key, representatives, scorer=fuzz.token_sort_ratio, score_cutoff=threshold)
+            if match is None:
+                representatives.append(key)
+                groups.append([key, count, []])
+            else:
+                group = groups[match[2]]
+                group[1] += count
+                group[2].append(key)
+        groups.sort(key=lambda group: -group[1])
+        return [tuple(group) for group in groups[:limit]]
+
+    def to_dict(self) -> dict:
+        return {'version': ROLLUP_FORMAT_VERSION, **asdict(self)}
+
+    @classmethod
+    def load(cls, path: Path) -> 'Rollup':
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls()
+        if data.pop('version', None) != ROLLUP_FORMAT_VERSION:
+            return cls()
+        return cls(**data)
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        tmp_path.replace(path)
+
+
+def _open_segment(path: Path) -> io.BufferedIOBase:
+    return gzip.open(path, 'rb') if path.suffix == '.gz' else open(path, 'rb')
+
+
+def fingerprint(path: Path) -> Optional[str]:
+    """Identity of a segment that survives rotation and compression.
+
+    The first data row carries a microsecond timestamp, so the header plus
+    that row tells segments apart; None while a log has no rows yet.
+    """
+    with _open_segment(path) as f:
+        head = f.readline() + f.readline()
+    if head.count(b'\n') < 2:
+        return None
+    return hashlib.sha1(head).hexdigest()
+
+
+def read_new_rows(path: Path, offset: int, live: bool) -> Iterator[Tuple[List[str], int]]:
+    """Yield (row, offset after it) for the complete lines of `path` past `offset`.
+
+    In the live log a final line without its newline may still be being
+    written, so it is left for the next run.
+    """
+    with _open_segment(path) as f:
+        if offset:
+            f.seek(offset)  # gzip streams seek by decompressing up to the offset
+        else:
+            offset = len(f.readline())  # header
+        while True:
+            line = f.readline()
+            if not line or (live and not line.endswith(b'\n')):
+                return
+            offset += len(line)
+            for row in csv.reader([line.decode('utf-8', errors='replace')]):
+                yield row, offset
+
+
+def update_rollup(
+    rollup: Rollup,
+    log_path: Path = LOG_PATH,
+    max_queries: int = REPORT_MAX_QUERIES,
+) -> int:
+    """Fold the rows not seen yet into `rollup`; returns how many were read."""
+    read = 0
+    for path in log_segments(log_path):
+        key = fingerprint(path)
+        if key is None:
+            continue
+        offset, finished = rollup.segments.get(key, [0, False])
+        if finished:
+            continue
+        live = path == log_path
+        for row, offset in read_new_rows(path, offset, live):
+            rollup.add(row, max_queries)
+            read += 1
+        # Rotated segments never change again.
+        rollup.segments[key] = [offset, not live]
+    return read
+
+
+def format_report(rollup: Rollup, top: int) -> str:
+    if not rollup.rows:
+        return "The activity log is empty."
+    lines = [
+        f"{rollup.rows:,} requests from {rollup.first[:10]} to {rollup.last[:10]}",
+        f"Local hit rate: {rollup.hit_rate * 100:.1f}%  ("
+        + " · ".join(f"{status} {count:,}" for status, count in sorted(rollup.statuses.items()))
+        + ")",
+        "",
+        f"Top {top} unavailable requests:",
+    ]
+    for i, (query, count, variants) in enumerate(rollup.top_unavailable(top), 1):
+        extra = f"  (+{len(variants)} similar)" if variants else ""
+        lines.append(f"  {i:>3}. {count:>6,}  {query}{extra}")
+    if rollup.unavailable_error:
+        lines.append(f"  (counts may be low by up to {rollup.unavailable_error:,})")
+    lines += ["", "Downloads per provider:"]
+    for provider, count in sorted(rollup.providers.items(), key=lambda item: -item[1]):
+        lines.append(f"  {provider:<24} {count:>8,}")
+    lines += ["", "Requests per hour of day:"]
+    peak = max(rollup.hours) or 1
+    for hour, count in enumerate(rollup.hours):
+        if count:
+            lines.append(f"  {hour:02d}:00 {count:>8,} {'#' * round(40 * count / peak)}")
+    return "\n".join(lines)
+
+
+def report_dict(rollup: Rollup, top: int) -> dict:
+    return {
+        'rows': rollup.rows,
+        'first': rollup.first,
+        'last': rollup.last,
+        'statuses': rollup.statuses,
+        'local_hit_rate': rollup.hit_rate,
+        'top_unavailable': [
+            {'query': query, 'count': count, 'similar': variants}
+            for query, count, variants in rollup.top_unavailable(top)
+        ],
+        'unavailable_count_error': rollup.unavailable_error,
+        'downloads_per_provider': rollup.providers,
+        'requests_per_hour': rollup.hours,
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m karaoke_triage.report", description=__doc__.splitlines()[0])
+    parser.add_argument("--log", type=Path, default=LOG_PATH, help="activity log (rotated segments are found next to it)")
+    parser.add_argument("--rollup", type=Path, default=REPORT_ROLLUP_PATH, help="where the running totals are kept")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--format", choices=("text", "json"), default="text")
+    parser.add_argument("--rebuild", action="store_true", help="ignore the saved totals and read the whole log")
+    args = parser.parse_args(argv[1:])
+
+    rollup = Rollup() if args.rebuild else Rollup.load(args.rollup)
+    read = update_rollup(rollup, args.log)
+    rollup.save(args.rollup)
+
+    if args.format == "json":
+        print(json.dumps(report_dict(rollup, args.top), indent=2))
+    else:
+        print(format_report(rollup, args.top))
+        print(f"\n({read:,} new rows read)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,834 @@
+"""Share one song index, scraper, download queue and activity log between TUIs.
+
+    python -m karaoke_triage.service --port 8766
+
+`TriageService` holds everything a venue shares. The TUI normally builds
+one in its own process; with the daemon running, every TUI talks to the
+daemon's instead (see `connect`), so the index is loaded once, the scrape
+cache and download queue are shared, and one process writes the log.
+
+The daemon speaks JSON over HTTP on loopback. Each request gets its own
+thread, and scrapes run as tasks on one event loop owned by the service,
+so a slow scrape or download holds up only the client that asked for it.
+Searches stream their versions back as newline-delimited JSON while the
+page is parsed. Download updates are pushed to clients through a long
+poll on /events.
+
+    GET  /health                        {"ok": true, "songs": ..., "pending_downloads": ...}
+    POST /live        {query, client}   {"results": [...]}
+    POST /resolve     {query, online, stop_on_near_miss, requested_by}
+                                        {"version": ...} lines, then {"outcome": ...}
+    POST /search      {query, requested_by}
+                                        {"version": ...} lines, then {"versions": [...]}
+    GET  /downloads                     {"jobs": [...]}
+    POST /downloads   {version, priority, requested_by}
+                                        {"job": ..., "created": bool}
+    POST /downloads/cancel {id}         {"cancelled": bool}
+    GET  /events?after=N                {"seq": M, "jobs": [...], "reset": bool}
+    GET  /stats                         metrics snapshot
+    GET  /metrics                       Prometheus text
+    POST /library/scan                  {"added": ..., "removed": ..., "moved": ..., ...}
+    POST /profile     {operations, mode}
+                                        {"directory": ..., "armed": bool, ...}
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import logging
+import os
+import queue
+import select
+import socket
+import sys
+import threading
+from collections import deque
+from dataclasses import asdict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from .async_scraper import AsyncKaraokeNerdsScraper
+from .config import (
+    DEBUG_LOG_LEVEL,
+    DEBUG_LOG_PATH,
+    PREFETCH_ENABLED,
+    PROFILE_MODE,
+    PROFILE_OPERATIONS,
+    SERVICE_CONNECT_TIMEOUT,
+    SERVICE_EVENT_WAIT,
+    SERVICE_HOST,
+    SERVICE_MODE,
+    SERVICE_PORT,
+    SERVICE_REQUEST_TIMEOUT,
+    SERVICE_STREAM_TIMEOUT,
+)
+from .database import SongDatabase
+from .download_queue import DownloadJob, DownloadManager, JobState, PRIORITY_NORMAL, PRIORITY_PREFETCH
+from .library import LibraryScanner, ReconcileReport, reconcile
+from .live import LiveMatcher
+from .logger import ActivityLogger
+from .metrics import metrics
+from .models import KaraokeVersion, SearchResult, Song, SongStatus
+from .pipeline import QueryOutcome, QueryPipeline
+from .prefetch import IdleMonitor, Prefetcher
+from .profiling import CaptureInfo, profiler
+from .progress import DownloadProgress
+from .warmup import warm_up
+
+logger = logging.getLogger(__name__)
+
+MAX_LIVE_CLIENTS = 64  # live matchers kept per service; the least recent goes first
+EVENT_BACKLOG = 1000  # download updates kept for clients that are catching up
+STREAM_POLL_INTERVAL = 1.0  # seconds between checks that a streaming client is still there
+
+VersionCallback = Optional[Callable[[KaraokeVersion], None]]
+
+
+class ServiceError(Exception):
+    """The service could not be reached or rejected a request."""
+
+
+# -- wire format -----------------------------------------------------------
+
+def song_to_wire(song: Song) -> dict:
+    data = asdict(song)
+    if song.date_downloaded is not None:
+        data['date_downloaded'] = song.date_downloaded.isoformat()
+    return data
+
+
+def song_from_wire(data: dict) -> Song:
+    data = dict(data)
+    if data.get('date_downloaded'):
+        data['date_downloaded'] = datetime.fromisoformat(data['date_downloaded'])
+    return Song(**data)
+
+
+def result_to_wire(result: SearchResult) -> dict:
+    return {
+        'song': song_to_wire(result.song),
+        'status': result.status.value,
+        'youtube_link': result.youtube_link,
+        'confidence': result.confidence,
+    }
+
+
+def result_from_wire(data: dict) -> SearchResult:
+    return SearchResult(
+        song=song_from_wire(data['song']),
+        status=SongStatus(data['status']),
+        youtube_link=data.get('youtube_link'),
+        confidence=data.get('confidence'),
+    )
+
+
+def outcome_to_wire(outcome: QueryOutcome) -> dict:
+    return {
+        'query': outcome.query,
+        'local_match': song_to_wire(outcome.local_match) if outcome.local_match else None,
+        'near_misses': [result_to_wire(result) for result in outcome.near_misses],
+        'versions': None if outcome.versions is None else [asdict(version) for version in outcome.versions],
+        'timings': outcome.timings,
+        'speculative': outcome.speculative,
+    }
+
+
+def outcome_from_wire(data: dict) -> QueryOutcome:
+    versions = data.get('versions')
+    return QueryOutcome(
+        query=data['query'],
+        local_match=song_from_wire(data['local_match']) if data.get('local_match') else None,
+        near_misses=[result_from_wire(result) for result in data.get('near_misses', [])],
+        versions=None if versions is None else [KaraokeVersion(**version) for version in versions],
+        timings=data.get('timings', {}),
+        speculative=data.get('speculative', False),
+    )
+
+
+def job_to_wire(job: DownloadJob) -> dict:
+    data = job.to_dict()
+    data['progress'] = asdict(job.progress) if job.progress is not None else None
+    return data
+
+
+def job_from_wire(data: dict) -> DownloadJob:
+    data = dict(data)
+    progress = data.pop('progress', None)
+    job = DownloadJob.from_dict(data)
+    if progress is not None:
+        job.progress = DownloadProgress(**progress)
+    return job
+
+
+# -- the service -------------------------------------------------------------
+
+class TriageService:
+    """The song index, scraper, download queue, library scanner and activity log.
+
+    The TUI talks to this class, or to a `ServiceClient` with the same
+    methods. The service writes the activity log rows for what it settles
+    itself: local hits, searches that found nothing, and finished downloads,
+    which are also added to the index. `add_listener` callbacks get every
+    download update, from the download worker threads. Queries and
+    submissions mark the service busy, which pauses the prefetcher.
+
+    Coroutines must all be awaited on one event loop; everything else is
+    safe to call from any thread.
+    """
+
+    def __init__(
+        self,
+        database: Optional[SongDatabase] = None,
+        scraper: Optional[AsyncKaraokeNerdsScraper] = None,
+        logger: Optional[ActivityLogger] = None,
+        downloads: Optional[DownloadManager] = None,
+        scanner: Optional[LibraryScanner] = None,
+        prefetch: bool = PREFETCH_ENABLED,
+    ):
+        self.database = database if database is not None else SongDatabase()
+        self.scraper = scraper if scraper is not None else AsyncKaraokeNerdsScraper()
+        self.pipeline = QueryPipeline(self.database, self.scraper)
+        self.logger = logger if logger is not None else ActivityLogger()
+        self.downloads = downloads if downloads is not None else DownloadManager()
+        self.downloads.on_update = self._download_updated
+        self.scanner = scanner if scanner is not None else LibraryScanner()
+        self._live: Dict[str, LiveMatcher] = {}
+        self._live_lock = threading.Lock()
+        self._listeners: List[Callable[[DownloadJob], None]] = []
+        self.idle = IdleMonitor()
+        self.prefetcher = Prefetcher(self) if prefetch else None
+        if self.prefetcher is not None:
+            self.add_listener(self.prefetcher.on_download)
+
+    def describe(self) -> str:
+        return "in-process"
+
+    def start(self) -> None:
+        self.downloads.start()
+
+    async def aclose(self) -> None:
+        self.downloads.stop()
+        self.logger.close()
+        await self.scraper.aclose()
+
+    def add_listener(self, callback: Callable[[DownloadJob], None]) -> None:
+        self._listeners.append(callback)
+
+    def _download_updated(self, job: DownloadJob) -> None:
+        if job.state is JobState.DONE:
+            self._add_downloaded(job)
+        for callback in list(self._listeners):
+            try:
+                callback(job)
+            except Exception:
+                logger.exception("Download listener failed")
+
+    def _add_downloaded(self, job: DownloadJob) -> None:
+        song = job.to_song()
+        self.database.add_song(song)
+        self.logger.log_activity(song, SongStatus.DOWNLOADED, job.requested_by)
+
+    def warm_up(self) -> float:
+        return warm_up(self.database, self.scraper)
+
+    def live(self, query: str, client: str = '') -> List[SearchResult]:
+        """Live matches for `client`'s search box; each client narrows its own candidates."""
+        self.idle.touch()
+        with self._live_lock:
+            matcher = self._live.pop(client, None) or LiveMatcher(self.database)
+            self._live[client] = matcher  # most recent last
+            while len(self._live) > MAX_LIVE_CLIENTS:
+                del self._live[next(iter(self._live))]
+        return matcher.update(query)
+
+    async def resolve(
+        self,
+        query: str,
+        online: bool = True,
+        stop_on_near_miss: bool = True,
+        on_version: VersionCallback = None,
+        requested_by: Optional[str] = None,
+    ) -> QueryOutcome:
+        with self.idle.busy():
+            outcome = await self.pipeline.resolve(query, online, stop_on_near_miss, on_version)
+        if self.prefetcher is not None:
+            self.prefetcher.note_outcome(query, outcome.local_match, bool(outcome.versions))
+        if outcome.local_match:
+            self.logger.log_activity(outcome.local_match, SongStatus.LOCAL, requested_by)
+        elif outcome.status is SongStatus.UNAVAILABLE:
+            self.logger.log_activity(Song(title=query, artist=""), SongStatus.UNAVAILABLE, requested_by)
+        return outcome
+
+    async def search_online(
+        self,
+        query: str,
+        on_version: VersionCallback = None,
+        requested_by: Optional[str] = None,
+    ) -> List[KaraokeVersion]:
+        with profiler.operation(), self.idle.busy():
+            versions = await self.pipeline.search_online(query, on_version)
+        if self.prefetcher is not None:
+            self.prefetcher.note_outcome(query, None, bool(versions))
+        if not versions:
+            self.logger.log_activity(Song(title=query, artist=""), SongStatus.UNAVAILABLE, requested_by)
+        return versions
+
+    def submit(
+        self,
+        version: KaraokeVersion,
+        priority: int = PRIORITY_NORMAL,
+        requested_by: Optional[str] = None,
+    ) -> Tuple[DownloadJob, bool]:
+        if priority < PRIORITY_PREFETCH:
+            self.idle.touch()
+        job, created = self.downloads.submit(version, priority, requested_by)
+        if created and job.state is JobState.DONE and not self.database.has_file(job.file_path):
+            # On disk but not in the library yet; the manager does not report these.
+            self._add_downloaded(job)
+        return job, created
+
+    def cancel(self, job_id: str) -> bool:
+        return self.downloads.cancel(job_id)
+
+    def jobs(self) -> List[DownloadJob]:
+        return self.downloads.snapshot()
+
+    def pending_count(self) -> int:
+        return self.downloads.pending_count()
+
+    def stats(self) -> dict:
+        return metrics.snapshot()
+
+    def scan_library(self) -> ReconcileReport:
+        return reconcile(self.database, self.scanner.scan())
+
+    def profile(self, operations: int = PROFILE_OPERATIONS, mode: str = PROFILE_MODE) -> CaptureInfo:
+        """Profile the next `operations` queries and downloads, or stop the capture running."""
+        return profiler.toggle(operations, mode)
+
+    async def run_prefetcher(self) -> None:
+        """Prefetch in the background until cancelled; returns at once when prefetching is off."""
+        if self.prefetcher is not None:
+            await self.prefetcher.run()
+
+
+# -- daemon --------------------------------------------------------------------
+
+class ServiceServer:
+    """Serves a TriageService over HTTP on a thread per request.
+
+    The service's coroutines run on an event loop in a thread of its own;
+    request threads hand them over with `run_coroutine_threadsafe` and wait
+    only for their own.
+    """
+
+    def __init__(self, service: TriageService, host: str = SERVICE_HOST, port: int = SERVICE_PORT):
+        self.service = service
+        self.loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self.loop.run_forever, name='service-loop', daemon=True)
+        self._events: Deque[Tuple[int, dict]] = deque(maxlen=EVENT_BACKLOG)
+        self._seq = 0
+        self._events_cond = threading.Condition()
+        self._prefetch = None
+        service.add_listener(self._publish)
+        self.httpd = ThreadingHTTPServer((host, port), _handler_for(self))
+        self.httpd.daemon_threads = True
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.httpd.server_address[:2]
+
+    def run_coroutine(self, coro, timeout: Optional[float] = None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def start(self) -> 'ServiceServer':
+        self._loop_thread.start()
+        self.service.start()
+        threading.Thread(target=self.service.warm_up, name='service-warmup', daemon=True).start()
+        threading.Thread(target=self.httpd.serve_forever, name='service-http', daemon=True).start()
+        self._prefetch = asyncio.run_coroutine_threadsafe(self.service.run_prefetcher(), self.loop)
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._prefetch is not None:
+            self._prefetch.cancel()
+        self.run_coroutine(self.service.aclose(), timeout=10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._loop_thread.join()
+
+    def _publish(self, job: DownloadJob) -> None:
+        with self._events_cond:
+            self._seq += 1
+            self._events.append((self._seq, job_to_wire(job)))
+            self._events_cond.notify_all()
+
+    def events(self, after: Optional[int], wait: float) -> dict:
+        """Download updates after sequence number `after`, waiting up to `wait` seconds for one.
+
+        `reset` tells a client that it fell further behind than the backlog
+        and should fetch the full job list instead.
+        """
+        with self._events_cond:
+            if after is None:
+                return {'seq': self._seq, 'jobs': [], 'reset': False}
+            self._events_cond.wait_for(lambda: self._seq > after, timeout=wait)
+            oldest = self._events[0][0] if self._events else self._seq + 1
+            jobs = [job for seq, job in self._events if seq > after]
+            return {'seq': self._seq, 'jobs': jobs, 'reset': after + 1 < oldest and self._seq > after}
+
+
+def _handler_for(server: ServiceServer):
+    service = server.service
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.0'  # streamed replies end when the connection closes
+
+        def log_message(self, format, *args):
+            logger.debug("%s %s", self.address_string(), format % args)
+
+        def _send_json(self, data, status: int = 200) -> None:
+            body = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self) -> dict:
+            length = int(self.headers.get('Content-Length') or 0)
+            data = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(data, dict):
+                raise ValueError("expected a JSON object")
+            return data
+
+        def _dispatch(self, routes: dict) -> None:
+            url = urlsplit(self.path)
+            route = routes.get(url.path)
+            if route is None:
+                self._send_json({'error': f"no such endpoint: {url.path}"}, 404)
+                return
+            try:
+                route(self, url)
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_json({'error': f"bad request: {e}"}, 400)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            except Exception as e:
+                logger.exception("%s %s failed", self.command, self.path)
+                self._send_json({'error': str(e)}, 500)
+
+        def do_GET(self):
+            self._dispatch({
+                '/health': Handler.health,
+                '/downloads': Handler.downloads,
+                '/events': Handler.events,
+                '/stats': Handler.stats,
+                '/metrics': Handler.prometheus,
+            })
+
+        def do_POST(self):
+            self._dispatch({
+                '/live': Handler.live,
+                '/resolve': Handler.resolve,
+                '/search': Handler.search,
+                '/downloads': Handler.submit,
+                '/downloads/cancel': Handler.cancel,
+                '/library/scan': Handler.scan,
+                '/profile': Handler.profile,
+            })
+
+        # -- endpoints -----------------------------------------------------
+
+        def health(self, url):
+            self._send_json({
+                'ok': True,
+                'pid': os.getpid(),
+                'songs': service.database.size,
+                'pending_downloads': service.pending_count(),
+            })
+
+        def live(self, url):
+            data = self._body()
+            results = service.live(data['query'], str(data.get('client', '')))
+            self._send_json({'results': [result_to_wire(result) for result in results]})
+
+        def resolve(self, url):
+            data = self._body()
+            self._stream('outcome', outcome_to_wire, lambda on_version: service.resolve(
+                data['query'],
+                online=data.get('online', True),
+                stop_on_near_miss=data.get('stop_on_near_miss', True),
+                on_version=on_version,
+                requested_by=data.get('requested_by'),
+            ))
+
+        def search(self, url):
+            data = self._body()
+            self._stream('versions', lambda versions: [asdict(version) for version in versions],
+                         lambda on_version: service.search_online(
+                             data['query'], on_version, requested_by=data.get('requested_by')))
+
+        def _stream(self, key: str, encode, start) -> None:
+            """Run start(on_version) on the service loop, writing each version as it comes."""
+            lines: queue.SimpleQueue = queue.SimpleQueue()
+
+            async def run():
+                try:
+                    result = await start(lambda version: lines.put({'version': asdict(version)}))
+                    lines.put({key: encode(result)})
+                except Exception as e:
+                    logger.exception("%s failed", self.path)
+                    lines.put({'error': str(e)})
+
+            future = asyncio.run_coroutine_threadsafe(run(), server.loop)
+            finished = False
+            try:
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.end_headers()
+                while True:
+                    try:
+                        line = lines.get(timeout=STREAM_POLL_INTERVAL)
+                    except queue.Empty:
+                        if self._client_gone():
+                            return
+                        continue
+                    self.wfile.write(json.dumps(line).encode() + b'\n')
+                    self.wfile.flush()
+                    if 'version' not in line:
+                        finished = True
+                        return
+            except OSError as e:
+                logger.debug("%s: client went away: %s", self.path, e)
+            finally:
+                if not finished:
+                    # The client gave up (its query was superseded); so do we.
+                    future.cancel()
+
+        def _client_gone(self) -> bool:
+            """True once the client has closed its end of a streamed reply."""
+            try:
+                readable, _, _ = select.select([self.connection], [], [], 0)
+                return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+            except OSError:
+                return True
+
+        def downloads(self, url):
+            self._send_json({'jobs': [job_to_wire(job) for job in service.jobs()]})
+
+        def submit(self, url):
+            data = self._body()
+            job, created = service.submit(
+                KaraokeVersion(**data['version']),
+                int(data.get('priority', PRIORITY_NORMAL)),
+                data.get('requested_by'),
+            )
+            self._send_json({'job': job_to_wire(job), 'created': created})
+
+        def cancel(self, url):
+            self._send_json({'cancelled': service.cancel(self._body()['id'])})
+
+        def events(self, url):
+            params = parse_qs(url.query)
+            after = int(params['after'][0]) if 'after' in params else None
+            wait = min(float(params.get('wait', [SERVICE_EVENT_WAIT])[0]), SERVICE_EVENT_WAIT)
+            self._send_json(server.events(after, wait))
+
+        def stats(self, url):
+            self._send_json(service.stats())
+
+        def prometheus(self, url):
+            body = metrics.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def scan(self, url):
+            self._send_json(asdict(service.scan_library()))
+
+        def profile(self, url):
+            data = self._body()
+            self._send_json(asdict(service.profile(
+                data.get('operations', PROFILE_OPERATIONS), data.get('mode', PROFILE_MODE))))
+
+    return Handler
+
+
+# -- client --------------------------------------------------------------------
+
+class ServiceClient:
+    """A TriageService in another process, reached over its HTTP API.
+
+    Uses only the standard library so the TUI starts as fast as before.
+    Blocking calls are for worker threads; `resolve` and `search_online`
+    are coroutines that stream versions to `on_version` on the caller's
+    event loop as the daemon sends them.
+    """
+
+    def __init__(
+        self,
+        host: str = SERVICE_HOST,
+        port: int = SERVICE_PORT,
+        timeout: float = SERVICE_REQUEST_TIMEOUT,
+        client_id: Optional[str] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.client_id = client_id or f"{os.getpid()}"
+        self._listeners: List[Callable[[DownloadJob], None]] = []
+        self._events_thread: Optional[threading.Thread] = None
+        self._closed = threading.Event()
+
+    def describe(self) -> str:
+        return f"service at {self.host}:{self.port}"
+
+    def _open(
+        self,
+        method: str,
+        path: str,
+        body: Optional[dict],
+        timeout: Optional[float],
+        on_connect: Optional[Callable[[socket.socket], None]] = None,
+    ):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout or self.timeout)
+        try:
+            payload = json.dumps(body).encode() if body is not None else None
+            headers = {'Content-Type': 'application/json'} if payload is not None else {}
+            conn.request(method, path, body=payload, headers=headers)
+            if on_connect is not None:
+                on_connect(conn.sock)
+            response = conn.getresponse()
+        except OSError as e:
+            conn.close()
+            raise ServiceError(f"{self.describe()}: {e}") from e
+        if response.status >= 400:
+            try:
+                message = json.loads(response.read()).get('error')
+            except ValueError:
+                message = None
+            conn.close()
+            raise ServiceError(message or f"{method} {path}: HTTP {response.status}")
+        return conn, response
+
+    def request(self, method: str, path: str, body: Optional[dict] = None, timeout: Optional[float] = None) -> dict:
+        conn, response = self._open(method, path, body, timeout)
+        try:
+            return json.loads(response.read())
+        except (OSError, ValueError) as e:
+            raise ServiceError(f"{method} {path}: {e}") from e
+        finally:
+            conn.close()
+
+    def health(self, timeout: Optional[float] = None) -> dict:
+        return self.request('GET', '/health', timeout=timeout)
+
+    # -- same methods as TriageService ---------------------------------
+
+    def start(self) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        self._closed.set()
+
+    def add_listener(self, callback: Callable[[DownloadJob], None]) -> None:
+        self._listeners.append(callback)
+        if self._events_thread is None:
+            self._events_thread = threading.Thread(target=self._poll_events, name='service-events', daemon=True)
+            self._events_thread.start()
+
+    def _poll_events(self) -> None:
+        seq = None
+        while not self._closed.is_set():
+            path = '/events' if seq is None else f'/events?after={seq}&wait={SERVICE_EVENT_WAIT}'
+            try:
+                data = self.request('GET', path, timeout=SERVICE_EVENT_WAIT + self.timeout)
+            except ServiceError as e:
+                logger.warning("Lost download updates from %s: %s", self.describe(), e)
+                self._closed.wait(1.0)
+                continue
+            seq = data['seq']
+            jobs = data['jobs']
+            if data.get('reset'):
+                jobs = [job_to_wire(job) for job in self.jobs()]
+            for item in jobs:
+                job = job_from_wire(item)
+                for callback in list(self._listeners):
+                    try:
+                        callback(job)
+                    except Exception:
+                        logger.exception("Download listener failed")
+
+    def warm_up(self) -> float:
+        # The daemon loaded everything when it started.
+        return 0.0
+
+    def live(self, query: str, client: str = '') -> List[SearchResult]:
+        data = self.request('POST', '/live', {'query': query, 'client': client or self.client_id})
+        return [result_from_wire(result) for result in data['results']]
+
+    def _stream(
+        self,
+        path: str,
+        body: dict,
+        on_line: Callable[[dict], None],
+        on_connect: Optional[Callable[[socket.socket], None]] = None,
+    ) -> dict:
+        """POST `body` and pass each streamed version line to `on_line`; returns the last line.
+
+        The connection uses the control-call timeout, but the reply may take
+        as long as a scrape does: only a gap of SERVICE_STREAM_TIMEOUT
+        between lines gives up.
+        """
+        def connected(sock: socket.socket) -> None:
+            sock.settimeout(SERVICE_STREAM_TIMEOUT)
+            if on_connect is not None:
+                on_connect(sock)
+
+        conn, response = self._open('POST', path, body, None, connected)
+        try:
+            for raw in response:
+                line = json.loads(raw)
+                if 'version' in line:
+                    on_line(line)
+                    continue
+                if 'error' in line:
+                    raise ServiceError(line['error'])
+                return line
+        except (OSError, ValueError) as e:
+            raise ServiceError(f"POST {path}: {e}") from e
+        finally:
+            conn.close()
+        raise ServiceError(f"POST {path}: reply ended early")
+
+    async def _stream_versions(self, path: str, body: dict, on_version: VersionCallback) -> dict:
+        loop = asyncio.get_running_loop()
+        cancelled = threading.Event()
+        sockets: List[socket.socket] = []
+
+        def on_connect(sock: socket.socket) -> None:
+            sockets.append(sock)
+            if cancelled.is_set():
+                raise ConnectionAbortedError("cancelled")
+
+        def on_line(line: dict) -> None:
+            if on_version is not None:
+                loop.call_soon_threadsafe(on_version, KaraokeVersion(**line['version']))
+
+        try:
+            return await asyncio.to_thread(self._stream, path, body, on_line, on_connect)
+        except asyncio.CancelledError:
+            # The caller moved on: hang up, which wakes the reading thread
+            # and tells the daemon to stop the scrape.
+            cancelled.set()
+            for sock in sockets:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            raise
+
+    async def resolve(
+        self,
+        query: str,
+        online: bool = True,
+        stop_on_near_miss: bool = True,
+        on_version: VersionCallback = None,
+        requested_by: Optional[str] = None,
+    ) -> QueryOutcome:
+        body = {'query': query, 'online': online, 'stop_on_near_miss': stop_on_near_miss, 'requested_by': requested_by}
+        line = await self._stream_versions('/resolve', body, on_version)
+        return outcome_from_wire(line['outcome'])
+
+    async def search_online(
+        self,
+        query: str,
+        on_version: VersionCallback = None,
+        requested_by: Optional[str] = None,
+    ) -> List[KaraokeVersion]:
+        line = await self._stream_versions('/search', {'query': query, 'requested_by': requested_by}, on_version)
+        return [KaraokeVersion(**version) for version in line['versions']]
+
+    def submit(
+        self,
+        version: KaraokeVersion,
+        priority: int = PRIORITY_NORMAL,
+        requested_by: Optional[str] = None,
+    ) -> Tuple[DownloadJob, bool]:
+        data = self.request('POST', '/downloads', {
+            'version': asdict(version), 'priority': priority, 'requested_by': requested_by,
+        })
+        return job_from_wire(data['job']), data['created']
+
+    def cancel(self, job_id: str) -> bool:
+        return self.request('POST', '/downloads/cancel', {'id': job_id})['cancelled']
+
+    def jobs(self) -> List[DownloadJob]:
+        return [job_from_wire(job) for job in self.request('GET', '/downloads')['jobs']]
+
+    def pending_count(self) -> int:
+        return self.health()['pending_downloads']
+
+    def stats(self) -> dict:
+        return self.request('GET', '/stats')
+
+    def scan_library(self) -> ReconcileReport:
+        # Scans can take a while on a large library.
+        return ReconcileReport(**self.request('POST', '/library/scan', {}, timeout=600))
+
+    def profile(self, operations: int = PROFILE_OPERATIONS, mode: str = PROFILE_MODE) -> CaptureInfo:
+        return CaptureInfo(**self.request('POST', '/profile', {'operations': operations, 'mode': mode}))
+
+
+def connect(mode: str = SERVICE_MODE, host: str = SERVICE_HOST, port: int = SERVICE_PORT):
+    """The daemon's ServiceClient if it answers, else an in-process TriageService.
+
+    With `mode` "local" the daemon is not tried; with "remote" an
+    unreachable daemon raises ServiceError instead of falling back.
+    """
+    if mode not in ('auto', 'local', 'remote'):
+        raise ValueError(f"Unknown service mode {mode!r}; expected 'auto', 'local' or 'remote'")
+    if mode != 'local':
+        client = ServiceClient(host, port)
+        try:
+            client.health(timeout=SERVICE_CONNECT_TIMEOUT)
+            return client
+        except ServiceError as e:
+            if mode == 'remote':
+                raise
+            logger.info("No service at %s:%s (%s); running in-process", host, port, e)
+    return TriageService()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m karaoke_triage.service", description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    args = parser.parse_args(argv[1:])
+
+    DEBUG_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(
+        filename=DEBUG_LOG_PATH,
+        level=DEBUG_LOG_LEVEL,
+        format="%(asctime)s %(levelname)s %(threadName)s %(name)s: %(message)s",
+    )
+    server = ServiceServer(TriageService(), args.host, args.port).start()
+    host, port = server.address
+    print(f"Serving on http://{host}:{port} (Ctrl+C to stop)", file=sys.stderr)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,310 @@
+import csv
+import os
+import re
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .config import DATABASE_PATH, SQLITE_DATABASE_PATH
+
+# title, artist, file_path, date_downloaded, source -- all strings, '' when unknown
+Row = Tuple[str, str, str, str, str]
+
+CSV_HEADER = ['title', 'artist', 'file_path', 'date_downloaded', 'source']
+
+
+def _stat(path: Path) -> Tuple[int, int]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return (0, -1)
+    return (st.st_mtime_ns, st.st_size)
+
+
+class SongStore:
+    """Persistent storage behind SongDatabase.
+
+    Rows are identified by an integer id that only ever increases, so ids
+    yielded by `iter_rows` are in ascending order.
+    """
+
+    supports_prefilter = False
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def ensure_exists(self) -> None:
+        raise NotImplementedError
+
+    def signature(self) -> Tuple:
+        """A cheap value that changes whenever the stored rows change."""
+        raise NotImplementedError
+
+    def iter_rows(self) -> Iterator[Tuple[int, Row]]:
+        raise NotImplementedError
+
+    def add(self, row: Row) -> Optional[int]:
+        """Store a row and return its id, or None if it was a duplicate."""
+        raise NotImplementedError
+
+    def add_many(self, rows: Iterable[Row]) -> int:
+        """Store several rows, skipping duplicates. Returns the number inserted."""
+        return sum(1 for row in rows if self.add(row) is not None)
+
+    def remove(self, ids: Iterable[int]) -> int:
+        """Delete rows by id. Returns the number deleted."""
+        raise NotImplementedError
+
+    def set_paths(self, paths: Dict[int, str]) -> int:
+        """Change the file_path of rows by id. Returns the number changed."""
+        raise NotImplementedError
+
+    def candidates(self, query: str, limit: int) -> Optional[List[int]]:
+        """Ids of rows likely to match `query`, or None if the store cannot prefilter."""
+        return None
+
+
+class CsvSongStore(SongStore):
+    """The original flat songs.csv file. Ids are row numbers."""
+
+    def __init__(self, path: Path = DATABASE_PATH):
+        super().__init__(path)
+        self._count = None
+
+    def ensure_exists(self) -> None:
+        if not self.path.exists():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(CSV_HEADER)
+
+    def signature(self) -> Tuple:
+        return _stat(self.path)
+
+    def iter_rows(self) -> Iterator[Tuple[int, Row]]:
+        count = 0
+        with open(self.path, 'r', newline='') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield count, (
+                    row['title'],
+                    row['artist'],
+                    row['file_path'] or '',
+                    row['date_downloaded'] or '',
+                    row['source'] or '',
+                )
+                count += 1
+        self._count = count
+
+    def add(self, row: Row) -> Optional[int]:
+        if self._count is None:
+            self._count = sum(1 for _ in self.iter_rows())
+        with open(self.path, 'a', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(row)
+        self._count += 1
+        return self._count - 1
+
+    def add_many(self, rows: Iterable[Row]) -> int:
+        if self._count is None:
+            self._count = sum(1 for _ in self.iter_rows())
+        with open(self.path, 'a', newline='') as f:
+            writer = csv.writer(f)
+            before = self._count
+            for row in rows:
+                writer.writerow(row)
+                self._count += 1
+        return self._count - before
+
+    def _rewrite(self, rows: Iterable[Row]) -> None:
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADER)
+            writer.writerows(rows)
+        tmp_path.replace(self.path)
+        self._count = None
+
+    def remove(self, ids: Iterable[int]) -> int:
+        # Row numbers are ids, so removing rows renumbers the ones after them.
+        ids = set(ids)
+        if not ids:
+            return 0
+        kept = [row for row_id, row in self.iter_rows() if row_id not in ids]
+        removed = self._count - len(kept)
+        self._rewrite(kept)
+        return removed
+
+    def set_paths(self, paths: Dict[int, str]) -> int:
+        if not paths:
+            return 0
+        rows = []
+        changed = 0
+        for row_id, row in self.iter_rows():
+            if row_id in paths:
+                row = (row[0], row[1], paths[row_id], row[3], row[4])
+                changed += 1
+            rows.append(row)
+        self._rewrite(rows)
+        return changed
+
+
+class SqliteSongStore(SongStore):
+    """SQLite storage with an FTS5 token index and a unique (title, artist, source) key.
+
+    The database runs in WAL mode so lookups from one process or thread do not
+    block inserts from another.
+    """
+
+    supports_prefilter = True
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS songs (
+        id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        artist TEXT NOT NULL,
+        file_path TEXT NOT NULL DEFAULT '',
+        date_downloaded TEXT NOT NULL DEFAULT '',
+        source TEXT NOT NULL DEFAULT ''
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS songs_identity ON songs (title, artist, source);
+    CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5 (
+        title, artist, content='songs', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    );
+    CREATE TRIGGER IF NOT EXISTS songs_ai AFTER INSERT ON songs BEGIN
+        INSERT INTO songs_fts (rowid, title, artist) VALUES (new.id, new.title, new.artist);
+    END;
+    CREATE TRIGGER IF NOT EXISTS songs_ad AFTER DELETE ON songs BEGIN
+        INSERT INTO songs_fts (songs_fts, rowid, title, artist) VALUES ('delete', old.id, old.title, old.artist);
+    END;
+    CREATE TRIGGER IF NOT EXISTS songs_au AFTER UPDATE ON songs BEGIN
+        INSERT INTO songs_fts (songs_fts, rowid, title, artist) VALUES ('delete', old.id, old.title, old.artist);
+        INSERT INTO songs_fts (rowid, title, artist) VALUES (new.id, new.title, new.artist);
+    END;
+    """
+
+    def __init__(self, path: Path = SQLITE_DATABASE_PATH):
+        super().__init__(path)
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections must not be shared."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def ensure_exists(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.connection as conn:
+            conn.executescript(self.SCHEMA)
+
+    def signature(self) -> Tuple:
+        return _stat(self.path) + _stat(self.path.with_name(self.path.name + '-wal'))
+
+    def iter_rows(self) -> Iterator[Tuple[int, Row]]:
+        cursor = self.connection.execute(
+            'SELECT id, title, artist, file_path, date_downloaded, source FROM songs ORDER BY id'
+        )
+        for record in cursor:
+            yield record[0], record[1:]
+
+    def add(self, row: Row) -> Optional[int]:
+        with self.connection as conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO songs (title, artist, file_path, date_downloaded, source) '
+                'VALUES (?, ?, ?, ?, ?)',
+                row,
+            )
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def add_many(self, rows: Iterable[Row]) -> int:
+        """Insert rows in one transaction, skipping duplicates. Returns the number inserted."""
+        count_sql = 'SELECT COUNT(*) FROM songs'
+        with self.connection as conn:
+            (before,) = conn.execute(count_sql).fetchone()
+            conn.executemany(
+                'INSERT OR IGNORE INTO songs (title, artist, file_path, date_downloaded, source) '
+                'VALUES (?, ?, ?, ?, ?)',
+                rows,
+            )
+            (after,) = conn.execute(count_sql).fetchone()
+        return after - before
+
+    def remove(self, ids: Iterable[int]) -> int:
+        with self.connection as conn:
+            cursor = conn.executemany('DELETE FROM songs WHERE id = ?', ((row_id,) for row_id in ids))
+        return cursor.rowcount
+
+    def set_paths(self, paths: Dict[int, str]) -> int:
+        with self.connection as conn:
+            cursor = conn.executemany(
+                'UPDATE songs SET file_path = ? WHERE id = ?',
+                ((path, row_id) for row_id, path in paths.items()),
+            )
+        return cursor.rowcount
+
+    def candidates(self, query: str, limit: int) -> Optional[List[int]]:
+        tokens = [t for t in re.findall(r'\w+', query.lower()) if len(t) > 1]
+        if not tokens:
+            return []
+        # Every token must match a word prefix. A typo therefore matches nothing,
+        # and SongDatabase falls back to scoring the whole library.
+        match = ' AND '.join(f'"{token}"*' for token in tokens)
+        cursor = self.connection.execute(
+            'SELECT rowid FROM songs_fts WHERE songs_fts MATCH ? ORDER BY rank LIMIT ?',
+            (match, limit),
+        )
+        return sorted(rowid for (rowid,) in cursor)
+
+
+def open_store(backend: str, path: Optional[Path] = None) -> SongStore:
+    if backend == 'csv':
+        return CsvSongStore(path or DATABASE_PATH)
+    if backend == 'sqlite':
+        return SqliteSongStore(path or SQLITE_DATABASE_PATH)
+    raise ValueError(f"Unknown database backend: {backend}")
+
+
+def migrate_csv_to_sqlite(csv_path: Path = DATABASE_PATH, sqlite_path: Path = SQLITE_DATABASE_PATH) -> Tuple[int, int]:
+    """Copy every row of a songs.csv into a SQLite store.
+
+    Returns (inserted, skipped); rows already present are skipped, so running
+    the migration twice is harmless.
+    """
+    source = CsvSongStore(csv_path)
+    target = SqliteSongStore(sqlite_path)
+    target.ensure_exists()
+    total = 0
+
+    def rows():
+        nonlocal total
+        for _, row in source.iter_rows():
+            total += 1
+            yield row
+
+    inserted = target.add_many(rows())
+    return inserted, total - inserted
+
+
+def main(args):
+    """Migrate songs.csv into the SQLite backend: storage.py migrate [CSV] [DB]"""
+    if len(args) < 2 or args[1] != 'migrate':
+        print(f"Usage: {args[0]} migrate [CSV_PATH] [SQLITE_PATH]")
+        return 1
+    csv_path = Path(args[2]) if len(args) > 2 else DATABASE_PATH
+    sqlite_path = Path(args[3]) if len(args) > 3 else SQLITE_DATABASE_PATH
+    inserted, skipped = migrate_csv_to_sqlite(csv_path, sqlite_path)
+    print(f"Migrated {inserted} songs from {csv_path} to {sqlite_path} ({skipped} duplicates skipped)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
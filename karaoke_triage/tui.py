@@ -1,108 +1,390 @@
 from textual.app import App, ComposeResult
-from textual.containers import Container, Vertical, ScrollableContainer
-from textual.widgets import Header, Footer, Input, RichLog, Button, Static, ProgressBar, Label
+from textual.containers import Container, Vertical
+from textual.widgets import Header, Footer, Input, RichLog, Static
 from textual.binding import Binding
+from textual.geometry import Size
 from textual.message import Message
 from textual.scroll_view import ScrollView
-from textual.screen import ModalScreen
-from textual import work
+from textual.strip import Strip
+from textual import events, work
 from functools import partial
+from rich.markup import escape
+from rich.segment import Segment
+
+from .config import (
+    FUZZY_MATCH_THRESHOLD,
+    LIBRARY_SCAN_INTERVAL,
+    LIVE_SEARCH_DEBOUNCE_MS,
+    METRICS_EXPORT_INTERVAL,
+    METRICS_EXPORT_PATH,
+    METRICS_HTTP_PORT,
+)
+from .download_queue import DownloadJob, JobState, PRIORITY_NEXT_UP, PRIORITY_NORMAL
+from .metrics import metrics
+from .models import KaraokeVersion
+from .progress import format_bytes
+from .service import ServiceError, TriageService
+import asyncio
+import time
+
+class VersionList(ScrollView, can_focus=True):
+    """Line-API list of versions grouped by song; only visible rows are rendered.
+
+    Versions can be appended while the list is on screen. The provider and
+    text filters are applied as versions arrive, and narrowing the text
+    filter only re-checks the rows that passed the previous one.
+    """
 
-from .database import SongDatabase
-from .karaokenerds import KaraokeNerdsScraper
-from .downloader import download_youtube_video
-from .logger import ActivityLogger
-from .models import Song, SongStatus, SearchResult, KaraokeVersion
-from datetime import datetime
-import os
-import pathlib
-
-class VersionSelector(ScrollableContainer):
-    """A scrollable widget to display and select from multiple karaoke versions."""
-    
     class VersionSelected(Message):
         """Message sent when a version is selected."""
-        def __init__(self, version: KaraokeVersion) -> None:
+        def __init__(self, version: KaraokeVersion, priority: int = PRIORITY_NORMAL) -> None:
             self.version = version
+            self.priority = priority
             super().__init__()
 
     BINDINGS = [
-        Binding("j", "scroll_down", "Scroll Down", show=False),
-        Binding("k", "scroll_up", "Scroll Up", show=False),
-        Binding("g", "scroll_home", "Scroll to Top", show=False),
-        Binding("G", "scroll_end", "Scroll to Bottom", show=False),
+        Binding("j,down", "cursor_down", "Down", show=False),
+        Binding("k,up", "cursor_up", "Up", show=False),
+        Binding("g,home", "cursor_home", "Top", show=False),
+        Binding("G,end", "cursor_end", "Bottom", show=False),
+        Binding("pagedown", "page_down", "Page Down", show=False),
+        Binding("pageup", "page_up", "Page Up", show=False),
+        Binding("enter", "select", "Download", show=False),
+        Binding("n", "select_next_up", "Download Next Up"),
+        Binding("p", "cycle_provider", "Provider"),
     ]
 
-    def __init__(self, versions: list[KaraokeVersion]) -> None:
+    class Changed(Message):
+        """Versions were added or the filters changed."""
+
+    COMPONENT_CLASSES = {"version-list--group", "version-list--cursor"}
+
+    DEFAULT_CSS = """
+    VersionList {
+        height: 1fr;
+    }
+    VersionList > .version-list--group {
+        text-style: bold;
+    }
+    VersionList > .version-list--cursor {
+        background: $accent;
+        color: $text;
+    }
+    """
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.versions: list[KaraokeVersion] = []
+        self.text_filter = ""
+        self.provider_filter: str | None = None
+        self.cursor: int | None = None  # index into self.versions
+        self._haystacks: list[str] = []
+        self._providers: set[str] = set()
+        self._groups: dict[tuple[str, str], list[int]] = {}  # song -> matching version indexes
+        self._rows: list[tuple[str, object]] = []  # ("group", song) or ("version", index)
+        self._row_of: dict[int, int] = {}  # version index -> row
+        self._shown = 0
+        self._width = 0
+        self._dirty = False
+        self._notify_pending = False
+
+    # -- data ----------------------------------------------------------------
+
+    @property
+    def shown(self) -> int:
+        """Number of versions passing the filters."""
+        return self._shown
+
+    @property
+    def providers(self) -> list[str]:
+        return sorted(self._providers)
+
+    def add_versions(self, versions: list[KaraokeVersion]) -> None:
+        for version in versions:
+            index = len(self.versions)
+            self.versions.append(version)
+            self._haystacks.append(f"{version.title} {version.artist} {version.provider}".lower())
+            self._providers.add(version.provider)
+            if self._matches(index):
+                self._add_row(index)
+        self._changed()
+
+    def _add_row(self, index: int) -> None:
+        version = self.versions[index]
+        song = (version.title, version.artist)
+        indexes = self._groups.get(song)
+        if indexes is None:
+            indexes = self._groups[song] = []
+            self._width = max(self._width, len(version.title) + len(version.artist) + 12)
+        indexes.append(index)
+        self._shown += 1
+
+    def set_text_filter(self, text: str) -> None:
+        """Show only versions whose title, artist or provider contain every word of `text`."""
+        old_text, self.text_filter = self.text_filter, text.strip().lower()
+        self._refilter(narrowing=self.text_filter.startswith(old_text))
+
+    def set_provider_filter(self, provider: str | None) -> None:
+        """Show only versions by `provider` (None for all)."""
+        self.provider_filter = provider
+        self._refilter(narrowing=False)
+
+    def _refilter(self, narrowing: bool) -> None:
+        if narrowing:
+            # Every row that matches now matched before.
+            candidates = (index for indexes in self._groups.values() for index in indexes)
+        else:
+            candidates = range(len(self.versions))
+        matching = [index for index in candidates if self._matches(index)]
+        if narrowing:
+            # Keep songs in the order they first arrived.
+            matching.sort()
+        self._groups = {}
+        self._shown = 0
+        for index in matching:
+            self._add_row(index)
+        self._changed()
+
+    def _matches(self, index: int) -> bool:
+        if self.provider_filter is not None and self.versions[index].provider != self.provider_filter:
+            return False
+        haystack = self._haystacks[index]
+        return all(word in haystack for word in self.text_filter.split())
+
+    def _changed(self) -> None:
+        # Rows are laid out when next drawn, so a burst of streamed versions
+        # costs one layout and one Changed message, not one per version.
+        self._dirty = True
+        self.virtual_size = Size(self._width, len(self._groups) + self._shown)
+        self.refresh()
+        if self.is_mounted and not self._notify_pending:
+            self._notify_pending = True
+            self.call_after_refresh(self._notify)
+
+    def _notify(self) -> None:
+        self._notify_pending = False
+        self.post_message(self.Changed())
+
+    def _layout_rows(self) -> None:
+        if not self._dirty:
+            return
+        self._dirty = False
+        rows: list[tuple[str, object]] = []
+        row_of: dict[int, int] = {}
+        for song, indexes in self._groups.items():
+            rows.append(("group", song))
+            for index in indexes:
+                row_of[index] = len(rows)
+                rows.append(("version", index))
+        self._rows = rows
+        self._row_of = row_of
+        if self.cursor not in row_of:
+            self.cursor = rows[1][1] if rows else None
+
+    # -- rendering -------------------------------------------------------------
+
+    def render_line(self, y: int) -> Strip:
+        self._layout_rows()
+        scroll_x, scroll_y = self.scroll_offset
+        row = scroll_y + y
+        if row >= len(self._rows):
+            return Strip.blank(self.size.width, self.rich_style)
+        kind, value = self._rows[row]
+        if kind == "group":
+            title, artist = value
+            count = len(self._groups[value])
+            text = f"{title} - {artist}  ({count})"
+            style = self.get_component_rich_style("version-list--group")
+        else:
+            version = self.versions[value]
+            text = f"    {version.provider}"
+            style = self.get_component_rich_style("version-list--cursor") if value == self.cursor else self.rich_style
+        strip = Strip([Segment(text.ljust(self.size.width + scroll_x), style)])
+        return strip.crop(scroll_x, scroll_x + self.size.width)
+
+    # -- navigation ------------------------------------------------------------
+
+    def _move(self, rows: int) -> None:
+        """Move the cursor by `rows` versions (negative moves up)."""
+        self._layout_rows()
+        if self.cursor is None:
+            return
+        order = list(self._row_of)
+        position = order.index(self.cursor) + rows
+        self.cursor = order[max(0, min(len(order) - 1, position))]
+        row = self._row_of[self.cursor]
+        # Keep the song header in view when moving onto its first version.
+        top = row - 1 if self._rows[row - 1][0] == "group" else row
+        if top < self.scroll_offset.y:
+            self.scroll_to(y=top, animate=False)
+        elif row >= self.scroll_offset.y + self.size.height:
+            self.scroll_to(y=row - self.size.height + 1, animate=False)
+        self.refresh()
+
+    def action_cursor_down(self) -> None:
+        self._move(1)
+
+    def action_cursor_up(self) -> None:
+        self._move(-1)
+
+    def action_cursor_home(self) -> None:
+        self._move(-len(self.versions))
+
+    def action_cursor_end(self) -> None:
+        self._move(len(self.versions))
+
+    def action_page_down(self) -> None:
+        self._move(max(1, self.size.height - 1))
+
+    def action_page_up(self) -> None:
+        self._move(-max(1, self.size.height - 1))
+
+    def action_select(self) -> None:
+        if self.cursor is not None:
+            self.post_message(self.VersionSelected(self.versions[self.cursor]))
+
+    def action_select_next_up(self) -> None:
+        """Queue the highlighted version ahead of everything else."""
+        if self.cursor is not None:
+            self.post_message(self.VersionSelected(self.versions[self.cursor], PRIORITY_NEXT_UP))
+
+    def action_cycle_provider(self) -> None:
+        choices = [None, *self.providers]
+        self.set_provider_filter(choices[(choices.index(self.provider_filter) + 1) % len(choices)])
+
+    def on_click(self, event: events.Click) -> None:
+        self._layout_rows()
+        row = self.scroll_offset.y + event.y
+        if row < len(self._rows) and self._rows[row][0] == "version":
+            self.cursor = self._rows[row][1]
+            self.refresh()
+            if event.chain > 1:
+                self.action_select()
+
+
+class VersionSelector(Vertical):
+    """Filter box, status line and version list for one online search.
+
+    Versions can be added while the search is still running; `finish()`
+    marks the list complete.
+    """
+
+    BINDINGS = [
+        Binding("slash", "filter", "Filter"),
+        Binding("escape", "clear_filter", "Clear Filter", show=False),
+    ]
+
+    def __init__(self, query: str, versions: list[KaraokeVersion] = ()) -> None:
         super().__init__()
-        self.versions = versions
-        self.current_focus = 0
+        self.search_query = query
+        self.loading = True
+        self.list = VersionList()
+        self.list.add_versions(list(versions))
 
     def compose(self) -> ComposeResult:
-        """Create buttons for each version."""
-        for i, version in enumerate(self.versions, 1):
-            yield Button(
-                f"{i}. {version.title} - {version.artist} ({version.provider})", 
-                id=f"version_{i-1}",
-                classes="version-button"
-            )
+        yield Input(placeholder="Filter by title, artist or provider (/)", id="version_filter")
+        yield Static("", id="version_status")
+        yield self.list
 
     def on_mount(self) -> None:
-        """Focus the first button when mounted."""
-        if self.versions:
-            first_button = self.query_one(f"#version_0")
-            first_button.focus()
-
-    def action_scroll_down(self) -> None:
-        """Handle j key: move focus down one item."""
-        if self.current_focus < len(self.versions) - 1:
-            self.current_focus += 1
-            self.query_one(f"#version_{self.current_focus}").focus()
-
-    def action_scroll_up(self) -> None:
-        """Handle k key: move focus up one item."""
-        if self.current_focus > 0:
-            self.current_focus -= 1
-            self.query_one(f"#version_{self.current_focus}").focus()
-
-    def action_scroll_home(self) -> None:
-        """Handle g key: scroll to top."""
-        self.current_focus = 0
-        self.query_one("#version_0").focus()
-        self.scroll_home(animate=False)
-
-    def action_scroll_end(self) -> None:
-        """Handle G key: scroll to bottom."""
-        self.current_focus = len(self.versions) - 1
-        self.query_one(f"#version_{self.current_focus}").focus()
-        self.scroll_end(animate=False)
-
-    def on_button_pressed(self, event: Button.Pressed) -> None:
-        version_idx = int(event.button.id.split('_')[1])
-        self.post_message(self.VersionSelected(self.versions[version_idx]))
-
-class DownloadProgress(ModalScreen):
-    """A modal screen showing download progress."""
-
-    def __init__(self, version: KaraokeVersion):
-        super().__init__()
-        self.version = version
-        self.progress = 0
+        self.list.focus()
+        # Versions and finish() may have arrived before the children mounted.
+        self.call_after_refresh(self.update_status)
 
-    def compose(self) -> ComposeResult:
-        yield Container(
-            Label(f"Downloading: {self.version.title} - {self.version.artist}"),
-            Label("", id="progress_text"),
-            ProgressBar(total=100, show_percentage=True, id="progress_bar"),
-            classes="download_modal"
-        )
+    def add_versions(self, versions: list[KaraokeVersion]) -> None:
+        self.list.add_versions(versions)
 
-    def update_progress(self, fragment_index: int, fragment_count: int) -> None:
-        """Update the progress bar and text."""
-        if fragment_count > 0:
-            percentage = min(100, int((fragment_index / fragment_count) * 100))
-            self.query_one("#progress_bar").update(progress=percentage)
-            self.query_one("#progress_text").update(f"Fragment {fragment_index} of {fragment_count}")
+    def finish(self) -> None:
+        self.loading = False
+        self.update_status()
+
+    def update_status(self) -> None:
+        if not self.is_mounted:
+            return
+        parts = [f"{self.list.shown} of {len(self.list.versions)} versions"]
+        if self.list.provider_filter is not None:
+            parts.append(f"provider {escape(self.list.provider_filter)} (p for next)")
+        elif len(self.list.providers) > 1:
+            parts.append("all providers (p to pick one)")
+        if self.loading:
+            parts.append("loading…")
+        self.query_one("#version_status", Static).update("[dim]" + " · ".join(parts) + "[/]")
+
+    def on_input_changed(self, event: Input.Changed) -> None:
+        if event.input.id == "version_filter":
+            event.stop()
+            self.list.set_text_filter(event.value)
+
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        if event.input.id == "version_filter":
+            event.stop()
+            self.list.focus()
+
+    def on_version_list_changed(self, message: VersionList.Changed) -> None:
+        message.stop()
+        self.update_status()
+
+    def action_filter(self) -> None:
+        self.query_one("#version_filter", Input).focus()
+
+    def action_clear_filter(self) -> None:
+        self.query_one("#version_filter", Input).value = ""
+        self.list.focus()
+
+class DownloadQueue(Static):
+    """Non-modal list of this session's downloads."""
+
+    def show_jobs(self, jobs: list[DownloadJob]) -> None:
+        lines = []
+        for job in jobs:
+            name = f"{escape(job.title)} - {escape(job.artist)}"
+            if job.state is JobState.RUNNING:
+                progress = job.progress.describe() if job.progress is not None else ""
+                line = f"[cyan]↓ {progress or '...'}[/] {name}"
+            elif job.state is JobState.PENDING:
+                retry = f" [dim](retry {job.attempts})[/]" if job.attempts else ""
+                line = f"[dim]⋯ queued[/] {name}{retry}"
+            elif job.state is JobState.DONE:
+                line = f"[green]✓ done[/] {name}"
+            elif job.state is JobState.FAILED:
+                line = f"[red]× failed[/] {name} [dim]({escape(job.error or '')})[/]"
+            else:
+                line = f"[dim]- cancelled {name}[/]"
+            if job.priority == PRIORITY_NEXT_UP and job.active:
+                line += " [bold yellow]next up[/]"
+            lines.append(line)
+        self.update("\n".join(lines) if lines else "[dim]No downloads[/]")
+        self.display = bool(lines)
+
+class StatsPanel(Static):
+    """Live stage timings and rates from the metrics registry."""
+
+    def show_snapshot(self, snapshot: dict) -> None:
+        if not metrics.enabled:
+            self.update("[dim]Metrics are off (METRICS_ENABLED in config.py)[/]")
+            return
+        lines = [f"[b]{'stage':<16}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}[/]"]
+        for name, span in snapshot['spans'].items():
+            lines.append(
+                f"{name:<16}{span['count']:>7}"
+                + "".join(f"{span[q] * 1000:>8.1f}ms" for q in ('p50', 'p95', 'p99'))
+            )
+        counters = snapshot['counters']
+        gauges = snapshot['gauges']
+        summary = []
+        if 'scrape_cache_hit_rate' in gauges:
+            summary.append(f"cache hit rate {gauges['scrape_cache_hit_rate'] * 100:.0f}%")
+        queries = {key[len('queries_'):-len('_total')]: value
+                   for key, value in counters.items() if key.startswith('queries_')}
+        if queries:
+            summary.append("queries " + " ".join(f"{kind} {value:.0f}" for kind, value in queries.items()))
+        download = snapshot['spans'].get('download')
+        if download and download['sum']:
+            summary.append(f"downloads {format_bytes(counters.get('download_bytes_total', 0) / download['sum'])}/s")
+        if 'prefetch_resolved' in gauges:
+            summary.append(f"prefetch hits {gauges['prefetch_local_hits']:.0f} local {gauges['prefetch_warm_hits']:.0f} warm")
+        lines.append("  ·  ".join(summary))
+        self.update("\n".join(lines))
 
 class KaraokeTriageApp(App):
     CSS = """
@@ -122,6 +404,12 @@ class KaraokeTriageApp(App):
         width: 100%;
     }
     
+    #live {
+        height: auto;
+        max-height: 6;
+        color: $text-muted;
+    }
+
     RichLog {
         height: 60%;
         border: solid blue;
@@ -133,113 +421,189 @@ class KaraokeTriageApp(App):
         height: 40%;
         background: $panel;
         border: solid $primary;
-        overflow-y: scroll;
         padding: 0;
     }
 
-    Button {
-        width: 100%;
-        margin: 0;
-        padding: 0;
+    #version_filter {
         border: none;
         height: 1;
     }
 
-    Button:focus {
-        background: $accent;
-        color: $text;
-    }
-
-    .version-button {
-        text-align: left;
-    }
-
-    .download_modal {
-        background: $surface;
-        border: solid $primary;
-        padding: 1;
-        margin: 1;
-        width: 80%;
-        min-height: 10;
+    StatsPanel {
         height: auto;
-        align: center middle;
-    }
-
-    DownloadProgress {
-        align: center middle;
-        width: 100%;
+        border: solid $accent;
+        display: none;
     }
 
-    DownloadProgress Label {
-        content-align: center middle;
-        width: 100%;
-        margin-bottom: 1;
-    }
-
-    DownloadProgress ProgressBar {
-        width: 100%;
-        margin: 1 2;
+    DownloadQueue {
+        height: auto;
+        max-height: 8;
+        border: solid $secondary;
+        overflow-y: auto;
     }
     """
     
     BINDINGS = [
         Binding("ctrl+q", "quit", "Quit"),
         Binding("ctrl+c", "quit", "Quit"),
+        Binding("ctrl+o", "search_online", "Search Online"),
+        Binding("ctrl+t", "toggle_stats", "Stats"),
+        Binding("ctrl+r", "profile", "Profile"),
     ]
     
-    def __init__(self):
+    def __init__(self, backend=None):
         super().__init__()
-        self.database = SongDatabase()
-        self.scraper = KaraokeNerdsScraper()
-        self.logger = ActivityLogger()
-        self.download_progress = None
-
-    @work(thread=True)
-    def download_version(self, version: KaraokeVersion) -> bool:
-        """Download the version in a separate thread."""
-        p = pathlib.Path(os.path.expanduser('~/x3.txt'))
-        def progress_callback(progress_data: dict) -> None:
-            """Callback for download progress updates."""
-            if self.download_progress and 'downloaded_bytes' in progress_data and 'total_bytes' in progress_data:
-                with open(p, 'a') as f:
-                    f.write('1\n')
-                self.call_from_thread(
-                    self.download_progress.update_progress,
-                    progress_data['downloaded_bytes'],
-                    progress_data['total_bytes']
-                )
-            else:
-                with open(p, 'a') as f:
-                    f.write('2\n')
-
-        with open(p, 'a') as f:
-            f.write('pre-download_youtube_video\n')
-        success = download_youtube_video(version.youtube_link, progress_callback=progress_callback)
-        with open(p, 'a') as f:
-            f.write('post-download_youtube_video\n')
-
-        with open(p, 'a') as f:
-            f.write('about to close modal\n')
-        # Close the modal after download completes
-        if self.download_progress:
-            with open(p, 'a') as f:
-                f.write('closing the shit window\n')
-            self.call_from_thread(self.pop_screen)
-            self.download_progress = None
+        # A TriageService in this process, or a ServiceClient for the shared daemon.
+        self.backend = backend if backend is not None else TriageService()
+        self.live_timer = None
+        self.pending_online_query = None
+        self.version_selector = None
+        self.version_stream = None  # token of the search whose versions are wanted
+        self.version_selector_stream = None  # token of the search version_selector shows
+
+    def on_mount(self) -> None:
+        resumed = self.backend.pending_count()
+        self.backend.add_listener(self.download_updated)
+        self.backend.start()
+        self.refresh_downloads()
+        self.set_interval(1.0, self.refresh_stats)
+        if METRICS_HTTP_PORT:
+            metrics.serve(METRICS_HTTP_PORT)
+        if METRICS_EXPORT_PATH:
+            self.set_interval(METRICS_EXPORT_INTERVAL, lambda: metrics.write(METRICS_EXPORT_PATH))
+        if isinstance(self.backend, TriageService):
+            if resumed:
+                self.query_one(RichLog).write(f"Resuming {resumed} queued download(s)")
+            # Index loading and slow imports wait until the first frame is drawn.
+            self.call_after_refresh(self.warm_up)
+        else:
+            # The service loads the library and scans it itself.
+            self.query_one(RichLog).write(f"[dim]Connected to the {self.backend.describe()}[/]")
+
+    @work(thread=True, exclusive=True, group="warmup")
+    def warm_up(self) -> None:
+        elapsed = self.backend.warm_up()
+        self.call_from_thread(self.query_one(RichLog).write, f"[dim]Library loaded in {elapsed:.1f}s[/]")
+        if LIBRARY_SCAN_INTERVAL:
+            self.call_from_thread(self.start_library_scans)
+        self.call_from_thread(self.run_prefetcher)
+
+    @work(exclusive=True, group="prefetch")
+    async def run_prefetcher(self) -> None:
+        """Prefetch popular missing songs whenever nobody is searching."""
+        await self.backend.run_prefetcher()
+
+    def start_library_scans(self) -> None:
+        self.scan_library()
+        self.set_interval(LIBRARY_SCAN_INTERVAL, self.scan_library)
+
+    @work(thread=True, exclusive=True, group="library")
+    def scan_library(self) -> None:
+        """Pick up files added, renamed or deleted outside the app."""
+        report = self.backend.scan_library()
+        if report.changed:
+            self.call_from_thread(self.query_one(RichLog).write, f"[dim]{report.describe()}[/]")
+
+    async def on_unmount(self) -> None:
+        metrics.stop_serving()
+        await self.backend.aclose()
+
+    def download_updated(self, job: DownloadJob) -> None:
+        """Called by the backend from a download or event thread."""
+        self.call_from_thread(self.on_download_update, job)
+
+    def on_download_update(self, job: DownloadJob) -> None:
+        log = self.query_one(RichLog)
+        if job.state is JobState.DONE:
+            log.write(f"[green]✓ Download complete: {job.title} - {job.artist}[/]")
+        elif job.state is JobState.FAILED:
+            log.write(f"[red]× Download failed: {job.title} - {job.artist}[/]")
+        self.refresh_downloads()
+
+    def action_toggle_stats(self) -> None:
+        panel = self.query_one(StatsPanel)
+        panel.display = not panel.display
+        self.refresh_stats()
+
+    def action_profile(self) -> None:
+        self.toggle_profile()
+
+    @work(thread=True, exclusive=True, group="profile")
+    def toggle_profile(self) -> None:
+        """Profile the next few queries and downloads; pressed again, stop early."""
+        log = self.query_one(RichLog)
+        try:
+            capture = self.backend.profile()
+        except ServiceError as e:
+            self.call_from_thread(log.write, f"[red]× Could not profile: {e}[/]")
+            return
+        if capture.armed:
+            message = (f"[dim]Profiling the next {capture.operations} queries and downloads "
+                       f"({capture.mode}); Ctrl+R again to stop early[/]")
         else:
-            with open(p, 'a') as f:
-                f.write('who gives a flying fuck\n')
+            message = f"[dim]Profile of {capture.completed} operations stopped[/]"
+        self.call_from_thread(log.write, message)
+        self.call_from_thread(log.write, f"[dim]Writing to {capture.directory}[/]")
 
-        return success
+    def refresh_stats(self) -> None:
+        if self.query_one(StatsPanel).display:
+            self.fetch_stats()
+
+    @work(thread=True, exclusive=True, group="stats")
+    def fetch_stats(self) -> None:
+        try:
+            snapshot = self.backend.stats()
+        except ServiceError:
+            return
+        self.call_from_thread(self.query_one(StatsPanel).show_snapshot, snapshot)
+
+    @work(thread=True, exclusive=True, group="downloads")
+    def refresh_downloads(self) -> None:
+        try:
+            jobs = self.backend.jobs()
+        except ServiceError as e:
+            self.call_from_thread(self.query_one(RichLog).write, f"[red]× {e}[/]")
+            return
+        self.call_from_thread(self.query_one(DownloadQueue).show_jobs, jobs)
 
     def compose(self) -> ComposeResult:
         yield Header()
         with Container(id="main"):
             with Vertical():
                 yield Input(placeholder="Enter song title or Artist+Title...", id="search")
+                yield Static("", id="live")
                 yield RichLog(id="log", wrap=True)
+                yield DownloadQueue()
+                yield StatsPanel()
         yield Footer()
     
+    def on_input_changed(self, event: Input.Changed) -> None:
+        """Debounce keystrokes into live local matching."""
+        if event.input.id != "search":
+            return
+        if self.live_timer is not None:
+            self.live_timer.stop()
+        self.live_timer = self.set_timer(
+            LIVE_SEARCH_DEBOUNCE_MS / 1000,
+            partial(self.live_search, event.value),
+        )
+
+    @work(exclusive=True, group="live")
+    async def live_search(self, query: str) -> None:
+        """Show the best local matches for what has been typed so far."""
+        try:
+            results = await asyncio.to_thread(self.backend.live, query)
+        except ServiceError:
+            return
+        lines = []
+        for result in results:
+            style = "green" if result.confidence >= FUZZY_MATCH_THRESHOLD else "dim"
+            lines.append(
+                f"[{style}]{result.confidence:3.0f}%  "
+                f"{escape(result.song.title)} - {escape(result.song.artist)}[/]"
+            )
+        self.query_one("#live", Static).update("\n".join(lines))
+
     def on_input_submitted(self, event: Input.Submitted) -> None:
         query = event.value.strip()
         if not query:
@@ -247,72 +611,122 @@ class KaraokeTriageApp(App):
         
         self.process_query(query)
     
-    def process_query(self, query: str) -> None:
+    @work(exclusive=True, group="query")
+    async def process_query(self, query: str) -> None:
+        """Run the lookup pipeline; submitting another query cancels this one."""
         log = self.query_one(RichLog)
         log.write(f"Searching for: {query}")
         
-        # Check local database
-        local_match = self.database.search(query)
-        if local_match:
+        self.pending_online_query = None
+        try:
+            outcome = await self.backend.resolve(query, on_version=self.stream_versions(query))
+        except ServiceError as e:
+            log.write(f"[red]× {e}[/]")
+            return
+        log.write(f"[dim]{outcome.describe_timings()}[/]")
+
+        if outcome.local_match:
             log.write("[green]✓ Found locally![/]")
-            self.logger.log_activity(local_match, SongStatus.LOCAL)
             return
-        
+
+        # Offer close local matches before paying for a web search
+        if outcome.versions is None and outcome.near_misses:
+            log.write("[yellow]No exact local match. Closest local songs:[/]")
+            for i, result in enumerate(outcome.near_misses, 1):
+                log.write(f"  {i}. {result.song.title} - {result.song.artist} ({result.confidence:.0f}%)")
+            log.write("Press Ctrl+O to search KaraokeNerds instead.")
+            self.pending_online_query = query
+            return
+
+        self.show_versions(query, outcome.versions or [])
+
+    def action_search_online(self) -> None:
+        """Search KaraokeNerds for the last query that only had local near misses."""
+        if self.pending_online_query:
+            query = self.pending_online_query
+            self.pending_online_query = None
+            self.search_online(query)
+
+    @work(exclusive=True, group="query")
+    async def search_online(self, query: str) -> None:
+        log = self.query_one(RichLog)
+
         # Search KaraokeNerds
         log.write("Searching KaraokeNerds...")
-        versions = self.scraper.search(query)
-        
+        start = time.perf_counter()
+        try:
+            versions = await self.backend.search_online(query, self.stream_versions(query))
+        except ServiceError as e:
+            log.write(f"[red]× {e}[/]")
+            return
+        log.write(f"[dim]online {(time.perf_counter() - start) * 1000:.0f} ms[/]")
+        self.show_versions(query, versions)
+
+    def stream_versions(self, query: str):
+        """Callback that shows the versions for `query` as they are parsed.
+
+        The picker is mounted with the first version, replacing the previous
+        one. A callback from a search that has since been superseded does
+        nothing.
+        """
+        token = object()
+        self.version_stream = token
+        if self.version_selector is not None:
+            self.version_selector.finish()
+
+        def add(version: KaraokeVersion) -> None:
+            if self.version_stream is not token:
+                return
+            if self.version_selector_stream is not token:
+                self.open_version_selector(query)
+            if self.version_selector is not None:
+                self.version_selector.add_versions([version])
+
+        return add
+
+    def open_version_selector(self, query: str, versions: list[KaraokeVersion] = ()) -> None:
+        # Remove any existing version selector
+        for selector in self.query(VersionSelector):
+            selector.remove()
+        self.query_one(RichLog).write("Select a version to download (j/k to navigate, / to filter, Enter to select):")
+        self.version_selector = VersionSelector(query, versions)
+        self.version_selector_stream = self.version_stream
+        self.query_one("#main").mount(self.version_selector)
+
+    def show_versions(self, query: str, versions: list[KaraokeVersion]) -> None:
+        log = self.query_one(RichLog)
         if versions:
             log.write(f"[green]✓ Found {len(versions)} versions online![/]")
-            log.write("Select a version to download (j/k to navigate, Enter to select):")
-            
-            # Remove any existing version selector
-            if self.query("VersionSelector"):
-                self.query_one(VersionSelector).remove()
-            
-            # Add the version selector below the log
-            selector = VersionSelector(versions)
-            self.query_one("#main").mount(selector)
+            if self.version_selector_stream is not self.version_stream:
+                self.open_version_selector(query, versions)
+            if self.version_selector is not None:
+                self.version_selector.finish()
         else:
             log.write("[red]× No versions found online[/]")
-            song = Song(title=query, artist="")
-            self.logger.log_activity(song, SongStatus.UNAVAILABLE)
     
-    def on_version_selector_version_selected(self, message: VersionSelector.VersionSelected) -> None:
-        """Handle version selection."""
-        path = pathlib.Path(os.path.expanduser('~/x317.txt'))
-        log = self.query_one(RichLog)
-        version = message.version
-        
-        log.write(f"Downloading: {version.title} - {version.artist} ({version.provider})")
-        with open(path, 'a') as f:
-            f.write(f'on_version_selector_version_selected downloading! link={version.youtube_link}\n')
+    def on_version_list_version_selected(self, message: VersionList.VersionSelected) -> None:
+        """Queue the selected version and go back to the search box."""
+        self.query_one(VersionSelector).remove()
+        self.version_selector = None
+        # Versions still streaming in for this search are no longer wanted.
+        self.version_stream = None
+        self.version_selector_stream = None
+        self.query_one("#search", Input).focus()
+        self.submit_download(message.version, message.priority)
 
-        # Show download progress modal
-        self.download_progress = DownloadProgress(version)
-        self.push_screen(self.download_progress)
-        
-        # Start download in background
-        def download_complete(worker) -> None:
-            success = worker.result
-            
-            if success:
-                song = Song(
-                    title=version.title,
-                    artist=version.artist,
-                    file_path=str(version.youtube_link),
-                    date_downloaded=datetime.now(),
-                    source=version.provider
-                )
-                self.database.add_song(song)
-                self.logger.log_activity(song, SongStatus.DOWNLOADED)
-                log.write("[green]✓ Download complete![/]")
-            else:
-                log.write("[red]× Download failed![/]")
-            
-            # Just remove the version selector since modal is already closed
-            self.query_one(VersionSelector).remove()
-            self.download_progress = None
-        
-        worker = self.download_version(version)
-        worker.callback = download_complete
+    @work(thread=True, group="submit")
+    def submit_download(self, version: KaraokeVersion, priority: int) -> None:
+        log = self.query_one(RichLog)
+        try:
+            job, created = self.backend.submit(version, priority)
+        except ServiceError as e:
+            self.call_from_thread(log.write, f"[red]× Could not queue {version.title}: {e}[/]")
+            return
+        if job.state is JobState.DONE:
+            message = f"[green]✓ Already downloaded: {version.title} - {version.artist}[/]"
+        elif created:
+            message = f"Queued: {version.title} - {version.artist} ({version.provider})"
+        else:
+            message = f"Already queued: {version.title} - {version.artist}"
+        self.call_from_thread(log.write, message)
+        self.call_from_thread(self.refresh_downloads)
@@ -0,0 +1,38 @@
+"""Pay for the slow first-use costs in the background after startup.
+
+The TUI imports only what it needs to draw its first frame. Everything else
+is loaded lazily on first use: the song index, the HTML parser and the
+modules behind it, httpx and yt-dlp. `warm_up` touches each of these so
+the first search, scrape and download do not have to. Every step is
+idempotent and also happens on its own on first use, so a warm-up that is
+still running, or never ran, only costs time.
+"""
+import importlib
+import logging
+import time
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Imported by the scraper and downloader on first use.
+MODULES = ('httpx', 'yt_dlp')
+
+
+def warm_up(database, scraper=None) -> float:
+    """Load the index, the scraper's parser and MODULES; returns the seconds taken."""
+    start = time.perf_counter()
+    with metrics.span('warmup_db'):
+        database.load()
+    if scraper is not None:
+        with metrics.span('warmup_parser'):
+            scraper.parser
+    for name in MODULES:
+        with metrics.span('warmup_import'):
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                logger.warning("Could not import %s during warm-up", name)
+    elapsed = time.perf_counter() - start
+    logger.info("Warm-up finished in %.2fs", elapsed)
+    return elapsed